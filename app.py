@@ -1,6 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
-from database import init_db, migrate_db, migrate_db_v2, migrate_db_v3, get_db
-import json, os, uuid, io
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, session, \
+    stream_template, get_flashed_messages
+from database import migrate_workspaces, get_db, current_workspace, set_workspace, get_workspace, create_workspace, \
+    workspace_summaries, DEFAULT_WORKSPACE, \
+    record_job_status, move_job_output_type, fold_job_into_project, duration_bin_upper, \
+    attach_archive, archive_jobs, restore_job, archive_stats, \
+    sync_instance_id, get_changes, apply_changes, backup_database, list_backups, restore_backup, verify_backup, \
+    start_backup_scheduler, claim_prompts, renew_claims, release_claims, plan_jobs, coverage_summary, rebuild_coverage, \
+    table_versions, refresh_top_layer_meta, start_media_scan, media_integrity_counts, media_integrity_problems, \
+    accept_media_changes, refresh_prompt_index, similar_prompts, prompt_duplicate_groups, delete_rows, \
+    sweep_orphans, batch_jobs, export_database, analytics_db, start_analytics_refresh, start_analytics_scheduler
+import database
+import build_assets
+import gzip, json, os, uuid, io, sqlite3, threading
+import urllib.request
+from collections import OrderedDict
 from datetime import datetime
 from werkzeug.utils import secure_filename
 import base64, re
@@ -12,10 +25,107 @@ IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'static', 'images')
 os.makedirs(IMAGES_DIR, exist_ok=True)
 
 with app.app_context():
-    init_db()
-    migrate_db()
-    migrate_db_v2()
-    migrate_db_v3()
+    migrate_workspaces()
+
+ASSET_FILES = build_assets.build()
+
+
+# ─── Static bundle ────────────────────────────────────────────────────────────
+# Bundled CSS/JS from build_assets.py. File names carry a content hash, so a
+# browser may keep them forever; pages always link the current names.
+
+ASSET_MAX_AGE = 365 * 24 * 3600
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+@app.template_global()
+def asset_url(name):
+    return url_for('asset', filename=ASSET_FILES[name])
+
+@app.route('/assets/<filename>')
+def asset(filename):
+    if filename not in ASSET_FILES.values():
+        return 'Not found', 404
+    path = os.path.join(build_assets.DIST_DIR, filename)
+    mimetype = 'text/css' if filename.endswith('.css') else 'text/javascript'
+    encoding = None
+    for enc, suffix in ASSET_ENCODINGS:
+        if request.accept_encodings[enc] and os.path.exists(path + suffix):
+            encoding, path = enc, path + suffix
+            break
+    response = send_file(path, mimetype=mimetype, etag=f"{filename}-{encoding or 'identity'}",
+                         conditional=True, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+# ─── Workspaces ───────────────────────────────────────────────────────────────
+# Every workspace is its own database (see database.py). A request goes to the
+# workspace in its URL prefix, /w/<name>/..., which WorkspacePrefix moves into
+# SCRIPT_NAME so url_for() and redirects keep it; without one, to the
+# workspace this browser last opened (kept in the session), so the pages'
+# plain links stay in it; otherwise to the default workspace. Scripts and the
+# dock should always use the prefix.
+
+_WORKSPACE_PREFIX = re.compile(r'^/w/([^/]+)(/.*)?$')
+
+
+class WorkspacePrefix:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        m = _WORKSPACE_PREFIX.match(environ.get('PATH_INFO', ''))
+        if m:
+            environ['pipeline.workspace'] = m.group(1)
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/w/' + m.group(1)
+            environ['PATH_INFO'] = m.group(2) or '/'
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = WorkspacePrefix(app.wsgi_app)
+
+
+@app.before_request
+def select_workspace():
+    name = request.environ.get('pipeline.workspace')
+    if name is None:
+        ws = get_workspace(session.get('workspace', DEFAULT_WORKSPACE))
+        if ws is None:   # removed since this browser last used it
+            session.pop('workspace', None)
+            ws = get_workspace()
+    else:
+        ws = get_workspace(name)
+        if ws is None:
+            return 'Workspace not found', 404
+        if session.get('workspace', DEFAULT_WORKSPACE) != name:
+            session['workspace'] = name
+    ws.ensure_migrated()   # may have been created by another process
+    set_workspace(ws)
+
+@app.context_processor
+def workspace_context():
+    return {'workspace': current_workspace().name}
+
+@app.route('/workspaces')
+def workspaces():
+    return render_template('workspaces.html', summaries=workspace_summaries())
+
+@app.route('/workspaces/create', methods=['POST'])
+def workspace_create():
+    name = request.form.get('name', '').strip().lower()
+    try:
+        create_workspace(name)
+    except ValueError as e:
+        flash(str(e)); return redirect(url_for('workspaces'))
+    flash(f'Workspace "{name}" created.')
+    return redirect(f'/w/{name}/')
+
+@app.route('/api/workspaces')
+def api_workspaces():
+    """Headline counts for every workspace, read from all shards in parallel."""
+    return jsonify(workspace_summaries())
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
@@ -48,6 +158,94 @@ def combo_stats(db):
     }
 
 
+# ─── Fragment cache & streaming ───────────────────────────────────────────────
+# Expensive per-row pieces of the big listings (a job's ingredient chips, a
+# clip's linked jobs) and the dashboard funnel are cached in-process, tagged
+# with table_versions() of every table they read. A write from any worker
+# changes the version, so stale entries are rebuilt on their next read.
+
+class FragmentCache:
+    def __init__(self, max_entries=20000):
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+
+    def get(self, key, version, build):
+        key = (current_workspace().name, key)   # workspaces share ids, not rows
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit and hit[0] == version:
+                self.entries.move_to_end(key)
+                return hit[1]
+        value = build()
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+fragments = FragmentCache()
+CHIP_TABLES = ('render_job_ingredients', 'ingredients', 'ingredient_categories')
+LINKED_JOB_TABLES = ('top_layer_jobs', 'render_jobs', 'media_assets', 'characters', 'output_types')
+FUNNEL_TABLES = ('characters', 'ingredients', 'output_types', 'output_type_requirements', 'render_jobs', 'media_assets')
+
+def stream_page(db, template, **context):
+    """Stream a template while its row cursors are read; db is closed once the body is sent."""
+    get_flashed_messages()   # pop flashes now: the session cookie goes out before the body
+    chunks = stream_template(template, **context)
+
+    def buffered():
+        buf, size = [], 0
+        for chunk in chunks:
+            buf.append(chunk); size += len(chunk)
+            if size >= 8192:
+                yield ''.join(buf); buf, size = [], 0
+        yield ''.join(buf)
+
+    response = app.response_class(buffered(), mimetype='text/html')
+    response.call_on_close(db.close)
+    return response
+
+
+def sync_with_peer(db, url):
+    """Pull a peer's changes since our last pull, then push ours since our last push."""
+    url = url.rstrip('/')
+    my_id = sync_instance_id(db)
+    db.execute('INSERT OR IGNORE INTO sync_peers (url) VALUES (?)', [url]); db.commit()
+    peer = db.execute('SELECT * FROM sync_peers WHERE url=?', [url]).fetchone()
+    totals = {'pulled': 0, 'pushed': 0, 'conflicts': 0}
+
+    def call(path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(url + path, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=30) as r:
+            return json.loads(r.read())
+
+    since, peer_id = peer['last_pulled_seq'], peer['instance_id']
+    while True:
+        batch = call(f'/api/sync/changes?since={since}&exclude_origin={my_id}')
+        peer_id = batch['instance_id']
+        stats = apply_changes(db, peer_id, batch['changes'])
+        totals['pulled'] += stats['applied']; totals['conflicts'] += stats['conflicts']
+        since = batch['next_since']
+        db.execute('UPDATE sync_peers SET last_pulled_seq=?, instance_id=? WHERE url=?', [since, peer_id, url]); db.commit()
+        if not batch['more']:
+            break
+    pushed = peer['last_pushed_seq']
+    while True:
+        changes, next_since, more = get_changes(db, pushed, exclude_origin=peer_id)
+        if changes:
+            stats = call('/api/sync/apply', {'origin': my_id, 'changes': changes})
+            totals['pushed'] += stats['applied']; totals['conflicts'] += stats['conflicts']
+        pushed = next_since
+        db.execute('UPDATE sync_peers SET last_pushed_seq=? WHERE url=?', [pushed, url]); db.commit()
+        if not more:
+            break
+    db.execute('UPDATE sync_peers SET last_synced_at=CURRENT_TIMESTAMP WHERE url=?', [url]); db.commit()
+    return totals
+
+
 # ─── Dashboard ────────────────────────────────────────────────────────────────
 
 @app.route('/')
@@ -61,7 +259,7 @@ def index():
         'media_total':  db.execute('SELECT COUNT(*) FROM media_assets').fetchone()[0],
         'top_layer':    db.execute('SELECT COUNT(*) FROM top_layer_media').fetchone()[0],
     }
-    funnel = combo_stats(db)
+    funnel = fragments.get('funnel', table_versions(db, FUNNEL_TABLES), lambda: combo_stats(db))
     recent_media = db.execute('''
         SELECT ma.*, c.name as character_name, ot.name as output_type_name
         FROM media_assets ma LEFT JOIN characters c ON ma.character_id=c.id
@@ -113,60 +311,301 @@ def api_random_combo():
 @app.route('/api/job-data/<int:job_id>')
 def api_job_data(job_id):
     db = get_db()
-    job = db.execute('''SELECT rj.*, c.name as character_name, c.description as char_desc,
-        c.tags as char_tags, ot.name as output_type_name
-        FROM render_jobs rj LEFT JOIN characters c ON rj.character_id=c.id
-        LEFT JOIN output_types ot ON rj.output_type_id=ot.id WHERE rj.id=?''', [job_id]).fetchone()
-    if not job:
+    data = batch_jobs(db, [job_id]).get(job_id)
+    db.close()
+    if not data:
         return jsonify({'error': 'Not found'}), 404
-    ings = db.execute('''SELECT i.name, i.code, ic.name as category_name
-        FROM render_job_ingredients rji JOIN ingredients i ON rji.ingredient_id=i.id
-        JOIN ingredient_categories ic ON i.category_id=ic.id WHERE rji.job_id=? ORDER BY ic.name''', [job_id]).fetchall()
-    ing_list = [dict(i) for i in ings]
-    ing_names = ', '.join(i['name'] for i in ing_list)
-    auto_title = job['character_name'] or ''
-    if ing_names: auto_title += (' — ' + ing_names) if auto_title else ing_names
-    auto_tags = ''
-    if job['character_name']: auto_tags = job['character_name'].lower().replace(' ', ',')
-    if job['char_tags']: auto_tags += ',' + job['char_tags']
-    if ing_names: auto_tags += ',' + ','.join(i['name'].lower() for i in ing_list)
-    db.close()
-    return jsonify({'job': dict(job), 'ingredients': ing_list, 'auto_title': auto_title,
-                    'auto_tags': auto_tags, 'character_id': job['character_id'], 'output_type_id': job['output_type_id']})
+    job = {k: v for k, v in data.items() if k not in ('ingredients', 'auto_title', 'auto_tags')}
+    return jsonify({'job': job, 'ingredients': data['ingredients'], 'auto_title': data['auto_title'],
+                    'auto_tags': data['auto_tags'], 'character_id': job['character_id'], 'output_type_id': job['output_type_id']})
+
+@app.route('/api/jobs/lookup')
+def api_job_lookup():
+    """Typeahead search: '#12' / '12' matches job ids starting with 12, text matches
+    character or output type names by prefix. Every branch is an index range scan."""
+    q = request.args.get('q', '').strip().lstrip('#').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    select = '''SELECT rj.id, rj.status, c.name as character_name, ot.name as output_type_name FROM render_jobs rj
+        LEFT JOIN characters c ON rj.character_id=c.id LEFT JOIN output_types ot ON rj.output_type_id=ot.id'''
+    db = get_db()
+    if not q:
+        rows = db.execute(select + ' ORDER BY rj.id DESC LIMIT ?', [limit]).fetchall()
+    elif q.isascii() and q.isdigit():
+        # Ids with this prefix fall in ranges n, n0-n9, n00-n99, ... up to the largest id.
+        # No id is written with a leading zero, so '0' and '007' match nothing.
+        n, width, rows = int(q), 1, []
+        if q.startswith('0'):
+            db.close()
+            return jsonify([])
+        max_id = db.execute('SELECT MAX(id) FROM render_jobs').fetchone()[0] or 0
+        while n * width <= max_id and len(rows) < limit:
+            rows += db.execute(select + ' WHERE rj.id BETWEEN ? AND ? ORDER BY rj.id LIMIT ?',
+                               [n * width, n * width + width - 1, limit - len(rows)]).fetchall()
+            width *= 10
+    else:
+        q = q.lower()   # NOCASE compares lower-cased text
+        upper = q[:-1] + chr(ord(q[-1]) + 1)
+        rows = db.execute(select + ''' WHERE rj.id IN (
+                SELECT rj2.id FROM characters c2 JOIN render_jobs rj2 ON rj2.character_id=c2.id
+                WHERE c2.name >= ? COLLATE NOCASE AND c2.name < ? COLLATE NOCASE
+                UNION SELECT rj3.id FROM output_types ot3 JOIN render_jobs rj3 ON rj3.output_type_id=ot3.id
+                WHERE ot3.name >= ? COLLATE NOCASE AND ot3.name < ? COLLATE NOCASE)
+            ORDER BY rj.id DESC LIMIT ?''', [q, upper, q, upper, limit]).fetchall()
+    db.close()
+    return jsonify([dict(r) for r in rows])
 
 @app.route('/api/output-type-requirements/<int:ot_id>')
 def api_ot_requirements(ot_id):
     db = get_db()
-    reqs = db.execute('''SELECT ic.* FROM output_type_requirements otr
-        JOIN ingredient_categories ic ON otr.category_id=ic.id
-        WHERE otr.output_type_id=? ORDER BY ic.name''', [ot_id]).fetchall()
-    result = []
-    for req in reqs:
-        ings = db.execute('SELECT * FROM ingredients WHERE category_id=? ORDER BY code, name', [req['id']]).fetchall()
-        result.append({'category': dict(req), 'ingredients': [dict(i) for i in ings]})
+    data = batch_output_types(db, [ot_id]).get(ot_id)
     db.close()
-    return jsonify(result)
+    return jsonify(data['requirements'] if data else [])
 
 @app.route('/api/top-layer-meta/<int:top_id>')
 def api_top_layer_meta(top_id):
     db = get_db()
-    linked_media = db.execute('''SELECT ma.*, c.name as character_name FROM top_layer_jobs tlj
-        JOIN render_jobs rj ON tlj.job_id=rj.id
-        LEFT JOIN media_assets ma ON ma.job_id=rj.id
-        LEFT JOIN characters c ON ma.character_id=c.id
-        WHERE tlj.top_layer_id=? AND ma.id IS NOT NULL''', [top_id]).fetchall()
-    all_tags, all_chars, descriptions, seo_parts = set(), set(), [], []
-    for m in linked_media:
-        if m['tags']:
-            for t in m['tags'].split(','):
-                if t.strip(): all_tags.add(t.strip())
-        if m['character_name']: all_chars.add(m['character_name'])
-        if m['description']: descriptions.append(m['description'])
-        if m['seo_description']: seo_parts.append(m['seo_description'])
-    db.close()
-    return jsonify({'tags': ', '.join(sorted(all_tags)), 'characters': ', '.join(sorted(all_chars)),
-                    'description': ' | '.join(dict.fromkeys(descriptions))[:1000],
-                    'seo_description': ' '.join(dict.fromkeys(seo_parts))[:500]})
+    data = batch_top_layer(db, [top_id]).get(top_id)
+    db.close()
+    return jsonify(data or {k: '' for k in ('tags', 'characters', 'description', 'seo_description')})
+
+@app.route('/api/jobs/<int:job_id>/history')
+def api_job_history(job_id):
+    db = get_db()
+    events = db.execute('SELECT * FROM job_status_events WHERE job_id=? ORDER BY created_at, id', [job_id]).fetchall()
+    db.close()
+    return jsonify([dict(e) for e in events])
+
+@app.route('/api/timeline')
+def api_timeline():
+    """Status transitions per time bucket, read from job_timeline_buckets."""
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': 'granularity must be hour or day'}), 400
+    params = [granularity, request.args.get('project_id', 0, type=int), request.args.get('output_type_id', 0, type=int)]
+    query = 'SELECT bucket, status, count FROM job_timeline_buckets WHERE granularity=? AND project_id=? AND output_type_id=?'
+    if request.args.get('since'): query += ' AND bucket>=?'; params.append(request.args['since'])
+    if request.args.get('until'): query += ' AND bucket<=?'; params.append(request.args['until'])
+    db = get_db()
+    rows = db.execute(query + ' AND count>0 ORDER BY bucket', params).fetchall()
+    db.close()
+    buckets = {}
+    for r in rows:
+        buckets.setdefault(r['bucket'], {})[r['status']] = r['count']
+    return jsonify({'granularity': granularity, 'buckets': [{'bucket': b, 'counts': c} for b, c in buckets.items()]})
+
+@app.route('/api/timeline/stage-durations')
+def api_stage_durations():
+    """Percentiles of time between two statuses, read from job_stage_histogram."""
+    db = get_db()
+    rows = db.execute('''SELECT bin, count FROM job_stage_histogram WHERE from_status=? AND to_status=?
+        AND project_id=? AND output_type_id=? AND count>0 ORDER BY bin''',
+        [request.args.get('from', 'planned'), request.args.get('to', 'rendered'),
+         request.args.get('project_id', 0, type=int), request.args.get('output_type_id', 0, type=int)]).fetchall()
+    db.close()
+    total = sum(r['count'] for r in rows)
+    result = {'from': request.args.get('from', 'planned'), 'to': request.args.get('to', 'rendered'), 'count': total}
+    for pct in (50, 90, 95, 99):
+        seen, value = 0, None
+        for r in rows:
+            seen += r['count']
+            if seen * 100 >= pct * total:
+                value = duration_bin_upper(r['bin']); break
+        result[f'p{pct}_seconds'] = value
+    return jsonify(result)
+
+
+# ─── Batch API ────────────────────────────────────────────────────────────────
+# Pages prefetch what their scripts need in one request instead of one call
+# per id:
+#   GET  /api/batch?job=1,2,3&top_layer=7&job_fields=auto_title,auto_tags
+#   POST /api/batch {"job": {"ids": [1, 2, 3], "fields": ["auto_title"]}, "output_type": [4]}
+# Each entity comes back as {id: object}, trimmed to the requested fields;
+# ids that don't exist are listed under "missing"; an entity name that isn't
+# one of BATCH_ENTITIES is a 400 with either verb. JSON responses of
+# API_GZIP_MIN bytes or more are gzipped for clients that accept it.
+
+API_BATCH_MAX = 500    # ids per entity per request
+API_GZIP_MIN = 1024    # bytes; smaller bodies aren't worth compressing
+
+
+def _placeholders(ids):
+    return ','.join('?' * len(ids))
+
+
+def batch_output_types(db, ids):
+    """Output types with their required categories and each category's ingredients."""
+    result = {r['id']: {'id': r['id'], 'name': r['name'], 'requirements': []} for r in
+              db.execute(f'SELECT id, name FROM output_types WHERE id IN ({_placeholders(ids)})', ids)}
+    reqs = db.execute(f'''SELECT otr.output_type_id, ic.id, ic.name FROM output_type_requirements otr
+        JOIN ingredient_categories ic ON otr.category_id=ic.id
+        WHERE otr.output_type_id IN ({_placeholders(ids)}) ORDER BY ic.name''', ids).fetchall()
+    cat_ids = list({r['id'] for r in reqs})
+    ings = {}
+    if cat_ids:
+        for r in db.execute(f'''SELECT id, category_id, code, name FROM ingredients
+                WHERE category_id IN ({_placeholders(cat_ids)}) ORDER BY code, name''', cat_ids):
+            ings.setdefault(r['category_id'], []).append({'id': r['id'], 'code': r['code'], 'name': r['name']})
+    for r in reqs:
+        result[r['output_type_id']]['requirements'].append(
+            {'category': {'id': r['id'], 'name': r['name']}, 'ingredients': ings.get(r['id'], [])})
+    return result
+
+
+def batch_top_layer(db, ids):
+    """Aggregated metadata of top-layer clips."""
+    refresh_top_layer_meta(db)
+    rows = db.execute(f'''SELECT tl.id, m.characters, m.tags, m.description, m.seo_description
+        FROM top_layer_media tl LEFT JOIN top_layer_meta m ON m.top_layer_id=tl.id
+        WHERE tl.id IN ({_placeholders(ids)})''', ids).fetchall()
+    return {r['id']: {k: r[k] or '' for k in ('tags', 'characters', 'description', 'seo_description')} for r in rows}
+
+
+BATCH_ENTITIES = {'job': batch_jobs, 'output_type': batch_output_types, 'top_layer': batch_top_layer}
+
+
+@app.route('/api/batch', methods=['GET', 'POST'])
+def api_batch():
+    requested = {}
+    try:
+        if request.method == 'POST':
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                return jsonify({'error': 'expected a JSON object'}), 400
+            for name, spec in body.items():
+                spec = spec if isinstance(spec, dict) else {'ids': spec}
+                requested[name] = ([int(i) for i in spec.get('ids', [])], spec.get('fields'))
+        else:
+            for name, value in request.args.items():
+                if name.endswith('_fields') and name[:-len('_fields')] in BATCH_ENTITIES:
+                    continue
+                fields = request.args.get(f'{name}_fields')
+                requested[name] = ([int(i) for i in value.split(',') if i.strip()],
+                                   fields.split(',') if fields else None)
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'ids must be integers'}), 400
+    unknown = set(requested) - set(BATCH_ENTITIES)
+    if unknown:
+        return jsonify({'error': f"unknown entity {', '.join(sorted(unknown))}; expected {', '.join(BATCH_ENTITIES)}"}), 400
+    if any(len(ids) > API_BATCH_MAX for ids, _ in requested.values()):
+        return jsonify({'error': f'at most {API_BATCH_MAX} ids per entity'}), 400
+    db = get_db()
+    result, missing = {}, {}
+    for name, (ids, fields) in requested.items():
+        ids = list(dict.fromkeys(ids))
+        found = BATCH_ENTITIES[name](db, ids) if ids else {}
+        result[name] = {i: {k: v for k, v in obj.items() if k in fields} if fields else obj for i, obj in found.items()}
+        if len(found) < len(ids):
+            missing[name] = [i for i in ids if i not in found]
+    db.close()
+    if missing:
+        result['missing'] = missing
+    return jsonify(result)
+
+
+@app.after_request
+def compress_json(response):
+    if (response.mimetype == 'application/json' and request.accept_encodings['gzip']
+            and not response.direct_passthrough and not response.is_streamed
+            and 'Content-Encoding' not in response.headers):
+        data = response.get_data()
+        if len(data) >= API_GZIP_MIN:
+            response.set_data(gzip.compress(data, compresslevel=6))
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+# ─── Analytics ────────────────────────────────────────────────────────────────
+# Served from the rollups in the workspace's analytics file, never the live one.
+# Every response carries the snapshot's refreshed_at so callers can tell how
+# stale it is; POST /api/analytics/refresh rebuilds it on demand.
+
+ANALYTICS_APPROVAL = {'character', 'output_type', 'ingredient'}
+_RATE = 'ROUND(1.0 * approved / NULLIF(approved + rejected, 0), 3) AS approval_rate'
+
+
+def analytics_status(adb=None):
+    state = current_workspace().analytics_state
+    conn = adb or analytics_db()
+    meta = {}
+    if conn is not None:
+        meta = dict(conn.execute("SELECT key, value FROM analytics_meta WHERE key IN ('refreshed_at', 'seconds')").fetchall())
+        if adb is None:
+            conn.close()
+    return {'refreshed_at': meta.get('refreshed_at'), 'refresh_seconds': float(meta.get('seconds', 0)),
+            'refreshing': state['running'], 'error': state['error']}
+
+
+def analytics_rows(query, params=()):
+    """Run a report query against the snapshot; 503 (and a refresh) if there isn't one yet."""
+    adb = analytics_db()
+    if adb is None:
+        start_analytics_refresh()
+        return jsonify({**analytics_status(), 'error': 'No analytics snapshot yet; one is being built.'}), 503
+    rows = [dict(r) for r in adb.execute(query, params)]
+    status = analytics_status(adb)
+    adb.close()
+    return jsonify({**status, 'rows': rows})
+
+
+@app.route('/analytics')
+def analytics():
+    return render_template('analytics.html')
+
+
+@app.route('/api/analytics/status')
+def api_analytics_status():
+    return jsonify(analytics_status())
+
+
+@app.route('/api/analytics/refresh', methods=['POST'])
+def api_analytics_refresh():
+    started = start_analytics_refresh()
+    return jsonify({**analytics_status(), 'started': started}), 202
+
+
+@app.route('/api/analytics/ingredients')
+def api_analytics_ingredients():
+    """Ingredient usage, most used first (?order=least for the neglected ones), with approval counts."""
+    query = f'''SELECT u.*, COALESCE(a.media, 0) AS media, COALESCE(a.approved, 0) AS approved,
+        COALESCE(a.rejected, 0) AS rejected, {_RATE} FROM analytics_ingredient_usage u
+        LEFT JOIN analytics_approval a ON a.dimension='ingredient' AND a.key_id=u.ingredient_id'''
+    params = []
+    if request.args.get('category_id', type=int):
+        query += ' WHERE u.category_id=?'; params.append(request.args.get('category_id', type=int))
+    order = 'ASC' if request.args.get('order') == 'least' else 'DESC'
+    query += f' ORDER BY u.jobs {order}, u.name LIMIT ?'
+    params.append(max(1, min(request.args.get('limit', 50, type=int), 1000)))
+    return analytics_rows(query, params)
+
+
+@app.route('/api/analytics/approval')
+def api_analytics_approval():
+    """Media approval per character, output type or ingredient (?by=)."""
+    by = request.args.get('by', 'character')
+    if by not in ANALYTICS_APPROVAL:
+        return jsonify({'error': f"by must be one of {', '.join(sorted(ANALYTICS_APPROVAL))}"}), 400
+    return analytics_rows(f'''SELECT key_id AS id, name, media, approved, rejected, unreviewed, {_RATE}
+        FROM analytics_approval WHERE dimension=? ORDER BY media DESC, name''', [by])
+
+
+@app.route('/api/analytics/prompts')
+def api_analytics_prompts():
+    """Prompts created and moved to each status per day over the last ?days= (30)."""
+    days = max(1, min(request.args.get('days', 30, type=int), 3650))
+    query = '''SELECT day, status, SUM(prompts) AS prompts FROM analytics_prompt_throughput
+        WHERE day >= DATE('now', ?)'''
+    params = [f'-{days - 1} days']
+    if request.args.get('project_id', type=int) is not None:
+        query += ' AND project_id=?'; params.append(request.args.get('project_id', type=int))
+    return analytics_rows(query + ' GROUP BY day, status ORDER BY day, status', params)
+
+
+@app.route('/api/analytics/projects')
+def api_analytics_projects():
+    return analytics_rows('''SELECT *, ROUND(1.0 * complete / NULLIF(jobs, 0), 3) AS completion,
+        ROUND(1.0 * prompts_done / NULLIF(prompts, 0), 3) AS prompt_completion
+        FROM analytics_project_completion ORDER BY status, name''')
 
 
 # ─── Archetypes ───────────────────────────────────────────────────────────────
@@ -196,7 +635,7 @@ def edit_archetype(id):
 @app.route('/archetypes/delete/<int:id>', methods=['POST'])
 def delete_archetype(id):
     db = get_db()
-    db.execute('DELETE FROM archetypes WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'archetypes', [id]); db.commit(); db.close()
     flash('Archetype deleted.'); return redirect(url_for('archetypes'))
 
 
@@ -230,7 +669,7 @@ def edit_character(id):
 @app.route('/characters/delete/<int:id>', methods=['POST'])
 def delete_character(id):
     db = get_db()
-    db.execute('DELETE FROM characters WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'characters', [id]); db.commit(); db.close()
     flash('Character deleted.'); return redirect(url_for('characters'))
 
 
@@ -274,8 +713,7 @@ def edit_category(id):
 @app.route('/ingredients/categories/delete/<int:id>', methods=['POST'])
 def delete_category(id):
     db = get_db()
-    db.execute('DELETE FROM ingredients WHERE category_id=?', [id])
-    db.execute('DELETE FROM ingredient_categories WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'ingredient_categories', [id]); db.commit(); db.close()
     flash('Category deleted.'); return redirect(url_for('ingredients'))
 
 @app.route('/ingredients/add', methods=['POST'])
@@ -295,7 +733,7 @@ def edit_ingredient(id):
 @app.route('/ingredients/delete/<int:id>', methods=['POST'])
 def delete_ingredient(id):
     db = get_db()
-    db.execute('DELETE FROM ingredients WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'ingredients', [id]); db.commit(); db.close()
     return redirect(url_for('ingredients'))
 
 @app.route('/ingredients/rules/add', methods=['POST'])
@@ -311,7 +749,7 @@ def add_rule():
 @app.route('/ingredients/rules/delete/<int:id>', methods=['POST'])
 def delete_rule(id):
     db = get_db()
-    db.execute('DELETE FROM ingredient_rules WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'ingredient_rules', [id]); db.commit(); db.close()
     return redirect(url_for('ingredients'))
 
 
@@ -345,8 +783,7 @@ def edit_output_type(id):
 @app.route('/output-types/delete/<int:id>', methods=['POST'])
 def delete_output_type(id):
     db = get_db()
-    db.execute('DELETE FROM output_type_requirements WHERE output_type_id=?', [id])
-    db.execute('DELETE FROM output_types WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'output_types', [id]); db.commit(); db.close()
     flash('Output type deleted.'); return redirect(url_for('output_types'))
 
 @app.route('/output-types/add-requirement', methods=['POST'])
@@ -359,7 +796,7 @@ def add_requirement():
 @app.route('/output-types/delete-requirement/<int:id>', methods=['POST'])
 def delete_requirement(id):
     db = get_db()
-    db.execute('DELETE FROM output_type_requirements WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'output_type_requirements', [id]); db.commit(); db.close()
     return redirect(url_for('output_types'))
 
 
@@ -373,9 +810,10 @@ def job_builder():
     all_categories = db.execute('SELECT * FROM ingredient_categories ORDER BY name').fetchall()
     all_ingredients = db.execute('''SELECT i.*, ic.name as category_name FROM ingredients i
         JOIN ingredient_categories ic ON i.category_id=ic.id ORDER BY ic.name, i.code, i.name''').fetchall()
+    coverage = coverage_summary(db)
     db.close()
     return render_template('job_builder.html', characters=characters_list, output_types=output_types_list,
-                           all_categories=all_categories, all_ingredients=all_ingredients)
+                           all_categories=all_categories, all_ingredients=all_ingredients, coverage=coverage)
 
 @app.route('/jobs/builder', methods=['POST'])
 def create_job_from_builder():
@@ -383,6 +821,7 @@ def create_job_from_builder():
     job_id = db.execute('INSERT INTO render_jobs (character_id, output_type_id, status, notes) VALUES (?,?,?,?)',
                [request.form.get('character_id') or None, request.form.get('output_type_id') or None,
                 request.form.get('status','planned'), request.form.get('notes','')]).lastrowid
+    record_job_status(db, job_id, request.form.get('status','planned'), 'builder', created=True)
     for ing_id in request.form.getlist('ingredient_ids'):
         if ing_id:
             db.execute('INSERT INTO render_job_ingredients (job_id, ingredient_id) VALUES (?,?)', [job_id, ing_id])
@@ -390,6 +829,36 @@ def create_job_from_builder():
     flash(f'Render job #{job_id} created from builder.')
     return redirect(url_for('jobs'))
 
+@app.route('/api/planner/propose')
+def api_planner_propose():
+    db = get_db()
+    jobs_out, new = plan_jobs(db, max(1, min(request.args.get('k', 10, type=int), 10000)),
+                              output_type_ids=request.args.getlist('ot_id', type=int),
+                              character_ids=request.args.getlist('char_id', type=int),
+                              seed=request.args.get('seed', type=int))
+    summary = coverage_summary(db)
+    db.close()
+    return jsonify({'jobs': jobs_out, 'new': new, 'coverage': summary})
+
+@app.route('/jobs/planner/create', methods=['POST'])
+def create_planned_jobs():
+    planned = (request.get_json(silent=True) or {}).get('jobs', [])
+    db = get_db()
+    for job in planned:
+        job_id = db.execute("INSERT INTO render_jobs (character_id, output_type_id, status, notes) VALUES (?,?,'planned',?)",
+                            [job.get('character_id'), job.get('output_type_id'), 'Proposed by coverage planner']).lastrowid
+        record_job_status(db, job_id, 'planned', 'planner', created=True)
+        db.executemany('INSERT INTO render_job_ingredients (job_id, ingredient_id) VALUES (?,?)',
+                       [(job_id, i) for i in job.get('ingredient_ids', [])])
+    db.commit(); db.close()
+    return jsonify({'ok': True, 'created': len(planned)})
+
+@app.route('/jobs/planner/recount', methods=['POST'])
+def recount_coverage():
+    db = get_db()
+    rebuild_coverage(db); db.commit(); db.close()
+    flash('Coverage counters rebuilt.'); return redirect(url_for('job_builder'))
+
 
 # ─── Render Jobs ──────────────────────────────────────────────────────────────
 
@@ -397,50 +866,63 @@ def create_job_from_builder():
 def jobs():
     db = get_db()
     status_filter = request.args.get('status', '')
-    query = '''SELECT rj.*, c.name as character_name, ot.name as output_type_name FROM render_jobs rj
+    query = '''SELECT rj.*, c.name as character_name, ot.name as output_type_name,
+        EXISTS(SELECT 1 FROM media_assets ma WHERE ma.job_id=rj.id) as has_media FROM render_jobs rj
         LEFT JOIN characters c ON rj.character_id=c.id LEFT JOIN output_types ot ON rj.output_type_id=ot.id'''
-    items = db.execute(query + (' WHERE rj.status=?' if status_filter else '') + ' ORDER BY rj.created_at DESC',
-                       [status_filter] if status_filter else []).fetchall()
-    job_ingredients = {}
-    for job in items:
-        ings = db.execute('''SELECT i.name, i.code, ic.name as category_name FROM render_job_ingredients rji
-            JOIN ingredients i ON rji.ingredient_id=i.id JOIN ingredient_categories ic ON i.category_id=ic.id
-            WHERE rji.job_id=?''', [job['id']]).fetchall()
-        job_ingredients[job['id']] = ings
-    jobs_with_media = set(row[0] for row in db.execute('SELECT DISTINCT job_id FROM media_assets WHERE job_id IS NOT NULL').fetchall())
     characters_list = db.execute("SELECT * FROM characters WHERE status!='retired' ORDER BY name").fetchall()
     output_types_list = db.execute('SELECT * FROM output_types ORDER BY name').fetchall()
-    db.close()
-    return render_template('jobs.html', items=items, characters=characters_list, output_types=output_types_list,
-                           status_filter=status_filter, job_ingredients=job_ingredients, jobs_with_media=jobs_with_media)
+    chip_version = table_versions(db, CHIP_TABLES)
+
+    def job_ingredients(job_id):
+        return fragments.get(('chips', job_id), chip_version, lambda: db.execute(
+            '''SELECT i.name, i.code, ic.name as category_name FROM render_job_ingredients rji
+            JOIN ingredients i ON rji.ingredient_id=i.id JOIN ingredient_categories ic ON i.category_id=ic.id
+            WHERE rji.job_id=?''', [job_id]).fetchall())
+
+    items = db.execute(query + (' WHERE rj.status=?' if status_filter else '') + ' ORDER BY rj.created_at DESC',
+                       [status_filter] if status_filter else [])
+    return stream_page(db, 'jobs.html', items=items, characters=characters_list, output_types=output_types_list,
+                       status_filter=status_filter, job_ingredients=job_ingredients)
 
 @app.route('/jobs/add', methods=['POST'])
 def add_job():
     db = get_db()
-    db.execute('INSERT INTO render_jobs (character_id, output_type_id, status, notes) VALUES (?,?,?,?)',
+    job_id = db.execute('INSERT INTO render_jobs (character_id, output_type_id, status, notes) VALUES (?,?,?,?)',
                [request.form.get('character_id') or None, request.form.get('output_type_id') or None,
-                request.form.get('status','planned'), request.form.get('notes','')]); db.commit(); db.close()
+                request.form.get('status','planned'), request.form.get('notes','')]).lastrowid
+    record_job_status(db, job_id, request.form.get('status','planned'), 'add', created=True)
+    db.commit(); db.close()
     flash('Job added.'); return redirect(url_for('jobs'))
 
 @app.route('/jobs/edit/<int:id>', methods=['POST'])
 def edit_job(id):
     db = get_db()
+    output_type_id = request.form.get('output_type_id', type=int) or None
+    job = db.execute('SELECT output_type_id FROM render_jobs WHERE id=?', [id]).fetchone()
+    if job and job['output_type_id'] != output_type_id:
+        move_job_output_type(db, id, output_type_id)
+    record_job_status(db, id, request.form.get('status','planned'), 'edit', output_type_id=output_type_id)
     db.execute('UPDATE render_jobs SET character_id=?, output_type_id=?, status=?, notes=? WHERE id=?',
-               [request.form.get('character_id') or None, request.form.get('output_type_id') or None,
+               [request.form.get('character_id') or None, output_type_id,
                 request.form.get('status','planned'), request.form.get('notes',''), id]); db.commit(); db.close()
     flash('Job updated.'); return redirect(url_for('jobs'))
 
 @app.route('/jobs/update-status/<int:id>', methods=['POST'])
 def update_job_status(id):
-    db = get_db()
-    db.execute('UPDATE render_jobs SET status=? WHERE id=?', [request.form['status'], id]); db.commit(); db.close()
+    status = request.form['status']
+    def write(db):
+        record_job_status(db, id, status, 'status')
+        db.execute('UPDATE render_jobs SET status=? WHERE id=?', [status, id])
+    try:
+        current_workspace().write_queue.run(write)
+    except (TimeoutError, sqlite3.Error) as e:
+        flash(f'Status update failed: {e}')
     return redirect(request.referrer or url_for('jobs'))
 
 @app.route('/jobs/delete/<int:id>', methods=['POST'])
 def delete_job(id):
     db = get_db()
-    db.execute('DELETE FROM render_job_ingredients WHERE job_id=?', [id])
-    db.execute('DELETE FROM render_jobs WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'render_jobs', [id]); db.commit(); db.close()
     flash('Job deleted.'); return redirect(url_for('jobs'))
 
 
@@ -451,25 +933,29 @@ def media():
     db = get_db()
     status_filter = request.args.get('status', '')
     char_filter = request.args.get('character_id', '')
-    query = '''SELECT ma.*, c.name as character_name, ot.name as output_type_name FROM media_assets ma
-        LEFT JOIN characters c ON ma.character_id=c.id LEFT JOIN output_types ot ON ma.output_type_id=ot.id WHERE 1=1'''
+    scope = request.args.get('scope', '')   # '' live only, 'archived', 'all'
+    integrity_filter = request.args.get('file', '')   # 'missing' or 'changed'
+    source = 'media_assets'
+    if scope in ('archived', 'all') and attach_archive(db):
+        source = 'all_media_assets'
+    query = f'''SELECT ma.*, c.name as character_name, ot.name as output_type_name, mf.status as file_status FROM {source} ma
+        LEFT JOIN characters c ON ma.character_id=c.id LEFT JOIN output_types ot ON ma.output_type_id=ot.id
+        LEFT JOIN media_files mf ON mf.source='media' AND mf.ref_id=ma.id AND mf.file_path=TRIM(ma.file_path) WHERE 1=1'''
     params = []
+    if scope == 'archived': query += ' AND ma.archived=1' if source != 'media_assets' else ' AND 0'
     if status_filter: query += ' AND ma.quality_status=?'; params.append(status_filter)
     if char_filter: query += ' AND ma.character_id=?'; params.append(char_filter)
+    if integrity_filter: query += ' AND mf.status=?'; params.append(integrity_filter)
     query += ' ORDER BY ma.created_at DESC'
-    items = db.execute(query, params).fetchall()
     pending_jobs = db.execute('''SELECT rj.*, c.name as character_name, ot.name as output_type_name FROM render_jobs rj
         LEFT JOIN characters c ON rj.character_id=c.id LEFT JOIN output_types ot ON rj.output_type_id=ot.id
         WHERE rj.id NOT IN (SELECT DISTINCT job_id FROM media_assets WHERE job_id IS NOT NULL)
         AND rj.status IN ('rendered','complete') ORDER BY rj.created_at DESC''').fetchall()
-    all_jobs = db.execute('''SELECT rj.*, c.name as character_name, ot.name as output_type_name FROM render_jobs rj
-        LEFT JOIN characters c ON rj.character_id=c.id LEFT JOIN output_types ot ON rj.output_type_id=ot.id
-        ORDER BY rj.created_at DESC''').fetchall()
     characters_list = db.execute('SELECT * FROM characters ORDER BY name').fetchall()
     output_types_list = db.execute('SELECT * FROM output_types ORDER BY name').fetchall()
-    db.close()
-    return render_template('media.html', items=items, characters=characters_list, output_types=output_types_list,
-                           status_filter=status_filter, char_filter=char_filter, pending_jobs=pending_jobs, all_jobs=all_jobs)
+    return stream_page(db, 'media.html', items=db.execute(query, params), characters=characters_list,
+                       output_types=output_types_list, status_filter=status_filter, char_filter=char_filter,
+                       scope=scope, integrity_filter=integrity_filter, pending_jobs=pending_jobs)
 
 @app.route('/media/add', methods=['POST'])
 def add_media():
@@ -494,14 +980,18 @@ def edit_media(id):
 
 @app.route('/media/update-status/<int:id>', methods=['POST'])
 def update_media_status(id):
-    db = get_db()
-    db.execute('UPDATE media_assets SET quality_status=? WHERE id=?', [request.form['quality_status'], id]); db.commit(); db.close()
+    status = request.form['quality_status']
+    try:
+        current_workspace().write_queue.run(
+            lambda db: db.execute('UPDATE media_assets SET quality_status=? WHERE id=?', [status, id]))
+    except (TimeoutError, sqlite3.Error) as e:
+        flash(f'Status update failed: {e}')
     return redirect(request.referrer or url_for('media'))
 
 @app.route('/media/delete/<int:id>', methods=['POST'])
 def delete_media(id):
     db = get_db()
-    db.execute('DELETE FROM media_assets WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'media_assets', [id]); db.commit(); db.close()
     flash('Asset deleted.'); return redirect(url_for('media'))
 
 
@@ -510,21 +1000,21 @@ def delete_media(id):
 @app.route('/top-layer')
 def top_layer():
     db = get_db()
-    items = db.execute('SELECT * FROM top_layer_media ORDER BY created_at DESC').fetchall()
-    item_jobs = {}
-    for item in items:
-        linked = db.execute('''SELECT tlj.id as link_id, rj.*, c.name as character_name, ot.name as output_type_name,
-            ma.title as media_title, ma.tags as media_tags, ma.description as media_desc,
-            ma.seo_title as media_seo_title, ma.seo_description as media_seo_desc, ma.quality_status
-            FROM top_layer_jobs tlj JOIN render_jobs rj ON tlj.job_id=rj.id
+    attach_archive(db)
+    linked_version = table_versions(db, LINKED_JOB_TABLES)
+
+    def item_jobs(top_id):
+        return fragments.get(('linked', top_id), linked_version, lambda: db.execute(
+            '''SELECT tlj.id as link_id, rj.*, c.name as character_name, ot.name as output_type_name,
+            ma.title as media_title, ma.quality_status
+            FROM all_top_layer_jobs tlj JOIN all_render_jobs rj ON tlj.job_id=rj.id
             LEFT JOIN characters c ON rj.character_id=c.id LEFT JOIN output_types ot ON rj.output_type_id=ot.id
-            LEFT JOIN media_assets ma ON ma.job_id=rj.id WHERE tlj.top_layer_id=?''', [item['id']]).fetchall()
-        item_jobs[item['id']] = linked
-    all_jobs = db.execute('''SELECT rj.*, c.name as character_name, ot.name as output_type_name FROM render_jobs rj
-        LEFT JOIN characters c ON rj.character_id=c.id LEFT JOIN output_types ot ON rj.output_type_id=ot.id
-        ORDER BY rj.created_at DESC''').fetchall()
-    db.close()
-    return render_template('top_layer.html', items=items, item_jobs=item_jobs, all_jobs=all_jobs)
+            LEFT JOIN all_media_assets ma ON ma.job_id=rj.id WHERE tlj.top_layer_id=?''', [top_id]).fetchall())
+
+    refresh_top_layer_meta(db)
+    items = db.execute('''SELECT t.*, m.tags as agg_tags FROM top_layer_media t
+        LEFT JOIN top_layer_meta m ON m.top_layer_id=t.id ORDER BY t.created_at DESC''')
+    return stream_page(db, 'top_layer.html', items=items, item_jobs=item_jobs)
 
 @app.route('/top-layer/add', methods=['POST'])
 def add_top_layer():
@@ -545,8 +1035,7 @@ def edit_top_layer(id):
 @app.route('/top-layer/delete/<int:id>', methods=['POST'])
 def delete_top_layer(id):
     db = get_db()
-    db.execute('DELETE FROM top_layer_jobs WHERE top_layer_id=?', [id])
-    db.execute('DELETE FROM top_layer_media WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'top_layer_media', [id]); db.commit(); db.close()
     flash('Clip deleted.'); return redirect(url_for('top_layer'))
 
 @app.route('/top-layer/link-job/<int:top_id>', methods=['POST'])
@@ -610,26 +1099,217 @@ def data_manager():
     db = get_db()
     tables = [r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()]
     counts = {t: db.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0] for t in tables}
+    archive = archive_stats(db)
+    sync = {'instance_id': sync_instance_id(db),
+            'seq': db.execute('SELECT COALESCE(MAX(seq), 0) FROM sync_changes').fetchone()[0],
+            'peers': db.execute('SELECT * FROM sync_peers ORDER BY last_synced_at DESC').fetchall(),
+            'conflicts': db.execute('SELECT * FROM sync_conflicts ORDER BY id DESC LIMIT 20').fetchall()}
+    media_counts, media_problems = media_integrity_counts(db), media_integrity_problems(db, limit=50)
     db.close()
-    return render_template('data_manager.html', tables=tables, counts=counts)
+    return render_template('data_manager.html', tables=tables, counts=counts, archive=archive, sync=sync,
+                           media_scan=current_workspace().media_scan_state, media_counts=media_counts, media_problems=media_problems,
+                           backups=list_backups(), backup_hours=database.BACKUP_HOURS, backup_keep=database.BACKUP_KEEP,
+                           slow_queries=database.get_slow_queries(), slow_query_ms=database.SLOW_QUERY_MS,
+                           slow_query_large_table=database.SLOW_QUERY_LARGE_TABLE)
+
+
+@app.before_request
+def reload_slow_query_threshold():
+    database.load_slow_query_threshold()
+
+
+@app.route('/data/slow-queries', methods=['POST'])
+def slow_query_settings():
+    if request.form.get('action') == 'clear':
+        database.clear_slow_queries(); flash('Slow-query log cleared.')
+    else:
+        try:
+            database.set_slow_query_threshold(request.form.get('threshold_ms', 0))
+            flash(f'Slow-query threshold set to {database.SLOW_QUERY_MS:g} ms.' if database.SLOW_QUERY_MS
+                  else 'Slow-query log disabled.')
+        except ValueError:
+            flash('Threshold must be a number of milliseconds.')
+        except sqlite3.Error as e:
+            flash(f'Could not save the threshold: {e}')
+    return redirect(url_for('data_manager'))
+
+@app.route('/data/media-scan', methods=['POST'])
+def media_scan():
+    if request.form.get('action') == 'accept':
+        db = get_db(); n = accept_media_changes(db); db.close()
+        flash(f'Accepted {n} changed file{"s" if n != 1 else ""} as the new baseline.')
+    elif start_media_scan(hash_files=bool(request.form.get('hash')), full=bool(request.form.get('full'))):
+        flash('Media scan started. Refresh this page to see progress.')
+    else:
+        flash('A media scan is already running.')
+    return redirect(url_for('data_manager'))
+
+@app.route('/api/media-integrity')
+def api_media_integrity():
+    db = get_db()
+    counts = media_integrity_counts(db)
+    problems = [dict(r) for r in media_integrity_problems(db, limit=request.args.get('limit', 200, type=int))]
+    db.close()
+    return jsonify({'scan': current_workspace().media_scan_state, 'counts': counts, 'problems': problems})
+
+@app.route('/data/backups', methods=['POST'])
+def backup_now():
+    try:
+        written = backup_database()
+        flash(f"Backup complete: {', '.join(os.path.basename(p) for p in written)}")
+    except (OSError, sqlite3.Error) as e:
+        flash(f'Backup failed: {e}')
+    return redirect(url_for('data_manager'))
+
+@app.route('/data/backups/<name>')
+def download_backup(name):
+    path = os.path.join(current_workspace().backup_dir, secure_filename(name))
+    if not os.path.exists(path):
+        flash('Backup not found.'); return redirect(url_for('data_manager'))
+    return send_file(os.path.abspath(path), as_attachment=True)
+
+@app.route('/data/backups/<name>/verify', methods=['POST'])
+def verify_backup_file(name):
+    path = os.path.join(current_workspace().backup_dir, secure_filename(name))
+    try:
+        result = verify_backup(path)
+        flash(f'{name}: integrity check passed.' if result == 'ok' else f'{name}: integrity check FAILED — {result}')
+    except (OSError, sqlite3.Error) as e:
+        flash(f'{name}: could not be read — {e}')
+    return redirect(url_for('data_manager'))
+
+@app.route('/data/backups/<name>/restore', methods=['POST'])
+def restore_backup_file(name):
+    try:
+        restore_backup(secure_filename(name))
+        flash(f'Restored {name}. The previous data was saved as a pre-restore backup.')
+    except FileNotFoundError:
+        flash('Backup not found.')
+    except (OSError, sqlite3.Error) as e:
+        flash(f'Restore failed: {e}')
+    return redirect(url_for('data_manager'))
+
+@app.route('/data/archive', methods=['POST'])
+def archive_data():
+    db = get_db()
+    moved = archive_jobs(db, older_than_days=request.form.get('older_than_days', 90, type=int),
+                         batch_size=request.form.get('batch_size', 500, type=int))
+    db.close()
+    flash(f"Archived {moved.get('render_jobs', 0)} jobs and {moved.get('media_assets', 0)} media assets."
+          if moved.get('render_jobs') else 'No completed jobs old enough to archive.')
+    return redirect(url_for('data_manager'))
+
+@app.route('/data/archive/restore/<int:job_id>', methods=['POST'])
+def restore_archived_job(job_id):
+    db = get_db()
+    try:
+        moved = restore_job(db, job_id)
+        flash(f'Job #{job_id} restored from archive.' if moved.get('render_jobs') else f'Job #{job_id} is not in the archive.')
+    except sqlite3.IntegrityError as e:
+        flash(f'Could not restore job #{job_id}: {e}')
+    db.close()
+    return redirect(request.referrer or url_for('data_manager'))
+
+@app.route('/data/sweep', methods=['POST'])
+def sweep_data():
+    db = get_db()
+    result = sweep_orphans(db)
+    db.close()
+    total = sum(result['rows'].values())
+    size = f"{result['bytes_before'] / 1048576:.1f} MB → {result['bytes_after'] / 1048576:.1f} MB"
+    flash(f"Cleared {total} orphaned rows ({', '.join(f'{n} {k}' for k, n in result['rows'].items())}); database {size}."
+          if total else f'No orphaned rows. Vacuumed and analyzed; database {size}.')
+    return redirect(url_for('data_manager'))
+
+# kind in the URL → (table, singular, plural)
+BULK_DELETE = {
+    'archetypes': ('archetypes', 'archetype', 'archetypes'),
+    'characters': ('characters', 'character', 'characters'),
+    'categories': ('ingredient_categories', 'category', 'categories'),
+    'ingredients': ('ingredients', 'ingredient', 'ingredients'),
+    'rules': ('ingredient_rules', 'rule', 'rules'),
+    'output-types': ('output_types', 'output type', 'output types'),
+    'requirements': ('output_type_requirements', 'requirement', 'requirements'),
+    'jobs': ('render_jobs', 'job', 'jobs'),
+    'media': ('media_assets', 'asset', 'assets'),
+    'top-layer': ('top_layer_media', 'clip', 'clips'),
+    'projects': ('projects', 'project', 'projects'),
+    'prompts': ('prompts', 'prompt', 'prompts'),
+}
+
+@app.route('/bulk-delete/<kind>', methods=['POST'])
+def bulk_delete(kind):
+    """Delete many rows of one kind in one transaction. Takes repeated ids form
+    fields (redirects back) or JSON {"ids": [...]} (answers with the count)."""
+    data = request.get_json(silent=True)
+    if kind not in BULK_DELETE:
+        return jsonify({'error': f'unknown kind {kind!r}'}), 404
+    table, one, many = BULK_DELETE[kind]
+    try:
+        ids = [int(i) for i in data.get('ids', [])] if data is not None else request.form.getlist('ids', type=int)
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'error': 'ids must be a list of integers'}), 400
+    db = get_db()
+    deleted = delete_rows(db, table, ids)
+    db.commit(); db.close()
+    if data is not None:
+        return jsonify({'deleted': deleted})
+    flash(f'Deleted {deleted} {one if deleted == 1 else many}.')
+    return redirect(request.referrer or url_for('index'))
+
+@app.route('/api/sync/changes')
+def api_sync_changes():
+    db = get_db()
+    changes, next_since, more = get_changes(db, request.args.get('since', 0, type=int),
+                                            min(request.args.get('limit', 500, type=int), 5000),
+                                            request.args.get('exclude_origin'))
+    instance_id = sync_instance_id(db)
+    db.close()
+    return jsonify({'instance_id': instance_id, 'changes': changes, 'next_since': next_since, 'more': more})
+
+@app.route('/api/sync/apply', methods=['POST'])
+def api_sync_apply():
+    data = request.get_json(silent=True) or {}
+    if not data.get('origin'):
+        return jsonify({'error': 'origin (the sending instance id) is required'}), 400
+    db = get_db()
+    try:
+        stats = apply_changes(db, data['origin'], data.get('changes', []))
+    except sqlite3.Error as e:
+        db.close()
+        return jsonify({'error': str(e)}), 409
+    db.close()
+    return jsonify(stats)
+
+@app.route('/data/sync', methods=['POST'])
+def sync_data():
+    url = request.form.get('url', '').strip()
+    if not url.startswith('http'):
+        flash('Enter the other instance\'s address, e.g. http://192.168.1.20:5000')
+        return redirect(url_for('data_manager'))
+    db = get_db()
+    try:
+        totals = sync_with_peer(db, url)
+        flash(f"Synced with {url}: {totals['pulled']} changes pulled, {totals['pushed']} pushed, {totals['conflicts']} conflicts.")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        flash(f'Sync with {url} failed: {e}')
+    db.close()
+    return redirect(url_for('data_manager'))
+
+@app.route('/api/slow-queries')
+def api_slow_queries():
+    return jsonify({'threshold_ms': database.SLOW_QUERY_MS, 'queries': database.get_slow_queries()})
 
 
 @app.route('/export')
 def export_data():
     db = get_db()
-    tables = [r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()]
-    export = {
-        'exported_at': datetime.utcnow().isoformat(),
-        'version': '0.2',
-        'tables': {}
-    }
-    for table in tables:
-        rows = db.execute(f'SELECT * FROM {table}').fetchall()
-        export['tables'][table] = [dict(r) for r in rows]
+    export = export_database(db)
     db.close()
     buf = io.BytesIO(json.dumps(export, indent=2).encode('utf-8'))
     buf.seek(0)
-    filename = f"pipeline_export_{datetime.utcnow().strftime('%Y%m%d_%H%M')}.json"
+    name = current_workspace().name
+    filename = f"pipeline_export_{'' if name == DEFAULT_WORKSPACE else name + '_'}{datetime.utcnow().strftime('%Y%m%d_%H%M')}.json"
     return send_file(buf, mimetype='application/json', as_attachment=True, download_name=filename)
 
 
@@ -744,9 +1424,7 @@ def edit_project(id):
 @app.route('/projects/delete/<int:id>', methods=['POST'])
 def delete_project(id):
     db = get_db()
-    db.execute('DELETE FROM project_jobs WHERE project_id=?', [id])
-    db.execute('DELETE FROM prompts WHERE project_id=?', [id])
-    db.execute('DELETE FROM projects WHERE id=?', [id])
+    delete_rows(db, 'projects', [id])
     db.commit(); db.close(); flash('Project deleted.')
     return redirect(url_for('projects'))
 
@@ -759,6 +1437,7 @@ def link_project_job(id):
                               [id, job_id]).fetchone()
         if not existing:
             db.execute('INSERT INTO project_jobs (project_id, job_id) VALUES (?,?)', [id, job_id])
+            fold_job_into_project(db, job_id, id, 1)
             db.commit()
     db.close()
     return redirect(url_for('journal', project_id=id))
@@ -766,7 +1445,11 @@ def link_project_job(id):
 @app.route('/projects/<int:id>/unlink-job/<int:link_id>', methods=['POST'])
 def unlink_project_job(id, link_id):
     db = get_db()
-    db.execute('DELETE FROM project_jobs WHERE id=?', [link_id]); db.commit(); db.close()
+    link = db.execute('SELECT * FROM project_jobs WHERE id=?', [link_id]).fetchone()
+    if link:
+        fold_job_into_project(db, link['job_id'], link['project_id'], -1)
+        db.execute('DELETE FROM project_jobs WHERE id=?', [link_id]); db.commit()
+    db.close()
     return redirect(url_for('journal', project_id=id))
 
 
@@ -793,15 +1476,10 @@ def journal():
         prompts_list = db.execute(
             "SELECT * FROM prompts WHERE project_id=? ORDER BY created_at DESC", [project_id]
         ).fetchall()
-    all_jobs = db.execute(
-        "SELECT rj.*, c.name as character_name, ot.name as output_type_name FROM render_jobs rj"
-        " LEFT JOIN characters c ON rj.character_id=c.id"
-        " LEFT JOIN output_types ot ON rj.output_type_id=ot.id ORDER BY rj.created_at DESC"
-    ).fetchall()
     db.close()
     return render_template('journal.html', projects=projects_list, all_projects=all_projects,
                            current_project=current_project, linked_jobs=linked_jobs,
-                           prompts=prompts_list, all_jobs=all_jobs, project_id=project_id)
+                           prompts=prompts_list, project_id=project_id)
 
 
 # ─── Prompts ──────────────────────────────────────────────────────────────────
@@ -809,10 +1487,18 @@ def journal():
 @app.route('/prompts/add', methods=['POST'])
 def add_prompt():
     db = get_db()
-    db.execute('INSERT INTO prompts (project_id, job_id, text, label, status) VALUES (?,?,?,?,?)',
+    cur = db.execute('INSERT INTO prompts (project_id, job_id, text, label, status) VALUES (?,?,?,?,?)',
                [request.form.get('project_id') or None, request.form.get('job_id') or None,
                 request.form.get('text',''), request.form.get('label',''), 'pending'])
-    db.commit(); db.close()
+    db.commit()
+    refresh_prompt_index(db)
+    similar = similar_prompts(db, source='prompt', ref_id=cur.lastrowid, limit=5)
+    db.close()
+    if similar:
+        top = similar[0]
+        flash(f"Heads up: this prompt is {top['similarity']:.0%} similar to "
+              f"{'prompt' if top['source'] == 'prompt' else 'media asset'} #{top['id']}"
+              f"{f' and {len(similar) - 1} more' if len(similar) > 1 else ''}.")
     pid = request.form.get('project_id')
     return redirect(url_for('journal', project_id=pid) if pid else url_for('prompt_library'))
 
@@ -823,7 +1509,9 @@ def edit_prompt(id):
     db.execute('UPDATE prompts SET text=?, label=?, notes=? WHERE id=?',
                [request.form.get('text',''), request.form.get('label',''),
                 request.form.get('notes',''), id])
-    db.commit(); db.close()
+    db.commit()
+    refresh_prompt_index(db)
+    db.close()
     pid = prompt['project_id'] if prompt else None
     return redirect(url_for('journal', project_id=pid) if pid else url_for('prompt_library'))
 
@@ -831,19 +1519,90 @@ def edit_prompt(id):
 def delete_prompt(id):
     db = get_db()
     prompt = db.execute('SELECT * FROM prompts WHERE id=?', [id]).fetchone()
-    db.execute('DELETE FROM prompts WHERE id=?', [id]); db.commit(); db.close()
+    delete_rows(db, 'prompts', [id]); db.commit(); db.close()
     pid = prompt['project_id'] if prompt else None
     return redirect(url_for('journal', project_id=pid) if pid else url_for('prompt_library'))
 
 @app.route('/api/prompts/status/<int:id>', methods=['POST'])
 def update_prompt_status(id):
+    data = request.json
+    result = dock_once(data.get('idempotency_key'), 'prompt_status',
+                       lambda db: set_prompt_status(db, id, data.get('status')))
+    return jsonify(result)
+
+def _lease_seconds(data):
+    """The lease_seconds of a claim request, or None if it isn't a positive number."""
+    lease = data.get('lease_seconds', database.PROMPT_LEASE_SECONDS)
+    if isinstance(lease, bool) or not isinstance(lease, (int, float)) or not lease > 0:
+        return None
+    return lease
+
+@app.route('/api/prompts/claim', methods=['POST'])
+def api_claim_prompts():
+    data = request.get_json(silent=True) or {}
+    if not data.get('claimant'):
+        return jsonify({'error': 'claimant is required'}), 400
+    n = data.get('n', 1)
+    if isinstance(n, bool) or not isinstance(n, int) or n < 1:
+        return jsonify({'error': 'n must be a positive integer'}), 400
+    lease_seconds = _lease_seconds(data)
+    if lease_seconds is None:
+        return jsonify({'error': 'lease_seconds must be a positive number'}), 400
+    db = get_db()
+    rows = claim_prompts(db, data['claimant'], min(n, 50),
+                         project_id=data.get('project_id'), job_id=data.get('job_id'),
+                         lease_seconds=lease_seconds)
+    db.close()
+    return jsonify({'prompts': [dict(r) for r in rows]})
+
+@app.route('/api/prompts/renew', methods=['POST'])
+def api_renew_prompts():
+    data = request.get_json(silent=True) or {}
+    lease_seconds = _lease_seconds(data)
+    if lease_seconds is None:
+        return jsonify({'error': 'lease_seconds must be a positive number'}), 400
     db = get_db()
-    new_status = request.json.get('status')
-    if new_status in ('pending', 'collected', 'done', 'flagged'):
-        db.execute('UPDATE prompts SET status=? WHERE id=?', [new_status, id])
-        db.commit()
+    renewed = renew_claims(db, data.get('claimant'), data.get('ids', []), lease_seconds)
+    db.close()
+    return jsonify({'renewed': renewed})
+
+@app.route('/api/prompts/release', methods=['POST'])
+def api_release_prompts():
+    data = request.get_json(silent=True) or {}
+    db = get_db()
+    released = release_claims(db, data.get('claimant'), data.get('ids', []))
+    db.close()
+    return jsonify({'released': released})
+
+@app.route('/api/prompts/similar')
+def api_similar_prompts():
+    db = get_db()
+    threshold = request.args.get('threshold', database.PROMPT_SIMILARITY, type=float)
+    limit = max(1, min(request.args.get('limit', 20, type=int), 200))
+    if request.args.get('id') or request.args.get('media_id'):
+        source = 'prompt' if request.args.get('id') else 'media'
+        ref_id = request.args.get('id', type=int) or request.args.get('media_id', type=int)
+        results = similar_prompts(db, source=source, ref_id=ref_id, threshold=threshold, limit=limit)
+    else:
+        results = similar_prompts(db, text=request.args.get('text', ''), threshold=threshold, limit=limit)
+    db.close()
+    return jsonify({'results': results})
+
+@app.route('/api/prompts/duplicates')
+def api_prompt_duplicates():
+    db = get_db()
+    groups = prompt_duplicate_groups(db, threshold=request.args.get('threshold', 0.8, type=float),
+                                     limit=request.args.get('limit', 200, type=int))
     db.close()
-    return jsonify({'ok': True})
+    return jsonify({'groups': groups})
+
+@app.route('/prompt-library/duplicates')
+def prompt_duplicates():
+    db = get_db()
+    threshold = request.args.get('threshold', 0.8, type=float)
+    groups = prompt_duplicate_groups(db, threshold=threshold)
+    db.close()
+    return render_template('prompt_duplicates.html', groups=groups, threshold=threshold)
 
 @app.route('/prompt-library')
 def prompt_library():
@@ -904,11 +1663,7 @@ def api_dock_job_prompts(job_id):
     db.close()
     return jsonify([dict(p) for p in prompts])
 
-@app.route('/api/dock/submit-media', methods=['POST'])
-def api_dock_submit_media():
-    db = get_db()
-    job_id = request.form.get('job_id')
-    file_path = request.form.get('file_path', '')
+def dock_submit_media(db, job_id, file_path):
     auto_title, auto_tags, char_id, ot_id = '', '', None, None
     if job_id:
         job = db.execute(
@@ -930,14 +1685,82 @@ def api_dock_submit_media():
             auto_tags = (job['character_name'] or '').lower().replace(' ', ',')
             if job['char_tags']: auto_tags += ',' + job['char_tags']
             if ings: auto_tags += ',' + ','.join(i['name'].lower() for i in ings)
+            record_job_status(db, job_id, 'complete', 'dock')
             db.execute("UPDATE render_jobs SET status='complete' WHERE id=?", [job_id])
     new_id = db.execute(
         "INSERT INTO media_assets (job_id, character_id, output_type_id, file_path, title, tags, quality_status)"
         " VALUES (?,?,?,?,?,?,?)",
         [job_id or None, char_id, ot_id, file_path, auto_title, auto_tags, 'unreviewed']
     ).lastrowid
-    db.commit(); db.close()
-    return jsonify({'ok': True, 'media_id': new_id, 'title': auto_title})
+    return {'ok': True, 'media_id': new_id, 'title': auto_title}
+
+def set_prompt_status(db, prompt_id, new_status):
+    if new_status in ('pending', 'collected', 'done', 'flagged'):
+        # A manual status change ends any queue lease on the prompt
+        db.execute('UPDATE prompts SET status=?, claimed_by=NULL, claim_expires_at=NULL WHERE id=?', [new_status, prompt_id])
+    return {'ok': True}
+
+def _dock_write(key, kind, action):
+    """Wrap a dock write so it runs at most once per idempotency key.
+
+    The key is claimed in the same transaction as the write, so a replay of a
+    request the server already applied returns the stored response instead of
+    importing the file twice. Requests without a key always run.
+    """
+    def write(db):
+        if key:
+            row = db.execute('SELECT response FROM dock_requests WHERE key=?', [key]).fetchone()
+            if row:
+                return dict(json.loads(row['response']), duplicate=True)
+        result = action(db)
+        if key:
+            db.execute('INSERT INTO dock_requests (key, kind, response) VALUES (?,?,?)', [key, kind, json.dumps(result)])
+        return result
+    return write
+
+def _dock_result(future):
+    """The write's result, or an error; retry=True marks errors worth replaying later (a busy database).
+    Replays are safe even if a timed-out write commits after all: its key is claimed with it."""
+    try:
+        return future.result(database.DB_TIMEOUT * 2)
+    except (TimeoutError, sqlite3.OperationalError) as e:
+        return {'ok': False, 'error': str(e) or 'timed out waiting for the database', 'retry': True}
+    except sqlite3.Error as e:
+        return {'ok': False, 'error': str(e)}
+
+def dock_once(key, kind, action):
+    """Run action(db) through the group-commit writer, once per key; waits for the commit."""
+    return _dock_result(current_workspace().write_queue.submit(_dock_write(key, kind, action)))
+
+@app.route('/api/dock/submit-media', methods=['POST'])
+def api_dock_submit_media():
+    job_id, file_path = request.form.get('job_id'), request.form.get('file_path', '')
+    result = dock_once(request.form.get('idempotency_key'), 'submit',
+                       lambda db: dock_submit_media(db, job_id, file_path))
+    return jsonify(result)
+
+@app.route('/api/dock/replay', methods=['POST'])
+def api_dock_replay():
+    """Apply a batch of writes queued by the dock while the server was down, in order."""
+    ops = (request.get_json(silent=True) or {}).get('ops', [])
+    write_queue = current_workspace().write_queue
+    pending = []
+    for op in ops[:200]:
+        kind, key = op.get('kind'), op.get('key')
+        if kind == 'submit':
+            action = lambda db, op=op: dock_submit_media(db, op.get('job_id'), op.get('file_path', ''))
+        elif kind == 'prompt_status':
+            action = lambda db, op=op: set_prompt_status(db, op.get('prompt_id'), op.get('status'))
+        else:
+            pending.append((key, {'ok': False, 'error': f'unknown kind {kind!r}'}))
+            continue
+        pending.append((key, write_queue.submit(_dock_write(key, kind, action))))
+    results = [dict(r if isinstance(r, dict) else _dock_result(r), key=key) for key, r in pending]
+    try:
+        write_queue.run(lambda db: db.execute("DELETE FROM dock_requests WHERE created_at < datetime('now', '-30 days')"))
+    except (TimeoutError, sqlite3.Error):
+        pass   # housekeeping only; the next replay tries again
+    return jsonify({'results': results})
 
 @app.route('/api/dock/config')
 def api_dock_config():
@@ -967,4 +1790,6 @@ def api_dock_jobs():
 if __name__ == '__main__':
     print("\n  Pipeline Manager is running.")
     print("  Open your browser and go to:  http://localhost:5000\n")
+    start_backup_scheduler()
+    start_analytics_scheduler()
     app.run(debug=False, port=5000)
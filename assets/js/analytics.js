@@ -0,0 +1,117 @@
+const PROMPT_COLOURS = {created:'bg-slate-600', collected:'bg-blue-500', done:'bg-green-500', flagged:'bg-red-600'};
+let snapshotAt = null, waiting = null;
+
+async function analyticsGet(path) {
+  const r = await fetch('/api/analytics/' + path);
+  const data = await r.json();
+  showSnapshot(data);
+  if (r.status === 503) { waitForSnapshot(); return null; }
+  return data.rows;
+}
+function showSnapshot(s) {
+  snapshotAt = s.refreshed_at;
+  document.getElementById('an-snapshot').textContent = s.refreshed_at
+    ? `Snapshot taken ${s.refreshed_at} (${s.refresh_seconds}s).` : 'Building the first snapshot…';
+  document.getElementById('an-refresh').disabled = s.refreshing;
+}
+// Poll until the snapshot changes, then redraw. Works across worker processes,
+// where the process that took the refresh may not be the one answering.
+function waitForSnapshot() {
+  if (waiting) return;
+  const before = snapshotAt;
+  waiting = setInterval(async () => {
+    const s = await fetch('/api/analytics/status').then(r => r.json());
+    if (s.error) document.getElementById('an-snapshot').textContent = 'Refresh failed: ' + s.error;
+    if (s.refreshed_at !== before) { clearInterval(waiting); waiting = null; loadAnalytics(); }
+  }, 2000);
+}
+async function refreshAnalytics() {
+  await fetch('/api/analytics/refresh', {method: 'POST'});
+  document.getElementById('an-refresh').disabled = true;
+  waitForSnapshot();
+}
+
+function pct(rate) { return rate == null ? '—' : Math.round(rate * 100) + '%'; }
+function barRow(label, title, segments, total, note) {
+  const row = document.createElement('div');
+  row.className = 'flex items-center gap-2';
+  row.innerHTML = '<span class="w-28 truncate flex-shrink-0"></span><div class="flex-1 flex h-3 rounded overflow-hidden bg-slate-900"></div><span class="w-24 text-right flex-shrink-0"></span>';
+  row.firstChild.textContent = label;
+  row.firstChild.title = title || label;
+  for (const [cls, n, tip] of segments) {
+    const seg = document.createElement('div');
+    seg.className = cls;
+    seg.style.width = (100 * n / Math.max(1, total)) + '%';
+    seg.title = tip;
+    row.children[1].appendChild(seg);
+  }
+  row.lastChild.textContent = note;
+  return row;
+}
+function fill(id, rows, empty, render) {
+  const el = document.getElementById(id);
+  el.innerHTML = '';
+  if (!rows.length) { el.textContent = empty; return; }
+  rows.forEach(r => el.appendChild(render(r)));
+}
+
+async function loadProjects() {
+  const rows = await analyticsGet('projects');
+  if (!rows) return;
+  const select = document.getElementById('an-prompt-project'), keep = select.value;
+  select.length = 1;
+  rows.forEach(p => select.add(new Option(p.name, p.id)));
+  select.value = keep;
+  fill('an-projects', rows, 'No projects yet.', p => barRow(p.name, `${p.name} (${p.status})`, [
+    ['bg-green-500', p.complete, p.complete + ' complete'], ['bg-teal-500', p.rendered, p.rendered + ' rendered'],
+    ['bg-amber-500', p.in_progress, p.in_progress + ' in progress'], ['bg-slate-600', p.planned, p.planned + ' planned'],
+  ], p.jobs, `${pct(p.completion)} of ${p.jobs} · ${p.prompts_done}/${p.prompts} prompts`));
+}
+
+async function loadPrompts() {
+  const project = document.getElementById('an-prompt-project').value;
+  const rows = await analyticsGet('prompts?days=14' + (project ? '&project_id=' + project : ''));
+  if (!rows) return;
+  const days = {};
+  rows.forEach(r => (days[r.day] = days[r.day] || {})[r.status] = r.prompts);
+  const max = Math.max(1, ...Object.values(days).map(d => Object.values(d).reduce((a, n) => a + n, 0)));
+  const legend = document.getElementById('an-prompt-legend');
+  legend.innerHTML = '';
+  for (const [status, cls] of Object.entries(PROMPT_COLOURS)) {
+    const badge = document.createElement('span');
+    badge.className = 'flex items-center gap-1';
+    badge.innerHTML = `<span class="w-2 h-2 rounded-full ${cls}"></span>`;
+    badge.append(status);
+    legend.appendChild(badge);
+  }
+  fill('an-prompts', Object.entries(days), 'No prompt activity in the last 14 days.', ([day, counts]) =>
+    barRow(day, day, Object.entries(counts).map(([s, n]) => [PROMPT_COLOURS[s] || 'bg-indigo-500', n, n + ' ' + s]), max,
+      Object.values(counts).reduce((a, n) => a + n, 0) + ''));
+}
+
+async function loadApproval() {
+  const by = document.querySelector('input[name=an-by]:checked').value;
+  const rows = await analyticsGet('approval?by=' + by);
+  if (!rows) return;
+  fill('an-approval', rows.slice(0, 20), 'No media imported yet.', r => barRow(r.name, r.name, [
+    ['bg-green-500', r.approved, r.approved + ' approved'], ['bg-red-600', r.rejected, r.rejected + ' rejected'],
+    ['bg-slate-600', r.unreviewed, r.unreviewed + ' unreviewed'],
+  ], r.media, `${pct(r.approval_rate)} of ${r.approved + r.rejected}`));
+}
+
+async function loadIngredients() {
+  const order = document.querySelector('input[name=an-order]:checked').value;
+  const rows = await analyticsGet('ingredients?limit=20&order=' + order);
+  if (!rows) return;
+  const max = Math.max(1, ...rows.map(r => r.jobs));
+  fill('an-ingredients', rows, 'No ingredients yet.', r => barRow(r.code || r.name, `${r.name} (${r.category_name})`, [
+    ['bg-teal-500', r.rendered, r.rendered + ' rendered or complete'], ['bg-indigo-500', r.jobs - r.rendered, (r.jobs - r.rendered) + ' not yet rendered'],
+  ], max, `${r.jobs} jobs · ${pct(r.approval_rate)}`));
+}
+
+function loadAnalytics() {
+  loadProjects().then(loadPrompts);
+  loadApproval();
+  loadIngredients();
+}
+loadAnalytics();
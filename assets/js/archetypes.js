@@ -0,0 +1,19 @@
+function openEditArchetype(id, name, subtype, desc, tags, imgPath) {
+  document.getElementById('edit-archetype-form').action = '/archetypes/edit/' + id;
+  document.getElementById('ea-name').value = name;
+  document.getElementById('ea-desc').value = desc;
+  document.getElementById('ea-tags').value = tags;
+  document.getElementById('ea_concept').checked = subtype === 'concept';
+  document.getElementById('ea_meta').checked = subtype === 'meta';
+  const preview = document.getElementById('ea-img-preview');
+  const hiddenPath = document.getElementById('ea-img-path');
+  if (imgPath) {
+    preview.src = '/static/images/' + imgPath;
+    preview.classList.remove('hidden');
+    hiddenPath.value = imgPath;
+  } else {
+    preview.src = ''; preview.classList.add('hidden'); hiddenPath.value = '';
+  }
+  setupImageZone('ea-img-zone', 'ea-img-preview', 'ea-img-path');
+  openModal('edit-archetype-modal');
+}
@@ -0,0 +1,170 @@
+function openModal(id) { document.getElementById(id).showModal(); }
+function closeModal(id) { document.getElementById(id).close(); }
+
+// ─── Job Picker (typeahead over /api/jobs/lookup) ────────────────────────────
+// Markup: <div data-job-picker data-name="job_id" data-onpick="fnName"></div>
+// data-onresults="fnName" is called with the ids of each result list, for prefetching.
+function jobLabel(j) {
+  return '#' + j.id + ' — ' + (j.character_name || '?') + ' / ' + (j.output_type_name || '?');
+}
+
+function setupJobPicker(el) {
+  el.classList.add('relative');
+  el.innerHTML = '<input type="hidden"><input class="input ' + (el.dataset.inputClass || '') +
+    '" autocomplete="off" placeholder="' + (el.dataset.placeholder || 'Search job # or character…') + '"><div class="picker-menu hidden"></div>';
+  const [hidden, input, menu] = el.children;
+  hidden.name = el.dataset.name || 'job_id';
+  let timer = null, active = -1, results = [];
+
+  function pick(job) {
+    hidden.value = job ? job.id : '';
+    input.value = job ? jobLabel(job) : '';
+    menu.classList.add('hidden');
+    if (job && el.dataset.onpick && window[el.dataset.onpick]) window[el.dataset.onpick](job.id);
+  }
+  el.setJob = pick;
+
+  async function search() {
+    results = await fetch('/api/jobs/lookup?limit=15&q=' + encodeURIComponent(input.value)).then(r => r.json());
+    active = -1;
+    menu.innerHTML = '';
+    results.forEach((j, i) => {
+      const row = document.createElement('div');
+      row.textContent = jobLabel(j) + (j.status ? '  ·  ' + j.status : '');
+      row.onmousedown = e => { e.preventDefault(); pick(j); };
+      menu.appendChild(row);
+    });
+    menu.classList.toggle('hidden', !results.length);
+    if (el.dataset.onresults && window[el.dataset.onresults]) window[el.dataset.onresults](results.map(j => j.id));
+  }
+  input.addEventListener('input', () => { hidden.value = ''; clearTimeout(timer); timer = setTimeout(search, 150); });
+  input.addEventListener('focus', search);
+  input.addEventListener('blur', () => menu.classList.add('hidden'));
+  input.addEventListener('keydown', e => {
+    if (menu.classList.contains('hidden')) return;
+    if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+      e.preventDefault();
+      active = Math.max(0, Math.min(results.length - 1, active + (e.key === 'ArrowDown' ? 1 : -1)));
+      [...menu.children].forEach((r, i) => r.classList.toggle('active', i === active));
+    } else if (e.key === 'Enter' && active >= 0) {
+      e.preventDefault(); pick(results[active]);
+    } else if (e.key === 'Escape') {
+      menu.classList.add('hidden');
+    }
+  });
+}
+document.querySelectorAll('[data-job-picker]').forEach(setupJobPicker);
+
+// ─── Batch API (/api/batch) ──────────────────────────────────────────────────
+// prefetch({job: [ids], top_layer: [ids]}, {job: [fields]}) loads every id not
+// already requested in one call; batchGet(entity, id) waits on that call, or
+// fetches the one id if it was never prefetched.
+const batchCache = {};
+function prefetch(spec, fields = {}) {
+  const body = {}, need = {};
+  for (const [name, ids] of Object.entries(spec)) {
+    const cache = batchCache[name] = batchCache[name] || {};
+    need[name] = [...new Set(ids.map(Number))].filter(id => id && !(id in cache));
+    if (need[name].length) body[name] = {ids: need[name], fields: fields[name]};
+  }
+  if (!Object.keys(body).length) return Promise.resolve();
+  const req = fetch('/api/batch', {method: 'POST', headers: {'Content-Type': 'application/json'},
+                                   body: JSON.stringify(body)}).then(r => r.json());
+  for (const name of Object.keys(body)) {
+    need[name].forEach(id => { batchCache[name][id] = req.then(data => (data[name] || {})[id]); });
+  }
+  return req;
+}
+function batchGet(name, id, fields) {
+  prefetch({[name]: [id]}, fields ? {[name]: fields} : {});
+  return batchCache[name][Number(id)];
+}
+
+// ─── Global Image Upload Component ───────────────────────────────────────────
+// Called by archetype/character edit modals
+async function handleImageUpload(file, previewId, hiddenInputId) {
+  if (!file || !file.type.startsWith('image/')) return;
+  const reader = new FileReader();
+  reader.onload = async (e) => {
+    const b64 = e.target.result;
+    const res = await fetch('/upload-image', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({ image_b64: b64, mime: file.type })
+    });
+    const data = await res.json();
+    if (data.url) {
+      document.getElementById(previewId).src = data.url;
+      document.getElementById(previewId).classList.remove('hidden');
+      document.getElementById(hiddenInputId).value = data.filename;
+    }
+  };
+  reader.readAsDataURL(file);
+}
+
+function setupImageZone(zoneId, previewId, hiddenInputId) {
+  const zone = document.getElementById(zoneId);
+  if (!zone) return;
+
+  // Drag & drop
+  zone.addEventListener('dragover', e => { e.preventDefault(); zone.classList.add('border-indigo-500'); });
+  zone.addEventListener('dragleave', () => zone.classList.remove('border-indigo-500'));
+  zone.addEventListener('drop', e => {
+    e.preventDefault();
+    zone.classList.remove('border-indigo-500');
+    const file = e.dataTransfer.files[0];
+    handleImageUpload(file, previewId, hiddenInputId);
+  });
+
+  // Click to browse
+  zone.addEventListener('click', () => {
+    const inp = document.createElement('input');
+    inp.type = 'file'; inp.accept = 'image/*';
+    inp.onchange = () => handleImageUpload(inp.files[0], previewId, hiddenInputId);
+    inp.click();
+  });
+}
+
+// Global Ctrl+V paste — only works when an image zone is visible (modal open)
+document.addEventListener('paste', async (e) => {
+  const items = [...e.clipboardData.items];
+  const imgItem = items.find(i => i.type.startsWith('image/'));
+  if (!imgItem) return;
+  // Find whichever zone is currently visible
+  const zones = document.querySelectorAll('[data-image-zone]');
+  for (const zone of zones) {
+    if (zone.offsetParent !== null) { // visible
+      const previewId = zone.dataset.previewId;
+      const hiddenId = zone.dataset.hiddenId;
+      handleImageUpload(imgItem.getAsFile(), previewId, hiddenId);
+      break;
+    }
+  }
+});
+
+// ─── Similar Prompts (near-duplicate lookup over /api/prompts/similar) ───────
+// Renders matches into `box`; query is e.g. 'id=12' or 'text=' + encoded text.
+async function showSimilarPrompts(box, query) {
+  const data = await fetch('/api/prompts/similar?limit=8&' + query).then(r => r.json());
+  box.innerHTML = '';
+  box.classList.toggle('hidden', !data.results.length && !box.dataset.showEmpty);
+  if (!data.results.length) {
+    box.textContent = box.dataset.showEmpty ? 'No similar prompts.' : '';
+    return data.results;
+  }
+  data.results.forEach(p => {
+    const row = document.createElement('div');
+    row.className = 'flex items-start gap-2 py-1';
+    const pct = document.createElement('span');
+    pct.className = 'badge ' + (p.similarity >= 0.9 ? 'badge-red' : 'badge-orange');
+    pct.textContent = Math.round(p.similarity * 100) + '%';
+    const text = document.createElement('a');
+    text.className = 'text-xs text-slate-400 hover:text-slate-200 flex-1 min-w-0 truncate';
+    text.href = p.source === 'media' ? '/media' : (p.project_id ? '/journal?project_id=' + p.project_id : '/prompt-library');
+    text.textContent = (p.source === 'media' ? '🎬 ' : '#' + p.id + ' ') + (p.label ? p.label + ' — ' : '') + p.text;
+    text.title = p.text;
+    row.append(pct, text);
+    box.appendChild(row);
+  });
+  return data.results;
+}
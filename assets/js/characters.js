@@ -0,0 +1,20 @@
+function openEditCharacter(id, name, archetypeId, status, desc, visual, tags, imgPath) {
+  document.getElementById('edit-character-form').action = '/characters/edit/' + id;
+  document.getElementById('ec-name').value = name;
+  document.getElementById('ec-archetype').value = archetypeId;
+  document.getElementById('ec-status').value = status;
+  document.getElementById('ec-desc').value = desc;
+  document.getElementById('ec-visual').value = visual;
+  document.getElementById('ec-tags').value = tags;
+  const preview = document.getElementById('ec-img-preview');
+  const hiddenPath = document.getElementById('ec-img-path');
+  if (imgPath) {
+    preview.src = '/static/images/' + imgPath;
+    preview.classList.remove('hidden');
+    hiddenPath.value = imgPath;
+  } else {
+    preview.src = ''; preview.classList.add('hidden'); hiddenPath.value = '';
+  }
+  setupImageZone('ec-img-zone', 'ec-img-preview', 'ec-img-path');
+  openModal('edit-character-modal');
+}
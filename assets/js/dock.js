@@ -0,0 +1,172 @@
+let selectedJobId = null;
+let selectedFilePath = null;
+
+function switchTab(tab) {
+  document.querySelectorAll('.tab').forEach((t,i) => {
+    t.classList.toggle('active', ['jobs','prompts','submit','links'][i] === tab);
+  });
+  document.querySelectorAll('.pane').forEach((p,i) => {
+    p.classList.toggle('active', ['pane-jobs','pane-prompts','pane-submit','pane-links'][i] === 'pane-'+tab);
+  });
+}
+
+function selectJob(id, charName, otName) {
+  document.querySelectorAll('.job-item').forEach(el => el.classList.remove('selected'));
+  const el = document.getElementById('jitem-' + id);
+  if (el) el.classList.add('selected');
+  selectedJobId = id;
+  document.getElementById('selected-job-info').textContent = '#' + id + ' — ' + charName + ' / ' + otName;
+  document.getElementById('selected-job-info').style.color = '#a5b4fc';
+  updateSubmitBtn();
+  loadPrompts(id);
+}
+
+function updateSubmitBtn() {
+  const btn = document.getElementById('submit-btn');
+  const ready = selectedJobId && selectedFilePath;
+  btn.disabled = !ready;
+  btn.style.background = ready ? '#4f46e5' : '#1e293b';
+  btn.style.color = ready ? 'white' : '#64748b';
+  btn.style.cursor = ready ? 'pointer' : 'not-allowed';
+  btn.style.borderColor = ready ? '#6366f1' : '#334155';
+}
+
+async function loadPrompts(jobId) {
+  document.getElementById('prompt-pane-title').textContent = 'Prompts for Job #' + jobId;
+  const res = await fetch('/api/dock/job-prompts/' + jobId);
+  const prompts = await res.json();
+  const list = document.getElementById('prompt-list');
+  if (!prompts.length) {
+    list.innerHTML = '<div style="color:#475569;font-size:0.72rem;padding:8px 0;">No prompts linked to this job or its project.</div>';
+    return;
+  }
+  list.innerHTML = prompts.map(p => {
+    const statusClass = p.status;
+    const actions = [
+      { icon: '📋', title: 'Copy', onclick: `copyPromptDock(${p.id}, this)` },
+      { icon: '✓', title: 'Done', onclick: `setStatus(${p.id},'done',this)` },
+      { icon: '↺', title: 'Reset', onclick: `setStatus(${p.id},'pending',this)` },
+      { icon: '!', title: 'Flag', onclick: `setStatus(${p.id},'flagged',this)` },
+    ].map(a => `<button onclick="${a.onclick}" title="${a.title}" style="background:#1e293b;border:none;border-radius:3px;color:#64748b;font-size:0.65rem;padding:2px 4px;cursor:pointer;">${a.icon}</button>`).join('');
+
+    const label = p.label ? `<div style="font-size:0.62rem;color:#475569;text-transform:uppercase;letter-spacing:0.05em;margin-bottom:2px;">${p.label}</div>` : '';
+    return `<div class="prompt-item ${statusClass}" id="dp-${p.id}" data-status="${p.status}">
+      ${label}
+      <div class="prompt-text ${statusClass}">${escHtml(p.text)}</div>
+      <div style="display:flex;gap:3px;margin-top:4px;">${actions}</div>
+    </div>`;
+  }).join('');
+}
+
+function escHtml(s) {
+  return s.replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;');
+}
+
+async function copyPromptDock(id, btn) {
+  const card = document.getElementById('dp-' + id);
+  const text = card.querySelector('.prompt-text').textContent.trim();
+  await navigator.clipboard.writeText(text);
+  if (card.dataset.status === 'pending') await setStatus(id, 'collected', btn);
+  showToast('Copied to clipboard!');
+}
+
+async function setStatus(id, status, btn) {
+  await fetch('/api/prompts/status/' + id, {
+    method: 'POST', headers: {'Content-Type':'application/json'},
+    body: JSON.stringify({status})
+  });
+  const card = document.getElementById('dp-' + id);
+  if (card) {
+    card.dataset.status = status;
+    card.className = 'prompt-item ' + status;
+    const txt = card.querySelector('.prompt-text');
+    txt.className = 'prompt-text ' + status;
+  }
+}
+
+function onDragOver(e) {
+  e.preventDefault();
+  document.getElementById('drop-zone').classList.add('drag-over');
+}
+function onDragLeave() {
+  document.getElementById('drop-zone').classList.remove('drag-over');
+}
+function onDrop(e) {
+  e.preventDefault();
+  const zone = document.getElementById('drop-zone');
+  zone.classList.remove('drag-over');
+  const file = e.dataTransfer.files[0];
+  if (file) setDroppedFile(file.path || file.name);
+}
+function browseFile() {
+  const inp = document.createElement('input');
+  inp.type = 'file'; inp.accept = 'video/*,image/*';
+  inp.onchange = () => { if (inp.files[0]) setDroppedFile(inp.files[0].name); };
+  inp.click();
+}
+function setDroppedFile(path) {
+  selectedFilePath = path;
+  const zone = document.getElementById('drop-zone');
+  zone.textContent = '✓ ' + path.split(/[\\/]/).pop();
+  zone.classList.add('success');
+  const fn = document.getElementById('drop-filename');
+  fn.textContent = path; fn.style.display = '';
+  document.getElementById('submit-filepath').value = path;
+  updateSubmitBtn();
+}
+
+async function submitMedia() {
+  if (!selectedJobId || !selectedFilePath) return;
+  const btn = document.getElementById('submit-btn');
+  btn.textContent = 'Submitting…'; btn.disabled = true;
+  const fd = new FormData();
+  fd.append('job_id', selectedJobId);
+  fd.append('file_path', selectedFilePath);
+  const res = await fetch('/api/dock/submit-media', { method: 'POST', body: fd });
+  const data = await res.json();
+  if (data.ok) {
+    showToast('Media submitted: ' + (data.title || 'done'));
+    // Reset
+    selectedJobId = null; selectedFilePath = null;
+    document.getElementById('drop-zone').textContent = 'Drop a file here or click to browse';
+    document.getElementById('drop-zone').classList.remove('success');
+    document.getElementById('drop-filename').style.display = 'none';
+    document.getElementById('selected-job-info').textContent = 'No job selected.';
+    document.getElementById('selected-job-info').style.color = '#64748b';
+    document.querySelectorAll('.job-item').forEach(el => el.classList.remove('selected'));
+    btn.textContent = 'Submit & Close Job';
+    updateSubmitBtn();
+    refreshJobs();
+  }
+}
+
+async function refreshJobs() {
+  const pid = document.getElementById('project-select').value;
+  const res = await fetch('/api/dock/jobs' + (pid ? '?project_id=' + pid : ''));
+  const jobs = await res.json();
+  const list = document.getElementById('job-list');
+  if (!jobs.length) { list.innerHTML = '<div style="color:#475569;font-size:0.72rem;padding:8px 0;">No outstanding jobs.</div>'; return; }
+  list.innerHTML = jobs.map(j => `<div class="job-item" id="jitem-${j.id}" onclick="selectJob(${j.id},'${escHtml(j.character_name||'')}','${escHtml(j.output_type_name||'')}')">
+    <div class="job-name">${escHtml(j.character_name||'(no character)')}</div>
+    <div class="job-sub">${escHtml(j.output_type_name||'—')} · #${j.id} · ${j.status}</div>
+  </div>`).join('');
+}
+
+async function onProjectChange(pid) {
+  await refreshJobs();
+}
+
+function showToast(msg) {
+  const t = document.getElementById('toast');
+  t.textContent = msg; t.style.display = '';
+  setTimeout(() => t.style.display = 'none', 2500);
+}
+function openSettings() { document.getElementById('settings-overlay').style.display = ''; }
+function closeSettings() { document.getElementById('settings-overlay').style.display = 'none'; }
+async function saveDockConfig(e) {
+  e.preventDefault();
+  const fd = new FormData(e.target);
+  await fetch('/dock/config', { method: 'POST', body: fd });
+  closeSettings();
+  showToast('Dock links saved.');
+}
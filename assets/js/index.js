@@ -0,0 +1,141 @@
+let comboState = { character: null, output_type: null, ingredients: [], locked: {} };
+// locked keys: 'char', 'ot', or 'ing_cat_ID'
+
+async function rollCombo() {
+  const params = new URLSearchParams();
+  if (comboState.locked.char && comboState.character) params.append('char_id', comboState.character.id);
+  if (comboState.locked.ot && comboState.output_type) params.append('ot_id', comboState.output_type.id);
+  comboState.ingredients.forEach(ing => {
+    const key = 'ing_cat_' + ing.category.id;
+    if (comboState.locked[key] && ing.ingredient) params.append('ing_id', ing.ingredient.id);
+  });
+
+  const res = await fetch('/api/random-combo?' + params.toString());
+  const data = await res.json();
+  comboState.character = data.character;
+  comboState.output_type = data.output_type;
+  comboState.ingredients = data.ingredients;
+  renderWidget();
+}
+
+async function fillGap() {
+  const params = new URLSearchParams({k: 1});
+  if (comboState.locked.char && comboState.character) params.append('char_id', comboState.character.id);
+  if (comboState.locked.ot && comboState.output_type) params.append('ot_id', comboState.output_type.id);
+  const data = await (await fetch('/api/planner/propose?' + params.toString())).json();
+  if (!data.jobs.length) return;
+  Object.assign(comboState, data.jobs[0]);
+  renderWidget();
+}
+
+function renderWidget() {
+  const empty = document.getElementById('ideation-empty');
+  const result = document.getElementById('ideation-result');
+  const createBtn = document.getElementById('create-job-btn');
+  if (!comboState.character && !comboState.output_type) return;
+  empty.classList.add('hidden');
+  result.classList.remove('hidden');
+  createBtn.classList.remove('hidden');
+
+  let html = '';
+  // Character row
+  const charLocked = !!comboState.locked.char;
+  html += `<div class="flex items-center justify-between bg-slate-900 rounded-lg px-3 py-2 gap-2">
+    <div class="flex-1">
+      <div class="text-xs text-slate-500 uppercase tracking-wider">Character</div>
+      <div class="text-slate-100 font-semibold">${comboState.character ? comboState.character.name : '—'}</div>
+    </div>
+    <div class="flex gap-1.5 flex-shrink-0">
+      <button onclick="toggleLock('char')" class="btn btn-sm ${charLocked ? 'btn-secondary' : 'btn-ghost'}">${charLocked ? '🔒' : '🔓'}</button>
+      <button onclick="rerollChar()" class="btn btn-sm btn-ghost">🎲</button>
+    </div>
+  </div>`;
+
+  // Output type row
+  const otLocked = !!comboState.locked.ot;
+  html += `<div class="flex items-center justify-between bg-slate-900 rounded-lg px-3 py-2 gap-2">
+    <div class="flex-1">
+      <div class="text-xs text-slate-500 uppercase tracking-wider">Output Type</div>
+      <div class="text-slate-100 font-semibold">${comboState.output_type ? comboState.output_type.name : '—'}</div>
+    </div>
+    <div class="flex gap-1.5 flex-shrink-0">
+      <button onclick="toggleLock('ot')" class="btn btn-sm ${otLocked ? 'btn-secondary' : 'btn-ghost'}">${otLocked ? '🔒' : '🔓'}</button>
+      <button onclick="rerollOt()" class="btn btn-sm btn-ghost">🎲</button>
+    </div>
+  </div>`;
+
+  // Ingredients
+  comboState.ingredients.forEach(item => {
+    const key = 'ing_cat_' + item.category.id;
+    const locked = !!comboState.locked[key];
+    const ingName = item.ingredient ? (item.ingredient.code ? `[${item.ingredient.code}] ` : '') + item.ingredient.name : '— (none available)';
+    html += `<div class="flex items-center justify-between bg-slate-900 rounded-lg px-3 py-2 gap-2">
+      <div class="flex-1">
+        <div class="text-xs text-slate-500 uppercase tracking-wider">${item.category.name}</div>
+        <div class="text-slate-100 font-semibold">${ingName}</div>
+      </div>
+      <div class="flex gap-1.5 flex-shrink-0">
+        <button onclick="toggleLock('${key}')" class="btn btn-sm ${locked ? 'btn-secondary' : 'btn-ghost'}">${locked ? '🔒' : '🔓'}</button>
+        <button onclick="rerollIng(${item.category.id})" class="btn btn-sm btn-ghost">🎲</button>
+      </div>
+    </div>`;
+  });
+
+  result.innerHTML = html;
+}
+
+function toggleLock(key) {
+  comboState.locked[key] = !comboState.locked[key];
+  renderWidget();
+}
+
+async function rerollChar() {
+  const wasLocked = comboState.locked.char;
+  comboState.locked.char = false;
+  // Lock everything else
+  const otLocked = comboState.locked.ot;
+  const ingLocks = {...comboState.locked};
+  await rollCombo();
+  if (wasLocked === false) comboState.locked.char = false;
+}
+
+async function rerollOt() {
+  comboState.locked.ot = false;
+  const charState = comboState.character;
+  const prevCharLocked = comboState.locked.char;
+  comboState.locked.char = true;
+  await rollCombo();
+  if (!prevCharLocked) comboState.locked.char = false;
+}
+
+async function rerollIng(catId) {
+  const key = 'ing_cat_' + catId;
+  comboState.locked[key] = false;
+  // Lock char and ot
+  const prevChar = comboState.locked.char;
+  const prevOt = comboState.locked.ot;
+  comboState.locked.char = true;
+  comboState.locked.ot = true;
+  comboState.ingredients.forEach(i => {
+    if (i.category.id !== catId) comboState.locked['ing_cat_'+i.category.id] = true;
+  });
+  await rollCombo();
+  comboState.locked.char = prevChar;
+  comboState.locked.ot = prevOt;
+  comboState.ingredients.forEach(i => {
+    if (i.category.id !== catId) delete comboState.locked['ing_cat_'+i.category.id];
+  });
+}
+
+function createJobFromCombo() {
+  const form = document.createElement('form');
+  form.method = 'POST';
+  form.action = '/jobs/builder';
+  const add = (name, val) => { const i = document.createElement('input'); i.type='hidden'; i.name=name; i.value=val; form.appendChild(i); };
+  if (comboState.character) add('character_id', comboState.character.id);
+  if (comboState.output_type) add('output_type_id', comboState.output_type.id);
+  comboState.ingredients.forEach(item => { if (item.ingredient) add('ingredient_ids', item.ingredient.id); });
+  add('status', 'planned');
+  document.body.appendChild(form);
+  form.submit();
+}
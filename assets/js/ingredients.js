@@ -0,0 +1,27 @@
+function showTab(id) {
+  document.getElementById('tab-ingredients').classList.add('hidden');
+  document.getElementById('tab-rules').classList.add('hidden');
+  document.getElementById(id).classList.remove('hidden');
+}
+function openEditCategory(id, name, desc) {
+  document.getElementById('edit-category-form').action = '/ingredients/categories/edit/' + id;
+  document.getElementById('ecat-name').value = name;
+  document.getElementById('ecat-desc').value = desc;
+  openModal('edit-category-modal');
+}
+function openEditIngredient(id, catId, code, name, desc) {
+  document.getElementById('edit-ingredient-form').action = '/ingredients/edit/' + id;
+  document.getElementById('ei-cat').value = catId;
+  document.getElementById('ei-code').value = code;
+  document.getElementById('ei-name').value = name;
+  document.getElementById('ei-desc').value = desc;
+  openModal('edit-ingredient-modal');
+}
+function updateSourcePicker(val) {
+  document.getElementById('source-ingredient-picker').classList.toggle('hidden', val !== 'ingredient');
+  document.getElementById('source-category-picker').classList.toggle('hidden', val !== 'category');
+}
+function updateTargetPicker(val) {
+  document.getElementById('target-ingredient-picker').classList.toggle('hidden', val !== 'ingredient');
+  document.getElementById('target-category-picker').classList.toggle('hidden', val !== 'category');
+}
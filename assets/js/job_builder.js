@@ -0,0 +1,76 @@
+async function loadRequirements(otId) {
+  const section = document.getElementById('ingredients-section');
+  const allSection = document.getElementById('all-ingredients-section');
+  const pickers = document.getElementById('ingredient-pickers');
+
+  if (!otId) {
+    section.classList.add('hidden');
+    allSection.classList.remove('hidden');
+    return;
+  }
+
+  const reqs = ((await batchGet('output_type', otId)) || {}).requirements || [];
+
+  if (reqs.length === 0) {
+    section.classList.add('hidden');
+    allSection.classList.remove('hidden');
+    return;
+  }
+
+  allSection.classList.add('hidden');
+  section.classList.remove('hidden');
+
+  let html = '';
+  reqs.forEach(req => {
+    html += `<div>
+      <div class="flex items-center gap-2 mb-2">
+        <span class="text-slate-300 font-medium text-sm">${req.category.name}</span>
+        <span class="badge badge-purple text-xs">Required</span>
+      </div>
+      <div class="grid grid-cols-2 gap-1.5">`;
+    req.ingredients.forEach(ing => {
+      html += `<label class="flex items-center gap-2 bg-slate-900 rounded px-3 py-2 cursor-pointer hover:bg-slate-800 text-slate-300 text-sm">
+        <input type="checkbox" name="ingredient_ids" value="${ing.id}" class="accent-indigo-500">
+        ${ing.code ? '<span class="text-slate-500 font-mono text-xs">' + ing.code + '</span>' : ''}
+        ${ing.name}
+      </label>`;
+    });
+    html += `</div></div>`;
+  });
+
+  pickers.innerHTML = html;
+}
+// Requirements of every output type in one request, so switching types is instant
+document.addEventListener('DOMContentLoaded', () =>
+  prefetch({output_type: [...document.querySelectorAll('#ot-select option')].map(o => o.value).filter(Boolean)},
+           {output_type: ['requirements']}));
+
+let plannedJobs = [];
+
+async function proposePlan() {
+  const params = new URLSearchParams({k: document.getElementById('plan-k').value});
+  const ot = document.getElementById('plan-ot').value;
+  if (ot) params.append('ot_id', ot);
+  const data = await (await fetch('/api/planner/propose?' + params)).json();
+  plannedJobs = data.jobs;
+  const esc = s => String(s).replace(/[&<>"]/g, c => ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;'}[c]));
+  document.getElementById('plan-rows').innerHTML = plannedJobs.slice(0, 200).map(j => `<tr>
+    <td class="text-slate-200">${esc(j.character.name)}</td>
+    <td class="text-slate-400 text-xs">${esc(j.output_type.name)}</td>
+    <td class="text-slate-400 text-xs">${j.ingredients.map(i => esc(i.ingredient.name)).join(', ') || '—'}</td></tr>`).join('');
+  document.getElementById('plan-summary').textContent = plannedJobs.length
+    ? `${data.new.ingredients_new} unused ingredients, ${data.new.char_ingredient_pairs_new} new character × ingredient and ${data.new.ingredient_pairs_new} new ingredient pairings` + (plannedJobs.length > 200 ? ' · showing first 200' : '')
+    : 'Nothing to plan — add characters and output types with ingredients first.';
+  const btn = document.getElementById('plan-create');
+  btn.textContent = `✚ Create ${plannedJobs.length} Jobs`;
+  btn.classList.toggle('hidden', !plannedJobs.length);
+  document.getElementById('plan-result').classList.remove('hidden');
+}
+
+async function createPlan() {
+  const jobs = plannedJobs.map(j => ({character_id: j.character.id, output_type_id: j.output_type.id,
+                                      ingredient_ids: j.ingredients.map(i => i.ingredient.id)}));
+  const res = await fetch('/jobs/planner/create', {method: 'POST', headers: {'Content-Type': 'application/json'},
+                                                   body: JSON.stringify({jobs})});
+  if (res.ok) window.location = '/jobs?status=planned';
+}
@@ -0,0 +1,30 @@
+function openEditJob(id, charId, otId, status, notes) {
+  document.getElementById('edit-job-form').action = '/jobs/edit/' + id;
+  document.getElementById('ej-char').value = charId;
+  document.getElementById('ej-ot').value = otId;
+  document.getElementById('ej-status').value = status;
+  document.getElementById('ej-notes').value = notes;
+  openModal('edit-job-modal');
+}
+function bulkJobBoxes() {
+  return document.querySelectorAll('input[form="bulk-jobs"][name="ids"]');
+}
+function updateBulkJobs() {
+  const n = [...bulkJobBoxes()].filter(b => b.checked).length;
+  const btn = document.getElementById('bulk-jobs-btn');
+  btn.disabled = !n;
+  btn.textContent = n ? `Delete ${n} selected` : 'Delete selected';
+}
+function selectAllJobs(checked) {
+  bulkJobBoxes().forEach(b => { b.checked = checked; });
+  updateBulkJobs();
+}
+function confirmBulkDelete() {
+  const n = [...bulkJobBoxes()].filter(b => b.checked).length;
+  return confirm(`Delete ${n} job${n === 1 ? '' : 's'} with their ingredient, project and top-layer links? Linked media and prompts are kept.`);
+}
+// Auto-open link media if coming from job
+const params = new URLSearchParams(window.location.search);
+if (params.get('link_job')) {
+  // scroll to media note
+}
@@ -0,0 +1,40 @@
+// What the import form and job picker read from /api/batch
+const IMPORT_JOB_FIELDS = ['id', 'status', 'character_name', 'output_type_name', 'character_id', 'output_type_id',
+                           'auto_title', 'auto_tags'];
+function prefetchJobs(ids) { prefetch({job: ids}, {job: IMPORT_JOB_FIELDS}); }
+async function prefillFromJob(jobId) {
+  if (!jobId) return;
+  const data = await batchGet('job', jobId, IMPORT_JOB_FIELDS);
+  if (!data) return;
+  if (data.auto_title) document.getElementById('import-title').value = data.auto_title;
+  if (data.auto_tags) document.getElementById('import-tags').value = data.auto_tags;
+  if (data.character_id) document.getElementById('import-char-id').value = data.character_id;
+  if (data.output_type_id) document.getElementById('import-ot-id').value = data.output_type_id;
+}
+async function openQuickImport(jobId) {
+  const job = await batchGet('job', jobId, IMPORT_JOB_FIELDS);
+  if (job) document.getElementById('import-job-picker').setJob(job);
+  openModal('import-modal');
+}
+function openEditMedia(id, title, path, desc, tags, seoTitle, seoDesc, status, notes, prompt) {
+  document.getElementById('edit-media-form').action = '/media/edit/' + id;
+  document.getElementById('em-title').value = title;
+  document.getElementById('em-path').value = path;
+  document.getElementById('em-desc').value = desc;
+  document.getElementById('em-tags').value = tags;
+  document.getElementById('em-seo-title').value = seoTitle;
+  document.getElementById('em-seo-desc').value = seoDesc;
+  document.getElementById('em-status').value = status;
+  document.getElementById('em-notes').value = notes;
+  document.getElementById('em-prompt').value = prompt || '';
+  openModal('edit-media-modal');
+}
+// Auto-open quick import if referred from jobs page
+const params = new URLSearchParams(window.location.search);
+const linkJob = params.get('link_job');
+// base.js loads after page scripts
+document.addEventListener('DOMContentLoaded', () => {
+  // Jobs awaiting media, in one request, so Link File opens already filled in
+  prefetchJobs([...document.querySelectorAll('[data-prefetch-job]')].map(el => el.dataset.prefetchJob).concat(linkJob || []));
+  if (linkJob) { openQuickImport(parseInt(linkJob)); }
+});
@@ -0,0 +1,6 @@
+function openEditOt(id, name, desc) {
+  document.getElementById('edit-ot-form').action = '/output-types/edit/' + id;
+  document.getElementById('eot-name').value = name;
+  document.getElementById('eot-desc').value = desc;
+  openModal('edit-ot-modal');
+}
@@ -0,0 +1,8 @@
+function openEditProject(id, name, desc, status, notes) {
+  document.getElementById('edit-project-form').action = '/projects/edit/' + id;
+  document.getElementById('ep-name').value = name;
+  document.getElementById('ep-desc').value = desc;
+  document.getElementById('ep-status').value = status;
+  document.getElementById('ep-notes').value = notes;
+  openModal('edit-project-modal');
+}
@@ -0,0 +1,20 @@
+async function copyText(el, id) {
+  await navigator.clipboard.writeText(el.textContent.trim());
+  const orig = el.style.outline;
+  el.style.outline = '2px solid #6366f1';
+  setTimeout(() => el.style.outline = orig, 500);
+}
+function filterPrompts(query) {
+  const q = query.toLowerCase();
+  document.querySelectorAll('.prompt-item').forEach(el => {
+    const match = el.dataset.text.includes(q) || el.dataset.label.includes(q);
+    el.style.display = match ? '' : 'none';
+  });
+}
+function toggleSimilar(id) {
+  const box = document.getElementById('similar-' + id);
+  if (!box.classList.contains('hidden')) { box.classList.add('hidden'); return; }
+  box.textContent = 'Looking…';
+  box.classList.remove('hidden');
+  showSimilarPrompts(box, 'id=' + id);
+}
@@ -0,0 +1,27 @@
+function openEditTop(id, title, path, desc, tags, seoTitle, seoDesc, notes) {
+  document.getElementById('edit-top-form').action = '/top-layer/edit/' + id;
+  document.getElementById('et-title').value = title;
+  document.getElementById('et-path').value = path;
+  document.getElementById('et-desc').value = desc;
+  document.getElementById('et-tags').value = tags;
+  document.getElementById('et-seo-title').value = seoTitle;
+  document.getElementById('et-seo-desc').value = seoDesc;
+  document.getElementById('et-notes').value = notes;
+  openModal('edit-top-modal');
+}
+
+async function generateMeta(topId) {
+  document.getElementById('meta-chars').textContent = 'Loading...';
+  document.getElementById('meta-tags').textContent = '';
+  document.getElementById('meta-desc').textContent = '';
+  document.getElementById('meta-seo').textContent = '';
+  openModal('meta-modal');
+  const data = await batchGet('top_layer', topId) || {};
+  document.getElementById('meta-chars').textContent = data.characters || '(none)';
+  document.getElementById('meta-tags').textContent = data.tags || '(none)';
+  document.getElementById('meta-desc').textContent = data.description || '(none)';
+  document.getElementById('meta-seo').textContent = data.seo_description || '(none)';
+}
+// Every clip's metadata in one request up front (once base.js has loaded)
+document.addEventListener('DOMContentLoaded', () =>
+  prefetch({top_layer: [...document.querySelectorAll('[data-clip-id]')].map(el => el.dataset.clipId)}));
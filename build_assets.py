@@ -0,0 +1,400 @@
+"""Offline static bundle for the web UI.
+
+The templates used to load Tailwind's Play CDN, which compiles classes in the
+browser and leaves air-gapped render boxes waiting on a network timeout
+before anything renders. build() does the same job locally: it scans the
+templates and scripts for class names, writes CSS for the Tailwind utilities
+actually used, and bundles it with the hand-written CSS and JS in assets/.
+Every bundle is written to static/dist as <name>.<hash>.<ext> with gzip (and,
+if the brotli package is installed, brotli) copies next to it, so app.py can
+serve it with immutable cache headers.
+
+Run `python build_assets.py` to rebuild by hand; app.py rebuilds on startup.
+"""
+import glob, gzip, hashlib, json, os, re
+
+try:
+    import brotli
+except ImportError:   # optional: without it only gzip copies are written
+    brotli = None
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(HERE, 'assets')
+TEMPLATE_DIR = os.path.join(HERE, 'templates')
+DIST_DIR = os.path.join(HERE, 'static', 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+# CSS bundles are lists of parts; '@preflight' and '@utilities' are generated.
+CSS_BUNDLES = {
+    'app.css': ['@preflight', 'base.css', '@utilities'],
+    'dock.css': ['@preflight', 'dock.css', '@utilities'],
+}
+COMPRESSIBLE = ('.css', '.js')
+
+# ─── Utility CSS ──────────────────────────────────────────────────────────────
+# A subset of Tailwind v3 with its default theme: enough to cover every class
+# the templates use. Tokens that are not utilities are ignored, so scanning
+# whole files (markup and JS string literals alike) is safe.
+
+PALETTE = {
+    'slate': '#f8fafc #f1f5f9 #e2e8f0 #cbd5e1 #94a3b8 #64748b #475569 #334155 #1e293b #0f172a #020617',
+    'gray': '#f9fafb #f3f4f6 #e5e7eb #d1d5db #9ca3af #6b7280 #4b5563 #374151 #1f2937 #111827 #030712',
+    'red': '#fef2f2 #fee2e2 #fecaca #fca5a5 #f87171 #ef4444 #dc2626 #b91c1c #991b1b #7f1d1d #450a0a',
+    'orange': '#fff7ed #ffedd5 #fed7aa #fdba74 #fb923c #f97316 #ea580c #c2410c #9a3412 #7c2d12 #431407',
+    'amber': '#fffbeb #fef3c7 #fde68a #fcd34d #fbbf24 #f59e0b #d97706 #b45309 #92400e #78350f #451a03',
+    'yellow': '#fefce8 #fef9c3 #fef08a #fde047 #facc15 #eab308 #ca8a04 #a16207 #854d0e #713f12 #422006',
+    'green': '#f0fdf4 #dcfce7 #bbf7d0 #86efac #4ade80 #22c55e #16a34a #15803d #166534 #14532d #052e16',
+    'emerald': '#ecfdf5 #d1fae5 #a7f3d0 #6ee7b7 #34d399 #10b981 #059669 #047857 #065f46 #064e3b #022c22',
+    'teal': '#f0fdfa #ccfbf1 #99f6e4 #5eead4 #2dd4bf #14b8a6 #0d9488 #0f766e #115e59 #134e4a #042f2e',
+    'cyan': '#ecfeff #cffafe #a5f3fc #67e8f9 #22d3ee #06b6d4 #0891b2 #0e7490 #155e75 #164e63 #083344',
+    'sky': '#f0f9ff #e0f2fe #bae6fd #7dd3fc #38bdf8 #0ea5e9 #0284c7 #0369a1 #075985 #0c4a6e #082f49',
+    'blue': '#eff6ff #dbeafe #bfdbfe #93c5fd #60a5fa #3b82f6 #2563eb #1d4ed8 #1e40af #1e3a8a #172554',
+    'indigo': '#eef2ff #e0e7ff #c7d2fe #a5b4fc #818cf8 #6366f1 #4f46e5 #4338ca #3730a3 #312e81 #1e1b4b',
+    'violet': '#f5f3ff #ede9fe #ddd6fe #c4b5fd #a78bfa #8b5cf6 #7c3aed #6d28d9 #5b21b6 #4c1d95 #2e1065',
+    'purple': '#faf5ff #f3e8ff #e9d5ff #d8b4fe #c084fc #a855f7 #9333ea #7e22ce #6b21a8 #581c87 #3b0764',
+    'pink': '#fdf2f8 #fce7f3 #fbcfe8 #f9a8d4 #f472b6 #ec4899 #db2777 #be185d #9d174d #831843 #500724',
+    'rose': '#fff1f2 #ffe4e6 #fecdd3 #fda4af #fb7185 #f43f5e #e11d48 #be123c #9f1239 #881337 #4c0519',
+}
+SHADES = ('50', '100', '200', '300', '400', '500', '600', '700', '800', '900', '950')
+COLORS = {f'{family}-{shade}': hex_ for family, values in PALETTE.items()
+          for shade, hex_ in zip(SHADES, values.split())}
+COLORS.update({'white': '#fff', 'black': '#000', 'transparent': 'transparent', 'current': 'currentColor'})
+
+TRANSITION = 'transition-timing-function:cubic-bezier(0.4,0,0.2,1);transition-duration:150ms'
+MONO = 'ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono","Courier New",monospace'
+
+# name -> (group, declarations). Groups give the output order, which follows
+# Tailwind's so that e.g. leading-* overrides the line-height set by text-*.
+STATIC = {
+    'static': (0, 'position:static'), 'fixed': (0, 'position:fixed'), 'absolute': (0, 'position:absolute'),
+    'relative': (0, 'position:relative'), 'sticky': (0, 'position:sticky'),
+    'block': (4, 'display:block'), 'inline-block': (4, 'display:inline-block'), 'inline': (4, 'display:inline'),
+    'flex': (4, 'display:flex'), 'inline-flex': (4, 'display:inline-flex'), 'table': (4, 'display:table'),
+    'grid': (4, 'display:grid'), 'contents': (4, 'display:contents'), 'hidden': (4, 'display:none'),
+    'w-full': (5, 'width:100%'), 'w-auto': (5, 'width:auto'), 'w-screen': (5, 'width:100vw'),
+    'h-full': (5, 'height:100%'), 'h-auto': (5, 'height:auto'), 'h-screen': (5, 'height:100vh'),
+    'min-h-screen': (5, 'min-height:100vh'), 'min-h-full': (5, 'min-height:100%'),
+    'min-w-0': (5, 'min-width:0px'), 'min-w-full': (5, 'min-width:100%'), 'max-w-full': (5, 'max-width:100%'),
+    'max-w-xs': (5, 'max-width:20rem'), 'max-w-sm': (5, 'max-width:24rem'), 'max-w-md': (5, 'max-width:28rem'),
+    'max-w-lg': (5, 'max-width:32rem'), 'max-w-xl': (5, 'max-width:36rem'), 'max-w-2xl': (5, 'max-width:42rem'),
+    'max-w-3xl': (5, 'max-width:48rem'), 'max-w-4xl': (5, 'max-width:56rem'), 'max-w-5xl': (5, 'max-width:64rem'),
+    'flex-1': (6, 'flex:1 1 0%'), 'flex-auto': (6, 'flex:1 1 auto'), 'flex-none': (6, 'flex:none'),
+    'flex-shrink-0': (6, 'flex-shrink:0'), 'shrink-0': (6, 'flex-shrink:0'),
+    'flex-grow': (6, 'flex-grow:1'), 'grow': (6, 'flex-grow:1'),
+    'cursor-pointer': (7, 'cursor:pointer'), 'cursor-default': (7, 'cursor:default'),
+    'select-none': (7, 'user-select:none'), 'select-text': (7, 'user-select:text'),
+    'list-inside': (7, 'list-style-position:inside'), 'list-decimal': (7, 'list-style-type:decimal'),
+    'list-disc': (7, 'list-style-type:disc'), 'list-none': (7, 'list-style-type:none'),
+    'col-span-full': (7, 'grid-column:1 / -1'),
+    'flex-row': (8, 'flex-direction:row'), 'flex-col': (8, 'flex-direction:column'), 'flex-wrap': (8, 'flex-wrap:wrap'),
+    'items-start': (8, 'align-items:flex-start'), 'items-end': (8, 'align-items:flex-end'),
+    'items-center': (8, 'align-items:center'), 'items-baseline': (8, 'align-items:baseline'),
+    'items-stretch': (8, 'align-items:stretch'),
+    'justify-start': (8, 'justify-content:flex-start'), 'justify-end': (8, 'justify-content:flex-end'),
+    'justify-center': (8, 'justify-content:center'), 'justify-between': (8, 'justify-content:space-between'),
+    'justify-around': (8, 'justify-content:space-around'),
+    'self-auto': (10, 'align-self:auto'), 'self-start': (10, 'align-self:flex-start'),
+    'self-end': (10, 'align-self:flex-end'), 'self-center': (10, 'align-self:center'),
+    'self-stretch': (10, 'align-self:stretch'),
+    'overflow-auto': (10, 'overflow:auto'), 'overflow-hidden': (10, 'overflow:hidden'),
+    'overflow-x-auto': (10, 'overflow-x:auto'), 'overflow-y-auto': (10, 'overflow-y:auto'),
+    'overflow-y-hidden': (10, 'overflow-y:hidden'),
+    'truncate': (10, 'overflow:hidden;text-overflow:ellipsis;white-space:nowrap'),
+    'whitespace-nowrap': (10, 'white-space:nowrap'), 'whitespace-pre-wrap': (10, 'white-space:pre-wrap'),
+    'whitespace-pre-line': (10, 'white-space:pre-line'),
+    'break-words': (10, 'overflow-wrap:break-word'), 'break-all': (10, 'word-break:break-all'),
+    'rounded-none': (11, 'border-radius:0px'), 'rounded-sm': (11, 'border-radius:0.125rem'),
+    'rounded': (11, 'border-radius:0.25rem'), 'rounded-md': (11, 'border-radius:0.375rem'),
+    'rounded-lg': (11, 'border-radius:0.5rem'), 'rounded-xl': (11, 'border-radius:0.75rem'),
+    'rounded-2xl': (11, 'border-radius:1rem'), 'rounded-full': (11, 'border-radius:9999px'),
+    'border-solid': (13, 'border-style:solid'), 'border-dashed': (13, 'border-style:dashed'),
+    'border-none': (13, 'border-style:none'),
+    'object-contain': (16, 'object-fit:contain'), 'object-cover': (16, 'object-fit:cover'),
+    'text-left': (18, 'text-align:left'), 'text-center': (18, 'text-align:center'), 'text-right': (18, 'text-align:right'),
+    'font-sans': (19, 'font-family:ui-sans-serif,system-ui,sans-serif'), 'font-mono': (19, f'font-family:{MONO}'),
+    'text-xs': (20, 'font-size:0.75rem;line-height:1rem'), 'text-sm': (20, 'font-size:0.875rem;line-height:1.25rem'),
+    'text-base': (20, 'font-size:1rem;line-height:1.5rem'), 'text-lg': (20, 'font-size:1.125rem;line-height:1.75rem'),
+    'text-xl': (20, 'font-size:1.25rem;line-height:1.75rem'), 'text-2xl': (20, 'font-size:1.5rem;line-height:2rem'),
+    'text-3xl': (20, 'font-size:1.875rem;line-height:2.25rem'), 'text-4xl': (20, 'font-size:2.25rem;line-height:2.5rem'),
+    'font-light': (21, 'font-weight:300'), 'font-normal': (21, 'font-weight:400'), 'font-medium': (21, 'font-weight:500'),
+    'font-semibold': (21, 'font-weight:600'), 'font-bold': (21, 'font-weight:700'),
+    'uppercase': (22, 'text-transform:uppercase'), 'lowercase': (22, 'text-transform:lowercase'),
+    'capitalize': (22, 'text-transform:capitalize'), 'normal-case': (22, 'text-transform:none'),
+    'italic': (22, 'font-style:italic'), 'not-italic': (22, 'font-style:normal'),
+    'leading-none': (23, 'line-height:1'), 'leading-tight': (23, 'line-height:1.25'),
+    'leading-snug': (23, 'line-height:1.375'), 'leading-normal': (23, 'line-height:1.5'),
+    'leading-relaxed': (23, 'line-height:1.625'), 'leading-loose': (23, 'line-height:2'),
+    'tracking-tight': (24, 'letter-spacing:-0.025em'), 'tracking-normal': (24, 'letter-spacing:0em'),
+    'tracking-wide': (24, 'letter-spacing:0.025em'), 'tracking-wider': (24, 'letter-spacing:0.05em'),
+    'tracking-widest': (24, 'letter-spacing:0.1em'),
+    'underline': (26, 'text-decoration-line:underline'), 'line-through': (26, 'text-decoration-line:line-through'),
+    'no-underline': (26, 'text-decoration-line:none'),
+    'transition': (29, 'transition-property:color,background-color,border-color,text-decoration-color,fill,stroke,'
+                       f'opacity,box-shadow,transform,filter;{TRANSITION}'),
+    'transition-all': (29, f'transition-property:all;{TRANSITION}'),
+    'transition-colors': (29, 'transition-property:color,background-color,border-color,text-decoration-color,fill,'
+                              f'stroke;{TRANSITION}'),
+    'transition-opacity': (29, f'transition-property:opacity;{TRANSITION}'),
+}
+
+SIDES = {'': ('',), 'x': ('-left', '-right'), 'y': ('-top', '-bottom'),
+         't': ('-top',), 'r': ('-right',), 'b': ('-bottom',), 'l': ('-left',)}
+SIZE_PROPS = {'w': 'width', 'h': 'height', 'min-w': 'min-width', 'min-h': 'min-height',
+              'max-w': 'max-width', 'max-h': 'max-height'}
+COLOR_PROPS = {'bg': (15, 'background-color'), 'text': (25, 'color'), 'border': (14, 'border-color'),
+               'accent': (27, 'accent-color'), 'decoration': (26, 'text-decoration-color')}
+INSET_PROPS = {'inset': ('top', 'right', 'bottom', 'left'), 'top': ('top',), 'right': ('right',),
+               'bottom': ('bottom',), 'left': ('left',)}
+
+# variant -> (selector suffix, is pseudo-element)
+VARIANTS = {'hover': (':hover', False), 'focus': (':focus', False), 'disabled': (':disabled', False),
+            'first': (':first-child', False), 'last': (':last-child', False),
+            'placeholder': ('::placeholder', True), 'file': ('::file-selector-button', True)}
+
+UTILITY = re.compile(
+    r'(?P<neg>-)?(?:'
+    r'(?P<space>m|p)(?P<side>[xytrbl]?)-(?P<sv>[\w.]+)'
+    r'|gap(?:-(?P<gap_axis>[xy]))?-(?P<gv>[\w.]+)'
+    r'|space-(?P<sp_axis>[xy])-(?P<spv>[\w.]+)'
+    r'|(?P<size>min-w|min-h|max-w|max-h|w|h)-(?P<zv>[\w./]+)'
+    r'|(?P<inset>inset|top|right|bottom|left)-(?P<iv>[\w./]+)'
+    r'|grid-cols-(?P<cols>\d+)|col-span-(?P<span>\d+)'
+    r'|z-(?P<z>\d+)|opacity-(?P<opacity>\d+)|duration-(?P<duration>\d+)'
+    r'|border(?:-(?P<bside>[xytrbl]))?(?:-(?P<bw>\d+))?'
+    r'|(?P<cprop>bg|text|border|accent|decoration)-(?P<color>[a-z]+(?:-\d+)?)(?:/(?P<alpha>\d+))?'
+    r')$')
+
+
+def _spacing(value, negative=False):
+    if value == 'px':
+        length = '1px'
+    elif value == 'auto':
+        return None if negative else 'auto'
+    elif re.fullmatch(r'\d+(\.5)?', value):
+        length = f'{float(value) / 4:g}rem' if value != '0' else '0px'
+    else:
+        return None
+    return f'-{length}' if negative and length != '0px' else length
+
+
+def _size(value):
+    if re.fullmatch(r'\d+/\d+', value):
+        num, den = map(int, value.split('/'))
+        return f'{num * 100 / den:g}%' if den else None
+    return _spacing(value)
+
+
+def _color(name, alpha=None):
+    value = COLORS.get(name)
+    if value is None or alpha is None or not value.startswith('#'):
+        return value
+    h = value.lstrip('#')
+    if len(h) == 3:
+        h = ''.join(ch * 2 for ch in h)
+    r, g, b = (int(h[i:i + 2], 16) for i in (0, 2, 4))
+    return f'rgb({r} {g} {b} / {int(alpha) / 100:g})'
+
+
+def utility(name):
+    """CSS for one utility without variants: (group, declarations, child selector) or None."""
+    if name in STATIC:
+        group, decls = STATIC[name]
+        return group, decls, ''
+    m = UTILITY.fullmatch(name)
+    if not m:
+        return None
+    g, neg = m.groupdict(), bool(m.group('neg'))
+    if g['space']:
+        length = _spacing(g['sv'], neg and g['space'] == 'm')
+        if length is None or (neg and g['space'] == 'p'):
+            return None
+        prop = 'margin' if g['space'] == 'm' else 'padding'
+        rank = {'': 0, 'x': 1, 'y': 1}.get(g['side'], 2)
+        return ((1 if prop == 'margin' else 17) + rank / 10,
+                ';'.join(f'{prop}{s}:{length}' for s in SIDES[g['side']]), '')
+    if neg and not g['inset']:
+        return None
+    if g['gv'] is not None:
+        length = _spacing(g['gv'])
+        prop = {'': 'gap', 'x': 'column-gap', 'y': 'row-gap'}[g['gap_axis'] or '']
+        return (9, f'{prop}:{length}', '') if length and length != 'auto' else None
+    if g['spv'] is not None:
+        length = _spacing(g['spv'])
+        if not length or length == 'auto':
+            return None
+        prop = 'margin-top' if g['sp_axis'] == 'y' else 'margin-left'
+        return 9.5, f'{prop}:{length}', ' > :not([hidden]) ~ :not([hidden])'
+    if g['size']:
+        length = _size(g['zv'])
+        return (5, f"{SIZE_PROPS[g['size']]}:{length}", '') if length else None
+    if g['inset']:
+        length = _size(g['iv'])
+        if not length:
+            return None
+        if neg:
+            length = f'-{length}'
+        return 0.5, ';'.join(f'{p}:{length}' for p in INSET_PROPS[g['inset']]), ''
+    if g['cols']:
+        return 8, f"grid-template-columns:repeat({g['cols']},minmax(0,1fr))", ''
+    if g['span']:
+        return 7, f"grid-column:span {g['span']} / span {g['span']}", ''
+    if g['z']:
+        return 0.7, f"z-index:{g['z']}", ''
+    if g['opacity']:
+        return 28, f"opacity:{int(g['opacity']) / 100:g}", ''
+    if g['duration']:
+        return 30, f"transition-duration:{g['duration']}ms", ''
+    if g['cprop']:
+        value = _color(g['color'], g['alpha'])
+        if value is None:
+            return None
+        group, prop = COLOR_PROPS[g['cprop']]
+        return group, f'{prop}:{value}', ''
+    if name.startswith('border'):
+        width = f"{g['bw']}px" if g['bw'] else '1px'
+        side = g['bside'] or ''
+        return 12 + (0.1 if side else 0), ';'.join(f'border{s}-width:{width}' for s in SIDES[side]), ''
+    return None
+
+
+def _escape(name):
+    return re.sub(r'([^\w-])', r'\\\1', name)
+
+
+def rule(token):
+    """(sort key, CSS rule) for a class token with optional variants, or None."""
+    *variants, name = token.split(':')
+    if any(v not in VARIANTS for v in variants) or len(set(variants)) != len(variants):
+        return None
+    found = utility(name)
+    if not found:
+        return None
+    group, decls, child = found
+    pseudo_classes = ''.join(VARIANTS[v][0] for v in variants if not VARIANTS[v][1])
+    pseudo_elements = ''.join(VARIANTS[v][0] for v in variants if VARIANTS[v][1])
+    selector = f'.{_escape(token)}{pseudo_classes}{pseudo_elements}{child}'
+    return (len(variants), group, name), f'{selector}{{{decls}}}'
+
+
+def scan_classes(paths):
+    """Every token in the given files that might be a class name."""
+    tokens = set()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            tokens.update(re.findall(r'[\w:./-]+', f.read()))
+    return tokens
+
+
+def utilities_css(tokens):
+    rules = sorted(r for r in map(rule, tokens) if r)
+    return '\n'.join(css for _, css in rules) + '\n'
+
+
+PREFLIGHT = """\
+*,::before,::after{box-sizing:border-box;border-width:0;border-style:solid;border-color:#e5e7eb}
+html{line-height:1.5;-webkit-text-size-adjust:100%;tab-size:4;font-family:ui-sans-serif,system-ui,sans-serif,"Apple Color Emoji","Segoe UI Emoji","Segoe UI Symbol","Noto Color Emoji"}
+body{margin:0;line-height:inherit}
+hr{height:0;color:inherit;border-top-width:1px}
+h1,h2,h3,h4,h5,h6{font-size:inherit;font-weight:inherit}
+a{color:inherit;text-decoration:inherit}
+b,strong{font-weight:bolder}
+code,kbd,samp,pre{font-family:@mono;font-size:1em}
+small{font-size:80%}
+table{text-indent:0;border-color:inherit;border-collapse:collapse}
+button,input,optgroup,select,textarea{font-family:inherit;font-size:100%;font-weight:inherit;line-height:inherit;color:inherit;margin:0;padding:0}
+button,select{text-transform:none}
+button,[type='button'],[type='reset'],[type='submit']{-webkit-appearance:button;background-color:transparent;background-image:none}
+summary{display:list-item}
+blockquote,dl,dd,h1,h2,h3,h4,h5,h6,hr,figure,p,pre{margin:0}
+fieldset{margin:0;padding:0}
+legend{padding:0}
+ol,ul,menu{list-style:none;margin:0;padding:0}
+dialog{padding:0}
+textarea{resize:vertical}
+input::placeholder,textarea::placeholder{opacity:1;color:#9ca3af}
+button,[role="button"]{cursor:pointer}
+:disabled{cursor:default}
+img,svg,video,canvas,audio,iframe,embed,object{display:block;vertical-align:middle}
+img,video{max-width:100%;height:auto}
+[hidden]{display:none}
+""".replace('@mono', MONO)
+
+# ─── Build ────────────────────────────────────────────────────────────────────
+
+
+def _content_files():
+    return sorted(glob.glob(os.path.join(TEMPLATE_DIR, '*.html')) +
+                  glob.glob(os.path.join(SOURCE_DIR, 'js', '*.js')))
+
+
+def _read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def bundles():
+    """Yield (logical name, text) for every bundle."""
+    utilities = utilities_css(scan_classes(_content_files()))
+    generated = {'@preflight': PREFLIGHT, '@utilities': utilities}
+    for name, parts in CSS_BUNDLES.items():
+        yield name, ''.join(generated.get(p) or _read(os.path.join(SOURCE_DIR, p)) for p in parts)
+    for path in sorted(glob.glob(os.path.join(SOURCE_DIR, 'js', '*.js'))):
+        yield os.path.basename(path), _read(path)
+
+
+def _write(path, data):
+    if os.path.exists(path):
+        return
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build():
+    """Write every bundle under a content-hashed name. Returns {logical name: file name}.
+
+    Unchanged bundles are not rewritten, and files from older builds are removed.
+    """
+    os.makedirs(DIST_DIR, exist_ok=True)
+    manifest = {}
+    for name, text in bundles():
+        data = text.encode('utf-8')
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+        path = os.path.join(DIST_DIR, filename)
+        _write(path, data)
+        if ext in COMPRESSIBLE:
+            _write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                _write(path + '.br', brotli.compress(data, quality=11))
+        manifest[name] = filename
+    _write_manifest(manifest)
+    keep = set(manifest.values())
+    for path in glob.glob(os.path.join(DIST_DIR, '*.*.*')):
+        base = os.path.basename(path)
+        if base.endswith('.tmp'):
+            continue
+        if re.sub(r'\.(gz|br)$', '', base) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return manifest
+
+
+def _write_manifest(manifest):
+    tmp = f'{MANIFEST}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST)
+
+
+if __name__ == '__main__':
+    for name, filename in sorted(build().items()):
+        path = os.path.join(DIST_DIR, filename)
+        sizes = [f'{os.path.getsize(path):,} B']
+        for enc in ('gz', 'br'):
+            if os.path.exists(f'{path}.{enc}'):
+                sizes.append(f'{enc} {os.path.getsize(f"{path}.{enc}"):,} B')
+        print(f'  {name:<20} {filename:<32} {" / ".join(sizes)}')
@@ -1,15 +1,405 @@
 import sqlite3
+import contextvars, gzip, hashlib, heapq, json, math, os, queue, random, re, shutil, tempfile, threading, time
+from array import array
+from collections import deque
+from datetime import datetime
+# concurrent.futures and uuid are imported where they're used: together they
+# are a third of this module's import time, and pipeline.py (the CLI) should
+# start without them.
 
 DATABASE = 'pipeline.db'
+ARCHIVE_DATABASE = 'pipeline_archive.db'
+DB_TIMEOUT = 15   # seconds a writer waits on SQLite's lock before failing
+BACKUP_DIR = 'backups'
+BACKUP_KEEP = int(os.environ.get('PIPELINE_BACKUP_KEEP', 14))
+BACKUP_HOURS = float(os.environ.get('PIPELINE_BACKUP_HOURS', 24))   # 0 disables scheduled backups
 
-def get_db():
-    conn = sqlite3.connect(DATABASE)
+# ─── Slow-query log ───────────────────────────────────────────────────────────
+# Opt-in: set PIPELINE_SLOW_QUERY_MS (or use the Data Manager page) to a
+# threshold in milliseconds. 0 disables recording. A threshold set on the page
+# is saved in the default workspace's settings table and overrides the
+# environment; every worker process picks it up within SLOW_QUERY_RELOAD
+# seconds. The log itself is kept in memory per process, so under serve.py
+# with several workers each one records only the requests it served.
+
+SLOW_QUERY_MS = float(os.environ.get('PIPELINE_SLOW_QUERY_MS', 0) or 0)
+SLOW_QUERY_LARGE_TABLE = 1000   # rows before a full SCAN is flagged
+SLOW_QUERY_RELOAD = 5           # seconds between checks for a saved threshold
+_slow_queries = deque(maxlen=200)
+_slow_lock = threading.Lock()
+_slow_checked = None
+
+_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+_ALIAS_RE = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|LEFT\b|JOIN\b|ORDER\b|GROUP\b|LIMIT\b)(\w+))?', re.I)
+
+
+def set_slow_query_threshold(ms):
+    """Set the threshold for every worker process. Raises ValueError if ms isn't a number."""
+    global SLOW_QUERY_MS
+    ms = max(float(ms or 0), 0)
+    conn = sqlite3.connect(get_workspace().database, timeout=DB_TIMEOUT)
+    try:
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('slow_query_ms', ?)", [repr(ms)])
+        conn.commit()
+    finally:
+        conn.close()
+    SLOW_QUERY_MS = ms
+
+
+def load_slow_query_threshold(max_age=SLOW_QUERY_RELOAD):
+    """Pick up a threshold saved by another process; reads it at most once every max_age seconds."""
+    global SLOW_QUERY_MS, _slow_checked
+    now = time.monotonic()
+    if _slow_checked is not None and now - _slow_checked < max_age:
+        return
+    _slow_checked = now
+    # A plain connection, so the check isn't timed and logged itself
+    conn = sqlite3.connect(get_workspace().database, timeout=DB_TIMEOUT)
+    try:
+        row = conn.execute("SELECT value FROM settings WHERE key='slow_query_ms'").fetchone()
+    except sqlite3.Error:   # not migrated yet, or the file is busy: keep what we have
+        return
+    finally:
+        conn.close()
+    if row:
+        SLOW_QUERY_MS = float(row[0])
+
+
+def get_slow_queries():
+    with _slow_lock:
+        return list(reversed(_slow_queries))
+
+
+def clear_slow_queries():
+    with _slow_lock:
+        _slow_queries.clear()
+
+
+def _param_shape(params):
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    return [type(v).__name__ for v in params]
+
+
+class PipelineConnection(sqlite3.Connection):
+    """Connection that times execute() and records statements over SLOW_QUERY_MS.
+
+    Only the execute() call is timed (which for SQLite includes the first step,
+    so sorts and full scans feeding ORDER BY are counted); row fetching is not.
+    """
+
+    def execute(self, sql, params=()):
+        if not SLOW_QUERY_MS:
+            return super().execute(sql, params)
+        start = time.perf_counter()
+        cur = super().execute(sql, params)
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed >= SLOW_QUERY_MS and not sql.lstrip().upper().startswith(('EXPLAIN', 'PRAGMA')):
+            self._record_slow(sql, params, elapsed)
+        return cur
+
+    def _record_slow(self, sql, params, elapsed):
+        try:
+            plan = [r[3] for r in super().execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+        except sqlite3.Error as e:
+            plan = [f'(plan unavailable: {e})']
+        aliases = {}
+        for table, alias in _ALIAS_RE.findall(sql):
+            aliases[table] = table
+            if alias: aliases[alias] = table
+        flags = []
+        for line in plan:
+            m = _SCAN_RE.match(line)
+            if not m or ' USING ' in line:
+                continue
+            table = aliases.get(m.group(1), m.group(1))
+            try:
+                rows = super().execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+            except sqlite3.Error:
+                continue
+            if rows >= SLOW_QUERY_LARGE_TABLE:
+                flags.append(f'{line} (~{rows} rows)')
+        with _slow_lock:
+            _slow_queries.append({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'ms': round(elapsed, 2),
+                'sql': ' '.join(sql.split()),
+                'params': _param_shape(params),
+                'plan': plan,
+                'scan_flags': flags,
+            })
+
+
+def get_db(workspace=None):
+    """Open the database of `workspace` (the current workspace by default)."""
+    workspace = workspace or current_workspace()
+    conn = sqlite3.connect(workspace.database, timeout=DB_TIMEOUT, factory=PipelineConnection)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
+# ─── Group commit ─────────────────────────────────────────────────────────────
+# Small, frequent writes (status flips, dock submissions) go through one
+# writer thread per workspace and process instead of each request committing
+# on its own. The writer takes whatever has queued up within GROUP_COMMIT_MS
+# of the first write, applies each in its own savepoint so one failure doesn't
+# sink the rest, and commits the lot at once: one fsync and one trip through
+# SQLite's write lock for the whole batch. Callers block until their write is
+# committed, so a response still means the change is durable.
+
+GROUP_COMMIT_MS = float(os.environ.get('PIPELINE_GROUP_COMMIT_MS', 2))
+GROUP_COMMIT_MAX = 500
+
+
+class WriteQueue:
+    def __init__(self, workspace, window_ms=GROUP_COMMIT_MS, max_batch=GROUP_COMMIT_MAX):
+        self.workspace = workspace
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pid = None
+        self.batches = self.writes = 0
+
+    def _start(self):
+        # Worker processes inherit nothing useful from a parent that forked
+        # them, so each process starts its own queue and writer on first use.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            threading.Thread(target=self._run, args=(self._queue,), name='group-commit', daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, fn):
+        """Queue fn(db) to run in the next group commit. fn must not commit. Returns a Future."""
+        if self._pid != os.getpid():
+            self._start()
+        from concurrent.futures import Future
+        future = Future()
+        self._queue.put((fn, future))
+        return future
+
+    def run(self, fn, timeout=DB_TIMEOUT * 2):
+        """Queue fn(db) and wait until it is committed; returns its result or raises its error."""
+        return self.submit(fn).result(timeout)
+
+    def _run(self, q):
+        db = get_db(self.workspace)
+        db.isolation_level = None   # transactions are managed explicitly below
+        while True:
+            batch = [q.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(q.get(timeout=remaining) if remaining > 0 else q.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(db, batch)
+
+    def _apply(self, db, batch):
+        outcomes = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for fn, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                db.execute('SAVEPOINT op')
+                try:
+                    outcomes.append((future, fn(db), None))
+                    db.execute('RELEASE op')
+                except Exception as e:   # the writer must outlive any one bad write
+                    db.execute('ROLLBACK TO op')
+                    db.execute('RELEASE op')
+                    outcomes.append((future, None, e))
+            db.execute('COMMIT')
+        except Exception as e:   # fail this batch, not the writer thread
+            try:
+                if db.in_transaction:
+                    db.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            for fn, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += len(outcomes)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+# ─── Workspaces ───────────────────────────────────────────────────────────────
+# Each workspace (one per client) is its own set of files, so one client's
+# history never slows another's pages, and each is backed up, exported and
+# archived on its own. The default workspace is DATABASE and its siblings in
+# the working directory, as before workspaces existed; the others live in
+# WORKSPACE_DIR/<name>/ with the same layout. The current workspace is a
+# context variable that app.py sets per request: get_db() and everything built
+# on it (archive, backups, analytics, media scans) follow it. Every workspace
+# has its own group-commit writer, migration state and background-job state.
+
+WORKSPACE_DIR = 'workspaces'
+DEFAULT_WORKSPACE = 'default'
+WORKSPACE_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,39}$')
+
+
+class Workspace:
+    def __init__(self, name):
+        self.name = name
+        self.write_queue = WriteQueue(self)
+        self.migrated = False
+        self.archive_synced = False
+        self.scan_lock = threading.Lock()
+        self.media_scan_state = {'running': False, 'checked': 0, 'total': 0, 'started_at': None,
+                                 'finished_at': None, 'error': None, 'counts': {}}
+        self.analytics_lock = threading.Lock()
+        self.analytics_state = {'running': False, 'started_at': None, 'finished_at': None, 'error': None}
+        self._migrate_lock = threading.Lock()
+
+    def _path(self, default, filename):
+        # Resolved on access: the CLI's --db moves the default workspace after import
+        if self.name == DEFAULT_WORKSPACE:
+            return default
+        return os.path.join(WORKSPACE_DIR, self.name, filename)
+
+    @property
+    def database(self):
+        return self._path(DATABASE, 'pipeline.db')
+
+    @property
+    def archive(self):
+        return self._path(ARCHIVE_DATABASE, 'pipeline_archive.db')
+
+    @property
+    def analytics(self):
+        return self._path(ANALYTICS_DATABASE, 'pipeline_analytics.db')
+
+    @property
+    def backup_dir(self):
+        return self._path(BACKUP_DIR, 'backups')
+
+    def ensure_migrated(self):
+        """Bring this workspace's file up to SCHEMA_VERSION, once per process."""
+        if self.migrated:
+            return
+        with self._migrate_lock:
+            if not self.migrated:
+                with use_workspace(self):
+                    if schema_version() != SCHEMA_VERSION:
+                        run_migrations()
+                self.migrated = True
+
+
+_workspaces = {}
+_workspaces_lock = threading.Lock()
+_current_workspace = contextvars.ContextVar('workspace', default=None)
+
+
+def _workspace_exists(name):
+    return name == DEFAULT_WORKSPACE or (
+        bool(WORKSPACE_NAME_RE.match(name)) and os.path.exists(os.path.join(WORKSPACE_DIR, name, 'pipeline.db')))
+
+
+def get_workspace(name=DEFAULT_WORKSPACE):
+    """The Workspace called `name` (one object per process), or None if there is no such workspace."""
+    with _workspaces_lock:
+        ws = _workspaces.get(name)
+        if ws is None and _workspace_exists(name):
+            ws = _workspaces[name] = Workspace(name)
+        return ws
+
+
+def list_workspaces():
+    """All workspaces, the default first."""
+    names = sorted(os.listdir(WORKSPACE_DIR)) if os.path.isdir(WORKSPACE_DIR) else []
+    return [get_workspace()] + [ws for ws in map(get_workspace, names)
+                                if ws is not None and ws.name != DEFAULT_WORKSPACE]
+
+
+def create_workspace(name):
+    """Create workspace `name` with an up-to-date, empty database. Raises ValueError on a bad or taken name."""
+    if not WORKSPACE_NAME_RE.match(name or ''):
+        raise ValueError('Workspace names are 1-40 lowercase letters, digits, "-" or "_".')
+    if _workspace_exists(name):
+        raise ValueError(f'Workspace "{name}" already exists.')
+    os.makedirs(os.path.join(WORKSPACE_DIR, name), exist_ok=True)
+    with _workspaces_lock:
+        ws = _workspaces.setdefault(name, Workspace(name))
+    ws.ensure_migrated()
+    return ws
+
+
+def current_workspace():
+    return _current_workspace.get() or get_workspace()
+
+
+def set_workspace(ws):
+    """Make ws current for the rest of this context (a request, or the CLI)."""
+    _current_workspace.set(ws)
+
+
+class use_workspace:
+    """Context manager: make ws current inside the block."""
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    def __enter__(self):
+        self._token = _current_workspace.set(self.ws)
+        return self.ws
+
+    def __exit__(self, *exc):
+        _current_workspace.reset(self._token)
+
+
+def migrate_workspaces():
+    """Run run_migrations() in every workspace; app.py calls this at start-up."""
+    for ws in list_workspaces():
+        with use_workspace(ws):
+            run_migrations()
+        ws.migrated = True
+
+
+def workspace_summary(ws):
+    """Headline counts for one workspace, read from its own file."""
+    files = (ws.database, ws.database + '-wal', ws.archive)
+    summary = {'name': ws.name, 'bytes': sum(os.path.getsize(p) for p in files if os.path.exists(p))}
+    try:
+        db = get_db(ws)
+    except sqlite3.Error as e:
+        return dict(summary, error=str(e))
+    try:
+        summary['jobs'] = dict(db.execute('SELECT status, COUNT(*) FROM render_jobs GROUP BY status').fetchall())
+        summary.update(db.execute('''SELECT (SELECT COUNT(*) FROM projects) AS projects,
+                                             (SELECT COUNT(*) FROM media_assets) AS media,
+                                             (SELECT COUNT(*) FROM prompts WHERE status='pending') AS pending_prompts,
+                                             (SELECT created_at FROM job_status_events
+                                               ORDER BY id DESC LIMIT 1) AS last_activity''').fetchone())
+    except sqlite3.Error as e:
+        summary['error'] = str(e)
+    finally:
+        db.close()
+    return summary
+
+
+def workspace_summaries(workers=8):
+    """workspace_summary() for every workspace, read in parallel: SQLite releases the GIL while it works."""
+    from concurrent.futures import ThreadPoolExecutor
+    spaces = list_workspaces()
+    with ThreadPoolExecutor(max_workers=min(workers, len(spaces))) as pool:
+        return list(pool.map(workspace_summary, spaces))
+
+
 def init_db():
     conn = get_db()
+    # WAL lets readers run alongside the single writer; the setting persists in the file.
+    conn.execute('PRAGMA journal_mode=WAL')
     conn.executescript('''
         CREATE TABLE IF NOT EXISTS archetypes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -211,3 +601,2084 @@ def migrate_db_v3():
             conn.execute('INSERT INTO dock_config (slot, label, url) VALUES (?,?,?)', [slot, label, url])
         conn.commit()
     conn.close()
+
+
+def migrate_db_v4():
+    """Add render job status history and the precomputed timeline aggregates."""
+    conn = get_db()
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS job_status_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            output_type_id INTEGER,
+            source TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_job_status_events_job ON job_status_events(job_id, created_at);
+
+        CREATE TABLE IF NOT EXISTS job_stage_durations (
+            job_id INTEGER NOT NULL,
+            from_status TEXT NOT NULL,
+            to_status TEXT NOT NULL,
+            output_type_id INTEGER,
+            seconds INTEGER NOT NULL,
+            PRIMARY KEY (job_id, from_status, to_status)
+        );
+
+        CREATE TABLE IF NOT EXISTS job_timeline_buckets (
+            granularity TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            output_type_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, project_id, output_type_id, bucket, status)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS job_stage_histogram (
+            from_status TEXT NOT NULL,
+            to_status TEXT NOT NULL,
+            project_id INTEGER NOT NULL,
+            output_type_id INTEGER NOT NULL,
+            bin INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (from_status, to_status, project_id, output_type_id, bin)
+        ) WITHOUT ROWID;
+    ''')
+    # Seed history for jobs that predate the event log: one event at created_at
+    # for the status they are in now.
+    if not conn.execute('SELECT 1 FROM job_status_events LIMIT 1').fetchone():
+        jobs = conn.execute('SELECT id, status, output_type_id, created_at FROM render_jobs').fetchall()
+        for job in jobs:
+            created = job['created_at'] or datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            conn.execute("INSERT INTO job_status_events (job_id, from_status, to_status, output_type_id, source, created_at)"
+                         " VALUES (?,NULL,?,?,'backfill',?)",
+                         [job['id'], job['status'] or 'planned', job['output_type_id'], created])
+            pids = [r[0] for r in conn.execute('SELECT project_id FROM project_jobs WHERE job_id=?', [job['id']])]
+            _fold_timeline(conn, created, job['status'] or 'planned', [0] + pids, job['output_type_id'], 1)
+    conn.commit()
+    conn.close()
+
+
+def migrate_db_v5():
+    """Indexes behind the job lookup API."""
+    conn = get_db()
+    conn.executescript('''
+        CREATE INDEX IF NOT EXISTS idx_characters_name_nocase ON characters(name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_output_types_name_nocase ON output_types(name COLLATE NOCASE);
+        CREATE INDEX IF NOT EXISTS idx_render_jobs_character ON render_jobs(character_id);
+        CREATE INDEX IF NOT EXISTS idx_render_jobs_output_type ON render_jobs(output_type_id);
+    ''')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v7():
+    """Idempotency keys for requests replayed from the dock's offline queue."""
+    conn = get_db()
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS dock_requests (
+            key TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v8():
+    """Claim/lease columns for the prompt queue."""
+    conn = get_db()
+    cols = _columns(conn, 'prompts')
+    if 'claimed_by' not in cols:
+        conn.execute("ALTER TABLE prompts ADD COLUMN claimed_by TEXT")
+        conn.execute("ALTER TABLE prompts ADD COLUMN claim_expires_at TIMESTAMP")
+    conn.executescript('''
+        CREATE INDEX IF NOT EXISTS idx_prompts_pending ON prompts(project_id, created_at) WHERE status='pending';
+        CREATE INDEX IF NOT EXISTS idx_prompts_job ON prompts(job_id);
+        CREATE INDEX IF NOT EXISTS idx_prompts_lease ON prompts(claim_expires_at) WHERE claim_expires_at IS NOT NULL;
+    ''')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v9():
+    """Usage counters behind the coverage planner."""
+    conn = get_db()
+    conn.execute('''CREATE TABLE IF NOT EXISTS coverage_counts (
+        kind TEXT NOT NULL, a INTEGER NOT NULL, b INTEGER NOT NULL, count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (kind, a, b)) WITHOUT ROWID''')
+    fresh = not any(r[0] == 'coverage_rji_ins' for r in
+                    conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'"))
+    install_coverage_triggers(conn)
+    if fresh:
+        rebuild_coverage(conn)
+    conn.commit()
+    conn.close()
+
+def migrate_db_v10():
+    """Per-table change versions for the fragment cache."""
+    conn = get_db()
+    conn.executescript('''
+        CREATE INDEX IF NOT EXISTS idx_sync_changes_table_seq ON sync_changes(table_name, seq);
+        CREATE INDEX IF NOT EXISTS idx_media_assets_job ON media_assets(job_id);
+    ''')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v11():
+    """Materialised top-layer metadata aggregates."""
+    conn = get_db()
+    fresh = not any(r[0] == 'top_layer_meta' for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS top_layer_meta (
+            top_layer_id INTEGER PRIMARY KEY,
+            characters TEXT DEFAULT '',
+            tags TEXT DEFAULT '',
+            description TEXT DEFAULT '',
+            seo_description TEXT DEFAULT '',
+            media_count INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS top_layer_meta_dirty (top_layer_id INTEGER PRIMARY KEY);
+    ''')
+    if fresh:
+        conn.execute('INSERT OR IGNORE INTO top_layer_meta_dirty SELECT id FROM top_layer_media')
+    install_top_layer_meta_triggers(conn)
+    conn.commit()
+    conn.close()
+
+def migrate_db_v12():
+    """Media integrity scan results."""
+    conn = get_db()
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS media_files (
+            source TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            file_path TEXT NOT NULL,
+            size INTEGER,
+            mtime REAL,
+            hash TEXT,
+            status TEXT NOT NULL,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source, ref_id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_media_files_status ON media_files(status);
+        CREATE INDEX IF NOT EXISTS idx_media_files_hash ON media_files(hash) WHERE hash IS NOT NULL;
+    ''')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v13():
+    """Near-duplicate prompt index."""
+    conn = get_db()
+    fresh = not any(r[0] == 'prompt_sigs' for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'"))
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS prompt_sigs (
+            source TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            sig BLOB NOT NULL,
+            PRIMARY KEY (source, ref_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS prompt_bands (
+            bucket INTEGER NOT NULL,
+            source TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            PRIMARY KEY (bucket, source, ref_id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS prompt_index_dirty (
+            source TEXT NOT NULL,
+            ref_id INTEGER NOT NULL,
+            PRIMARY KEY (source, ref_id)
+        ) WITHOUT ROWID;
+    ''')
+    install_prompt_index_triggers(conn)
+    if fresh:
+        conn.execute("INSERT OR IGNORE INTO prompt_index_dirty SELECT 'prompt', id FROM prompts")
+        conn.execute("INSERT OR IGNORE INTO prompt_index_dirty SELECT 'media', id FROM media_assets WHERE prompt != ''")
+        refresh_prompt_index(conn)
+    conn.commit()
+    conn.close()
+
+def migrate_db_v14():
+    """ON DELETE actions on every foreign key, and indexes behind them.
+
+    SQLite can't alter a constraint, so each table whose actions differ from
+    FK_ACTIONS is rebuilt: new table, copy, drop, rename. Triggers are dropped
+    first and reinstalled after, and rows already orphaned are cleared so the
+    new constraints hold from the start.
+    """
+    conn = get_db()
+    wanted = {}
+    for t, col, parent, action in FK_ACTIONS:
+        wanted.setdefault(t, {})[col] = action
+    todo = [t for t, cols in wanted.items()
+            if {r['from']: r['on_delete'] for r in conn.execute(f'PRAGMA foreign_key_list({t})')} != cols]
+    if todo:
+        conn.execute('PRAGMA foreign_keys=OFF')   # no-op inside a transaction
+        conn.execute('BEGIN')
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall():
+            conn.execute(f'DROP TRIGGER {name}')
+        for t in todo:
+            ddl = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", [t]).fetchone()[0]
+            for col, action in wanted[t].items():
+                ddl = re.sub(rf'(\b{col}\s+INTEGER\s+REFERENCES\s+\w+\s*\(\w+\))(\s+ON\s+DELETE\s+(SET\s+NULL|CASCADE|RESTRICT|NO\s+ACTION))?',
+                             rf'\1 ON DELETE {action}', ddl, flags=re.I)
+            ddl = re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?\w+"?', f'CREATE TABLE {t}_new', ddl)
+            indexes = [r[0] for r in conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type='index' AND tbl_name=? AND sql IS NOT NULL", [t])]
+            seq = conn.execute('SELECT seq FROM sqlite_sequence WHERE name=?', [t]).fetchone()
+            cols = ', '.join(_columns(conn, t))
+            conn.execute(ddl)
+            conn.execute(f'INSERT INTO {t}_new ({cols}) SELECT {cols} FROM {t}')
+            conn.execute(f'DROP TABLE {t}')
+            conn.execute(f'ALTER TABLE {t}_new RENAME TO {t}')
+            for sql in indexes:
+                conn.execute(sql)
+            # Keep AUTOINCREMENT past ids that only live on in the archive or on peers
+            if seq:
+                conn.execute('UPDATE sqlite_sequence SET seq=MAX(seq, ?) WHERE name=?', [seq[0], t])
+        install_sync_triggers(conn)
+        install_coverage_triggers(conn)
+        install_top_layer_meta_triggers(conn)
+        install_prompt_index_triggers(conn)
+        _clear_orphans(conn)
+        conn.commit()
+        conn.execute('PRAGMA foreign_keys=ON')
+    for t, col, parent, action in FK_ACTIONS:
+        if not any(conn.execute(f'PRAGMA index_info({ix["name"]})').fetchone()[2] == col
+                   for ix in conn.execute(f'PRAGMA index_list({t})')):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{t}_{col} ON {t}({col})')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v15():
+    """Server settings changed at run time, shared by every worker. Only the default workspace's are read."""
+    conn = get_db()
+    conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+    conn.commit()
+    conn.close()
+
+def migrate_db_v16():
+    """Re-stamp rows migrate_db_v6 left with an empty updated_at and a sync_uid ending in ':'.
+
+    Those are rows of tables with no created_at. The update goes through the
+    sync triggers, so peers pull the repaired rows again.
+    """
+    conn = get_db()
+    for t in SYNC_ROW_KEYS:
+        cols = _columns(conn, t)
+        if 'updated_at' not in cols:
+            continue
+        conn.execute(f"UPDATE {t} SET updated_at={_backfill_stamp(t, cols)} WHERE updated_at=''")
+        conn.execute(f"UPDATE {t} SET sync_uid={_backfill_uid(t, cols)} WHERE sync_uid='{t}:' || id || ':'")
+    conn.commit()
+    conn.close()
+
+# Bump SCHEMA_VERSION with every new migration. run_migrations() stamps it
+# into PRAGMA user_version, so the CLI can tell an up-to-date file at a glance
+# instead of running every migration on each start.
+SCHEMA_VERSION = 16
+
+
+def run_migrations():
+    """Create or upgrade the current workspace's database to the current schema. Safe to run repeatedly."""
+    for migrate in (init_db, migrate_db, migrate_db_v2, migrate_db_v3, migrate_db_v4, migrate_db_v5,
+                    migrate_db_v6, migrate_db_v7, migrate_db_v8, migrate_db_v9, migrate_db_v10,
+                    migrate_db_v11, migrate_db_v12, migrate_db_v13, migrate_db_v14, migrate_db_v15,
+                    migrate_db_v16):
+        migrate()
+    conn = get_db()
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    conn.close()
+
+
+def schema_version():
+    """The schema version stamped on the current workspace's file, or None if the file doesn't exist."""
+    path = current_workspace().database
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path, timeout=DB_TIMEOUT)
+    try:
+        return conn.execute('PRAGMA user_version').fetchone()[0]
+    finally:
+        conn.close()
+
+# ─── Job status history ───────────────────────────────────────────────────────
+# Every render_jobs status change is appended to job_status_events and folded
+# into two aggregates so the timeline never reads the raw log:
+#   job_timeline_buckets  transitions per hour/day bucket
+#   job_stage_histogram   log-scale histogram of time between first entering
+#                         one status and first entering a later one
+# Both are keyed by project_id and output_type_id, where 0 means "all".
+
+TIMELINE_GRANULARITIES = {'hour': 13, 'day': 10}   # prefix of 'YYYY-MM-DD HH:MM:SS'
+STAGE_BINS_PER_DOUBLING = 4
+
+
+def _duration_bin(seconds):
+    return int(math.log2(max(seconds, 0) + 1) * STAGE_BINS_PER_DOUBLING)
+
+
+def duration_bin_upper(b):
+    """Upper bound in seconds of a job_stage_histogram bin."""
+    return round(2 ** ((b + 1) / STAGE_BINS_PER_DOUBLING) - 1)
+
+
+def _fold_timeline(db, ts, status, project_ids, output_type_id, delta):
+    for gran, n in TIMELINE_GRANULARITIES.items():
+        for pid in project_ids:
+            for ot in {0, output_type_id or 0}:
+                db.execute('''INSERT INTO job_timeline_buckets (granularity, project_id, output_type_id, bucket, status, count)
+                    VALUES (?,?,?,?,?,?) ON CONFLICT (granularity, project_id, output_type_id, bucket, status)
+                    DO UPDATE SET count = count + excluded.count''', [gran, pid, ot, ts[:n], status, delta])
+
+
+def _fold_duration(db, from_status, to_status, seconds, project_ids, output_type_id, delta):
+    b = _duration_bin(seconds)
+    for pid in project_ids:
+        for ot in {0, output_type_id or 0}:
+            db.execute('''INSERT INTO job_stage_histogram (from_status, to_status, project_id, output_type_id, bin, count)
+                VALUES (?,?,?,?,?,?) ON CONFLICT (from_status, to_status, project_id, output_type_id, bin)
+                DO UPDATE SET count = count + excluded.count''', [from_status, to_status, pid, ot, b, delta])
+
+
+def record_job_status(db, job_id, new_status, source, created=False, output_type_id=None):
+    """Log a status transition for job_id and update the timeline aggregates.
+
+    Call before writing the new status to render_jobs (the previous status is
+    read from the row), or straight after inserting a job with created=True.
+    Pass output_type_id when the same write changes the job's output type, so
+    the transition is recorded under the new one. Does not commit.
+    """
+    job = db.execute('SELECT status, output_type_id FROM render_jobs WHERE id=?', [job_id]).fetchone()
+    if not job:
+        return
+    old_status = None if created else job['status']
+    if old_status == new_status:
+        return
+    ts = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    ot_id = output_type_id if output_type_id is not None else job['output_type_id']
+    # First time the job entered each status. Backfilled rows only know created_at,
+    # which is a real entry time only for jobs that were still planned.
+    first_seen = dict(db.execute('''SELECT to_status, MIN(created_at) FROM job_status_events
+        WHERE job_id=? AND (source != 'backfill' OR to_status='planned') GROUP BY to_status''', [job_id]).fetchall())
+    db.execute('''INSERT INTO job_status_events (job_id, from_status, to_status, output_type_id, source, created_at)
+        VALUES (?,?,?,?,?,?)''', [job_id, old_status, new_status, ot_id, source, ts])
+    project_ids = [0] + [r[0] for r in db.execute('SELECT project_id FROM project_jobs WHERE job_id=?', [job_id])]
+    _fold_timeline(db, ts, new_status, project_ids, ot_id, 1)
+    if new_status in first_seen:
+        return
+    now = datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+    for from_status, started in first_seen.items():
+        seconds = int((now - datetime.strptime(started[:19], '%Y-%m-%d %H:%M:%S')).total_seconds())
+        db.execute('''INSERT OR IGNORE INTO job_stage_durations (job_id, from_status, to_status, output_type_id, seconds)
+            VALUES (?,?,?,?,?)''', [job_id, from_status, new_status, ot_id, seconds])
+        _fold_duration(db, from_status, new_status, seconds, project_ids, ot_id, 1)
+
+
+def move_job_output_type(db, job_id, output_type_id):
+    """Move a job's recorded history to output_type_id in every aggregate it counts toward.
+
+    Call before writing the new output type to render_jobs. Does not commit.
+    """
+    project_ids = [0] + [r[0] for r in db.execute('SELECT project_id FROM project_jobs WHERE job_id=?', [job_id])]
+    for ev in db.execute('SELECT to_status, output_type_id, created_at FROM job_status_events WHERE job_id=?', [job_id]).fetchall():
+        if ev['output_type_id'] != output_type_id:
+            _fold_timeline(db, ev['created_at'], ev['to_status'], project_ids, ev['output_type_id'], -1)
+            _fold_timeline(db, ev['created_at'], ev['to_status'], project_ids, output_type_id, 1)
+    for d in db.execute('SELECT * FROM job_stage_durations WHERE job_id=?', [job_id]).fetchall():
+        if d['output_type_id'] != output_type_id:
+            _fold_duration(db, d['from_status'], d['to_status'], d['seconds'], project_ids, d['output_type_id'], -1)
+            _fold_duration(db, d['from_status'], d['to_status'], d['seconds'], project_ids, output_type_id, 1)
+    db.execute('UPDATE job_status_events SET output_type_id=? WHERE job_id=?', [output_type_id, job_id])
+    db.execute('UPDATE job_stage_durations SET output_type_id=? WHERE job_id=?', [output_type_id, job_id])
+
+
+def fold_job_into_project(db, job_id, project_id, delta):
+    """Add (delta=1) or remove (delta=-1) a job's history from one project's aggregates."""
+    for ev in db.execute('SELECT to_status, output_type_id, created_at FROM job_status_events WHERE job_id=?', [job_id]).fetchall():
+        _fold_timeline(db, ev['created_at'], ev['to_status'], [project_id], ev['output_type_id'], delta)
+    for d in db.execute('SELECT * FROM job_stage_durations WHERE job_id=?', [job_id]).fetchall():
+        _fold_duration(db, d['from_status'], d['to_status'], d['seconds'], [project_id], d['output_type_id'], delta)
+
+
+
+def batch_jobs(db, ids):
+    """Import-form data for jobs: names, ingredients, and the suggested title and tags."""
+    marks = ','.join('?' * len(ids))
+    jobs = db.execute(f'''SELECT rj.id, rj.status, rj.notes, rj.character_id, rj.output_type_id,
+        c.name AS character_name, c.tags AS char_tags, ot.name AS output_type_name
+        FROM render_jobs rj LEFT JOIN characters c ON rj.character_id=c.id
+        LEFT JOIN output_types ot ON rj.output_type_id=ot.id WHERE rj.id IN ({marks})''', ids).fetchall()
+    ings = {}
+    for r in db.execute(f'''SELECT rji.job_id, i.id, i.name, i.code, ic.name AS category_name
+            FROM render_job_ingredients rji JOIN ingredients i ON rji.ingredient_id=i.id
+            JOIN ingredient_categories ic ON i.category_id=ic.id
+            WHERE rji.job_id IN ({marks}) ORDER BY ic.name''', ids):
+        ings.setdefault(r['job_id'], []).append({k: r[k] for k in ('id', 'name', 'code', 'category_name')})
+    result = {}
+    for job in jobs:
+        job, ing_list = dict(job), ings.get(job['id'], [])
+        ing_names = ', '.join(i['name'] for i in ing_list)
+        auto_title = job['character_name'] or ''
+        if ing_names: auto_title += (' — ' + ing_names) if auto_title else ing_names
+        auto_tags = ''
+        if job['character_name']: auto_tags = job['character_name'].lower().replace(' ', ',')
+        if job['char_tags']: auto_tags += ',' + job['char_tags']
+        if ing_names: auto_tags += ',' + ','.join(i['name'].lower() for i in ing_list)
+        result[job['id']] = {**job, 'ingredients': ing_list, 'auto_title': auto_title, 'auto_tags': auto_tags}
+    return result
+
+# ─── Archive ──────────────────────────────────────────────────────────────────
+# Completed, aged render jobs move with their dependent rows into the
+# workspace's archive file (ARCHIVE_DATABASE in the default workspace),
+# attached to the connection as "archive". Archive tables mirror the live
+# columns without foreign keys (their parents stay live).
+# all_<table> temp views union both sides with an "archived" flag so pages
+# can read archived rows through the same queries.
+
+ARCHIVE_JOB_TABLES = ['render_job_ingredients', 'media_assets', 'top_layer_jobs', 'project_jobs', 'prompts']
+_REFERENCES_RE = re.compile(r'\s+REFERENCES\s+\w+\s*\(\w+\)(\s+ON\s+(DELETE|UPDATE)\s+(SET\s+NULL|SET\s+DEFAULT|CASCADE|RESTRICT|NO\s+ACTION))*', re.I)
+
+
+def _columns(db, table, schema='main'):
+    return [r[1] for r in db.execute(f'PRAGMA {schema}.table_info({table})').fetchall()]
+
+
+def _sync_archive_schema(db, tables):
+    db.execute('PRAGMA archive.journal_mode=WAL')
+    for t in tables:
+        ddl = db.execute("SELECT sql FROM main.sqlite_master WHERE type='table' AND name=?", [t]).fetchone()[0]
+        ddl = _REFERENCES_RE.sub('', ddl)
+        db.execute(re.sub(r'^CREATE TABLE\s+(IF NOT EXISTS\s+)?"?\w+"?', f'CREATE TABLE IF NOT EXISTS archive.{t}', ddl))
+        # Columns added to the live table by later migrations
+        have = set(_columns(db, t, 'archive'))
+        for col in db.execute(f'PRAGMA main.table_info({t})').fetchall():
+            if col[1] not in have:
+                default = f' DEFAULT {col[4]}' if col[4] is not None else ''
+                db.execute(f'ALTER TABLE archive.{t} ADD COLUMN {col[1]} {col[2]}{default}')
+        if t != 'render_jobs':
+            db.execute(f'CREATE INDEX IF NOT EXISTS archive.idx_{t}_job ON {t}(job_id)')
+    db.commit()
+    current_workspace().archive_synced = True
+
+
+def attach_archive(db, create=False):
+    """Attach the archive file and create the all_* views. Returns False if there is no archive yet."""
+    tables = ['render_jobs'] + ARCHIVE_JOB_TABLES
+    ws = current_workspace()
+    attached = any(r[1] == 'archive' for r in db.execute('PRAGMA database_list'))
+    if not attached and (create or os.path.exists(ws.archive)):
+        db.execute('ATTACH DATABASE ? AS archive', [ws.archive])
+        attached = True
+    if attached and (create or not ws.archive_synced):
+        _sync_archive_schema(db, tables)
+    for t in tables:
+        cols = ', '.join(_columns(db, t))
+        db.execute(f'DROP VIEW IF EXISTS temp.all_{t}')
+        union = f' UNION ALL SELECT {cols}, 1 AS archived FROM archive.{t}' if attached else ''
+        db.execute(f'CREATE TEMP VIEW all_{t} AS SELECT {cols}, 0 AS archived FROM main.{t}{union}')
+    return attached
+
+
+def _move_jobs(db, src, dst, id_table):
+    """Copy the jobs listed in id_table and their dependents from src to dst, then delete them from src."""
+    order = ['render_jobs'] + ARCHIVE_JOB_TABLES   # parents first on insert, last on delete
+    # Archive moves are local housekeeping; keep them out of the sync log
+    db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('origin', '-')")
+    for t in order:
+        cols = ', '.join(_columns(db, t))
+        key = 'id' if t == 'render_jobs' else 'job_id'
+        db.execute(f'INSERT OR REPLACE INTO {dst}.{t} ({cols}) SELECT {cols} FROM {src}.{t} WHERE {key} IN (SELECT id FROM {id_table})')
+    moved = {}
+    for t in reversed(order):
+        key = 'id' if t == 'render_jobs' else 'job_id'
+        moved[t] = db.execute(f'DELETE FROM {src}.{t} WHERE {key} IN (SELECT id FROM {id_table})').rowcount
+    db.execute("DELETE FROM sync_state WHERE key='origin'")
+    # Moves aren't in the change log, so give cached views their own version bump
+    db.execute("INSERT INTO sync_state (key, value) VALUES ('archive_moves', 1)"
+               " ON CONFLICT(key) DO UPDATE SET value=value+1")
+    return moved
+
+
+def archive_jobs(db, older_than_days=90, batch_size=500, max_batches=None):
+    """Move completed jobs untouched for older_than_days into the archive, one
+    transaction per batch. Returns row counts moved per table.
+
+    In WAL mode SQLite commits each attached file separately, so a crash can
+    leave a batch in both files; rows are copied with INSERT OR REPLACE, so
+    rerunning finishes the move without duplicates.
+    """
+    attach_archive(db, create=True)
+    db.commit()
+    cutoff = f'-{int(older_than_days)} days'
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    totals, batches = {}, 0
+    while max_batches is None or batches < max_batches:
+        db.execute('DELETE FROM temp.archive_batch')
+        db.execute('''INSERT INTO temp.archive_batch (id) SELECT rj.id FROM main.render_jobs rj
+            WHERE rj.status='complete' AND COALESCE(
+                (SELECT MAX(created_at) FROM job_status_events e WHERE e.job_id=rj.id), rj.created_at
+            ) < datetime('now', ?) ORDER BY rj.id LIMIT ?''', [cutoff, batch_size])
+        if not db.execute('SELECT COUNT(*) FROM temp.archive_batch').fetchone()[0]:
+            db.commit()
+            break
+        for t, n in _move_jobs(db, 'main', 'archive', 'temp.archive_batch').items():
+            totals[t] = totals.get(t, 0) + n
+        db.commit()
+        batches += 1
+    return totals
+
+
+def restore_job(db, job_id):
+    """Move one archived job and its dependents back into the live tables."""
+    if not attach_archive(db):
+        return {}
+    db.commit()
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+    db.execute('DELETE FROM temp.archive_batch')
+    db.execute('INSERT INTO temp.archive_batch (id) SELECT id FROM archive.render_jobs WHERE id=?', [job_id])
+    try:
+        moved = _move_jobs(db, 'archive', 'main', 'temp.archive_batch')
+    except sqlite3.IntegrityError:
+        db.rollback()
+        raise
+    db.commit()
+    return moved
+
+
+def archive_stats(db):
+    attached = attach_archive(db)
+    stats = {}
+    for t in ['render_jobs'] + ARCHIVE_JOB_TABLES:
+        live = db.execute(f'SELECT COUNT(*) FROM main.{t}').fetchone()[0]
+        archived = db.execute(f'SELECT COUNT(*) FROM archive.{t}').fetchone()[0] if attached else 0
+        stats[t] = {'live': live, 'archived': archived}
+    return stats
+
+
+
+# ─── Deletes ──────────────────────────────────────────────────────────────────
+# Every foreign key carries an ON DELETE action (migrate_db_v14), so deleting
+# a parent takes its live dependents with it in the same statement. The
+# archive has no foreign keys; delete_rows() applies the same actions to
+# archived rows, and sweep_orphans() clears anything older databases left
+# behind. LOOSE_REFS are id columns without a constraint (history, per-project
+# aggregates, scan results) that go with their parent all the same.
+
+FK_ACTIONS = [   # (table, column, parent, action)
+    ('characters', 'archetype_id', 'archetypes', 'SET NULL'),
+    ('ingredients', 'category_id', 'ingredient_categories', 'CASCADE'),
+    ('output_type_requirements', 'output_type_id', 'output_types', 'CASCADE'),
+    ('output_type_requirements', 'category_id', 'ingredient_categories', 'CASCADE'),
+    ('render_jobs', 'character_id', 'characters', 'SET NULL'),
+    ('render_jobs', 'output_type_id', 'output_types', 'SET NULL'),
+    ('render_job_ingredients', 'job_id', 'render_jobs', 'CASCADE'),
+    ('render_job_ingredients', 'ingredient_id', 'ingredients', 'CASCADE'),
+    ('media_assets', 'job_id', 'render_jobs', 'SET NULL'),
+    ('media_assets', 'character_id', 'characters', 'SET NULL'),
+    ('media_assets', 'output_type_id', 'output_types', 'SET NULL'),
+    ('ingredient_rules', 'source_ingredient_id', 'ingredients', 'CASCADE'),
+    ('ingredient_rules', 'source_category_id', 'ingredient_categories', 'CASCADE'),
+    ('ingredient_rules', 'target_ingredient_id', 'ingredients', 'CASCADE'),
+    ('ingredient_rules', 'target_category_id', 'ingredient_categories', 'CASCADE'),
+    ('top_layer_jobs', 'top_layer_id', 'top_layer_media', 'CASCADE'),
+    ('top_layer_jobs', 'job_id', 'render_jobs', 'CASCADE'),
+    ('project_jobs', 'project_id', 'projects', 'CASCADE'),
+    ('project_jobs', 'job_id', 'render_jobs', 'CASCADE'),
+    ('prompts', 'project_id', 'projects', 'CASCADE'),
+    ('prompts', 'job_id', 'render_jobs', 'SET NULL'),
+]
+LOOSE_REFS = [   # (table, column, parent, extra condition)
+    ('job_status_events', 'job_id', 'render_jobs', None),
+    ('job_stage_durations', 'job_id', 'render_jobs', None),
+    ('job_timeline_buckets', 'project_id', 'projects', 'project_id != 0'),
+    ('job_stage_histogram', 'project_id', 'projects', 'project_id != 0'),
+    ('media_files', 'ref_id', 'media_assets', "source='media'"),
+    ('media_files', 'ref_id', 'top_layer_media', "source='top_layer'"),
+    ('coverage_counts', 'a', 'characters', "kind IN ('char', 'char_ing')"),
+    ('coverage_counts', 'a', 'ingredients', "kind IN ('ing', 'ing_pair')"),
+    ('coverage_counts', 'b', 'ingredients', "kind IN ('char_ing', 'ing_pair')"),
+]
+
+
+def _orphaned(col, parent, archived=False):
+    """WHERE clause for rows whose col names no row in parent (live or, for jobs, archived)."""
+    parents = ['main.render_jobs', 'archive.render_jobs'] if parent == 'render_jobs' and archived else [f'main.{parent}']
+    return f'{col} IS NOT NULL AND ' + ' AND '.join(f'{col} NOT IN (SELECT id FROM {p})' for p in parents)
+
+
+def _apply_action(db, schema, table, col, action, where):
+    if action == 'CASCADE':
+        return db.execute(f'DELETE FROM {schema}.{table} WHERE {where}').rowcount
+    return db.execute(f'UPDATE {schema}.{table} SET {col}=NULL WHERE {where}').rowcount
+
+
+def _clear_orphans(db, archived=False, loose=False):
+    """Apply FK_ACTIONS (and LOOSE_REFS if loose) to rows whose parent is
+    gone, repeating until a pass finds nothing, since clearing one level can
+    orphan the next. archived says the archive is attached and swept too.
+    Returns row counts per table.column.
+    """
+    archive_tables = ['render_jobs'] + ARCHIVE_JOB_TABLES
+    counts = {}
+    while True:
+        found = 0
+        for t, col, parent, action in FK_ACTIONS:
+            for schema in ('main', 'archive') if archived and t in archive_tables else ('main',):
+                n = _apply_action(db, schema, t, col, action, _orphaned(col, parent, archived))
+                if n:
+                    key = f'{"archived " if schema == "archive" else ""}{t}.{col}'
+                    counts[key] = counts.get(key, 0) + n
+                    found += n
+        if not found:
+            break
+    # Archived jobs keep their history, so without the archive attached these
+    # would look orphaned
+    for t, col, parent, cond in LOOSE_REFS if loose else []:
+        n = _apply_action(db, 'main', t, col, 'CASCADE', _orphaned(col, parent, archived) + (f' AND {cond}' if cond else ''))
+        if n:
+            counts[f'{t}.{col}'] = n
+    return counts
+
+
+def delete_rows(db, table, ids):
+    """Delete ids from table in one statement and return how many went.
+
+    ON DELETE actions handle live dependents; archived rows and LOOSE_REFS
+    pointing at anything removed get the same treatment here. Does not commit.
+    """
+    ids = {int(i) for i in ids}
+    if not ids:
+        return 0
+    archived = attach_archive(db)   # may commit on first attach, so before any writes
+    db.execute('CREATE TEMP TABLE IF NOT EXISTS delete_batch (id INTEGER PRIMARY KEY)')
+    db.execute('DELETE FROM temp.delete_batch')
+    db.executemany('INSERT INTO temp.delete_batch (id) VALUES (?)', [(i,) for i in ids])
+    deleted = db.execute(f'DELETE FROM main.{table} WHERE id IN (SELECT id FROM temp.delete_batch)').rowcount
+    # Tables that lost rows through cascades as well
+    gone, frontier = {table}, [table]
+    while frontier:
+        p = frontier.pop()
+        for t, col, parent, action in FK_ACTIONS:
+            if parent == p and action == 'CASCADE' and t not in gone:
+                gone.add(t)
+                frontier.append(t)
+    # Archived rows belong to archived jobs, so live job deletes never reach them
+    if archived:
+        for t, col, parent, action in FK_ACTIONS:
+            if t in ARCHIVE_JOB_TABLES + ['render_jobs'] and parent in gone and parent != 'render_jobs':
+                where = f'{col} IN (SELECT id FROM temp.delete_batch)' if parent == table else _orphaned(col, parent)
+                _apply_action(db, 'archive', t, col, action, where)
+    # Coverage counts too: archived jobs have no triggers to uncount them
+    for t, col, parent, cond in LOOSE_REFS:
+        if parent in gone:
+            where = f'{col} IN (SELECT id FROM temp.delete_batch)' if parent == table else _orphaned(col, parent, archived)
+            _apply_action(db, 'main', t, col, 'CASCADE', where + (f' AND {cond}' if cond else ''))
+    return deleted
+
+
+def _database_bytes(db, schemas):
+    return sum(db.execute(f'PRAGMA {s}.page_count').fetchone()[0] * db.execute(f'PRAGMA {s}.page_size').fetchone()[0]
+               for s in schemas)
+
+
+def sweep_orphans(db, vacuum=True):
+    """Clear every row left pointing at a deleted parent, live and archived,
+    then VACUUM and ANALYZE. Returns the rows cleared per table.column and the
+    database size before and after in bytes.
+    """
+    schemas = ['main', 'archive'] if attach_archive(db) else ['main']
+    db.commit()
+    before = _database_bytes(db, schemas)
+    rows = _clear_orphans(db, archived=len(schemas) > 1, loose=True)
+    db.commit()
+    if vacuum:
+        for s in schemas:
+            db.execute(f'VACUUM {s}')
+        db.execute('ANALYZE')
+        db.commit()
+    return {'rows': rows, 'bytes_before': before, 'bytes_after': _database_bytes(db, schemas)}
+
+
+# ─── Sync ─────────────────────────────────────────────────────────────────────
+# Triggers on every user table keep a per-row updated_at and sync_uid (a
+# random identity, so two instances creating different rows with the same id
+# can be told apart from two copies of one row) and log each change
+# to sync_changes: one row per (table, id) holding the latest op, re-inserted
+# on every change so its seq only grows. Deletes leave a tombstone. A peer
+# asks for changes after the last seq it saw and applies them with
+# apply_changes(), so transfers scale with edits, not database size.
+#
+# sync_state 'origin' is set inside a writing transaction to tag the changes
+# it logs: a peer's instance id while applying that peer's changes (so they are
+# not echoed back), or '-' to skip logging (archive moves are local only).
+
+SYNC_TABLES = [
+    'archetypes', 'characters', 'ingredient_categories', 'ingredients',
+    'output_types', 'output_type_requirements', 'render_jobs',
+    'render_job_ingredients', 'media_assets', 'ingredient_rules',
+    'top_layer_media', 'top_layer_jobs', 'projects', 'project_jobs',
+    'prompts', 'dock_config',
+]
+# What identifies a row of the tables with no created_at, for the sync_uid
+# migrate_db_v6 gives rows that existed before change tracking.
+SYNC_ROW_KEYS = {
+    'output_type_requirements': ('output_type_id', 'category_id'),
+    'render_job_ingredients': ('job_id', 'ingredient_id'),
+    'top_layer_jobs': ('top_layer_id', 'job_id'),
+    'project_jobs': ('project_id', 'job_id'),
+    'dock_config': ('slot',),
+}
+_NOW_MS = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+_ORIGIN = "(SELECT value FROM sync_state WHERE key='origin')"
+
+
+def install_sync_triggers(conn):
+    """(Re)create the change-tracking triggers. Safe to call after any table rebuild."""
+    # Delete-then-insert rather than INSERT OR REPLACE: the outer statement's
+    # conflict handling overrides a trigger's, and the updates behind ON DELETE
+    # SET NULL run as plain ABORT.
+    def log(t, row, op):
+        return (f"DELETE FROM sync_changes WHERE table_name='{t}' AND row_id={row};"
+                f" INSERT INTO sync_changes (table_name, row_id, op, changed_at, origin)"
+                f" VALUES ('{t}', {row}, '{op}', {_NOW_MS}, {_ORIGIN});")
+    for t in SYNC_TABLES:
+        conn.executescript(f'''
+            DROP TRIGGER IF EXISTS sync_{t}_ins;
+            DROP TRIGGER IF EXISTS sync_{t}_upd;
+            DROP TRIGGER IF EXISTS sync_{t}_del;
+            CREATE TRIGGER sync_{t}_ins AFTER INSERT ON {t} WHEN {_ORIGIN} IS NOT '-' BEGIN
+                UPDATE {t} SET updated_at=COALESCE(NEW.updated_at, {_NOW_MS}),
+                    sync_uid=COALESCE(NEW.sync_uid, lower(hex(randomblob(16))))
+                    WHERE id=NEW.id AND (NEW.updated_at IS NULL OR NEW.sync_uid IS NULL);
+                {log(t, 'NEW.id', 'upsert')}
+            END;
+            CREATE TRIGGER sync_{t}_upd AFTER UPDATE ON {t} WHEN {_ORIGIN} IS NOT '-' BEGIN
+                UPDATE {t} SET updated_at={_NOW_MS} WHERE id=NEW.id AND NEW.updated_at IS OLD.updated_at;
+                {log(t, 'NEW.id', 'upsert')}
+            END;
+            CREATE TRIGGER sync_{t}_del AFTER DELETE ON {t} WHEN {_ORIGIN} IS NOT '-' BEGIN
+                {log(t, 'OLD.id', 'delete')}
+            END;
+        ''')
+
+
+def _backfill_stamp(t, cols):
+    # Tables with no created_at are stamped with the upgrade time: an empty
+    # updated_at would lose to every peer's copy under newest-wins.
+    return 'COALESCE(created_at, CURRENT_TIMESTAMP)' if 'created_at' in cols else 'CURRENT_TIMESTAMP'
+
+
+def _backfill_uid(t, cols):
+    key = ['created_at'] if 'created_at' in cols else SYNC_ROW_KEYS[t]
+    return f"'{t}:' || id || ':' || " + " || ':' || ".join(f"COALESCE({c}, '')" for c in key)
+
+
+def migrate_db_v6():
+    """Add change tracking (updated_at, sync_changes log, triggers) for delta sync."""
+    import uuid
+    conn = get_db()
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS sync_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL,
+            origin TEXT,
+            UNIQUE (table_name, row_id)
+        );
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            url TEXT PRIMARY KEY,
+            instance_id TEXT DEFAULT '',
+            last_pulled_seq INTEGER DEFAULT 0,
+            last_pushed_seq INTEGER DEFAULT 0,
+            last_synced_at TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS sync_conflicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            origin TEXT DEFAULT '',
+            reason TEXT DEFAULT '',
+            remote_row TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    conn.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('instance_id', ?)", [uuid.uuid4().hex])
+    for t in SYNC_TABLES:
+        cols = _columns(conn, t)
+        if 'updated_at' in cols:
+            continue
+        # First run for this table: stamp existing rows and log them so a new
+        # peer's first pull (since=0) receives everything. Existing rows get a
+        # sync_uid derived from the row itself, so installs restored from the
+        # same export agree on it.
+        conn.execute(f'ALTER TABLE {t} ADD COLUMN updated_at TIMESTAMP')
+        conn.execute(f'ALTER TABLE {t} ADD COLUMN sync_uid TEXT')
+        conn.execute(f"UPDATE {t} SET updated_at={_backfill_stamp(t, cols)}, sync_uid={_backfill_uid(t, cols)}")
+        conn.execute(f"""INSERT OR REPLACE INTO sync_changes (table_name, row_id, op, changed_at)
+            SELECT '{t}', id, 'upsert', updated_at FROM {t} ORDER BY id""")
+    conn.commit()
+    install_sync_triggers(conn)
+    conn.commit()
+    conn.close()
+
+
+def table_versions(db, tables):
+    """Latest change-log seq for each table plus the archive move count.
+
+    Changes whenever any of the tables is written, by any process, so it can
+    tag cached data derived from them.
+    """
+    cols = ', '.join("(SELECT MAX(seq) FROM sync_changes WHERE table_name=?)" for _ in tables)
+    return tuple(db.execute(f"SELECT {cols}, (SELECT value FROM sync_state WHERE key='archive_moves')",
+                            list(tables)).fetchone())
+
+
+def sync_instance_id(db):
+    return db.execute("SELECT value FROM sync_state WHERE key='instance_id'").fetchone()[0]
+
+
+def get_changes(db, since=0, limit=500, exclude_origin=None):
+    """Changes after seq `since`, with current row data for upserts.
+
+    Returns (changes, next_since, more). Changes that came from exclude_origin
+    are skipped but still advance next_since.
+    """
+    log = db.execute('SELECT * FROM sync_changes WHERE seq>? ORDER BY seq LIMIT ?', [since, limit]).fetchall()
+    changes = []
+    for c in log:
+        if exclude_origin and c['origin'] == exclude_origin:
+            continue
+        change = {'seq': c['seq'], 'table': c['table_name'], 'id': c['row_id'], 'op': c['op'], 'changed_at': c['changed_at']}
+        if c['op'] == 'upsert':
+            row = db.execute(f"SELECT * FROM {c['table_name']} WHERE id=?", [c['row_id']]).fetchone()
+            if not row:
+                continue
+            change['row'] = dict(row)
+        changes.append(change)
+    next_since = log[-1]['seq'] if log else since
+    return changes, next_since, len(log) == limit
+
+
+def _sync_conflict(db, change, origin, reason):
+    db.execute('INSERT INTO sync_conflicts (table_name, row_id, origin, reason, remote_row) VALUES (?,?,?,?,?)',
+               [change['table'], change['id'], origin, reason, json.dumps(change.get('row', {}))])
+
+
+def apply_changes(db, origin, changes):
+    """Apply a peer's changes in one transaction.
+
+    Conflict rules:
+      - newer updated_at wins; on a tie the higher instance id wins
+      - a delete loses to a local edit made after it, and an upsert loses to a
+        newer local tombstone
+      - same id but different sync_uid means both sides created unrelated
+        rows with that id: logged to sync_conflicts, local row kept
+    """
+    local_id = sync_instance_id(db)
+    stats = {'applied': 0, 'skipped': 0, 'conflicts': 0}
+    rank = {t: i for i, t in enumerate(SYNC_TABLES)}
+    changes = [c for c in changes if c.get('table') in rank]
+    db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES ('origin', ?)", [origin])
+    db.execute('PRAGMA defer_foreign_keys=ON')
+
+    def remote_wins(local_ts, remote_ts):
+        return (remote_ts or '') > (local_ts or '') or (remote_ts == local_ts and origin > local_id)
+
+    try:
+        for c in sorted((c for c in changes if c['op'] == 'upsert'), key=lambda c: rank[c['table']]):
+            t, cols = c['table'], set(_columns(db, c['table']))
+            row = {k: v for k, v in c.get('row', {}).items() if k in cols}
+            remote_ts = row.get('updated_at') or c['changed_at']
+            local = db.execute(f'SELECT * FROM {t} WHERE id=?', [c['id']]).fetchone()
+            if local:
+                if row.get('sync_uid') and local['sync_uid'] and row['sync_uid'] != local['sync_uid']:
+                    _sync_conflict(db, c, origin, 'id collision: different row created on each side')
+                    stats['conflicts'] += 1
+                    continue
+                if not remote_wins(local['updated_at'], remote_ts):
+                    stats['skipped'] += 1
+                    continue
+                sets = ', '.join(f'{k}=?' for k in row if k != 'id')
+                db.execute(f'UPDATE {t} SET {sets} WHERE id=?', [v for k, v in row.items() if k != 'id'] + [c['id']])
+            else:
+                tomb = db.execute("SELECT changed_at FROM sync_changes WHERE table_name=? AND row_id=? AND op='delete'",
+                                  [t, c['id']]).fetchone()
+                if tomb and not remote_wins(tomb[0], remote_ts):
+                    stats['skipped'] += 1
+                    continue
+                db.execute(f"INSERT INTO {t} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+            stats['applied'] += 1
+        for c in sorted((c for c in changes if c['op'] == 'delete'), key=lambda c: -rank[c['table']]):
+            local = db.execute(f"SELECT updated_at FROM {c['table']} WHERE id=?", [c['id']]).fetchone()
+            if not local or not remote_wins(local['updated_at'], c['changed_at']):
+                stats['skipped'] += 1
+                continue
+            db.execute(f"DELETE FROM {c['table']} WHERE id=?", [c['id']])
+            stats['applied'] += 1
+        db.execute("DELETE FROM sync_state WHERE key='origin'")
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return stats
+
+
+# ─── Prompt queue ─────────────────────────────────────────────────────────────
+# Operators claim the next N pending prompts in one UPDATE ... RETURNING, so
+# two docks can never collect the same prompt. A claim is a lease: prompts
+# still 'collected' when it expires go back to pending on the next claim.
+# BEGIN IMMEDIATE takes the write lock up front; concurrent claimers queue on
+# the busy timeout instead of failing to upgrade a read lock.
+
+PROMPT_LEASE_SECONDS = 900
+_QUEUE_SCOPES = {
+    'project': 'project_id=?',
+    'job': 'job_id=? OR project_id IN (SELECT project_id FROM project_jobs WHERE job_id=?)',
+}
+
+
+def release_expired_claims(db):
+    return db.execute("""UPDATE prompts SET status='pending', claimed_by=NULL, claim_expires_at=NULL
+        WHERE claim_expires_at IS NOT NULL AND claim_expires_at < CURRENT_TIMESTAMP
+          AND status='collected'""").rowcount
+
+
+def claim_prompts(db, claimant, n=1, project_id=None, job_id=None, lease_seconds=PROMPT_LEASE_SECONDS):
+    """Atomically mark up to n of the oldest pending prompts as collected by claimant.
+
+    Scope to a project or a job (a job's own prompts plus those of its
+    projects); with neither, claims from every pending prompt. Returns the
+    claimed rows, oldest first.
+    """
+    where, params = '1=1', []
+    if job_id:
+        where, params = _QUEUE_SCOPES['job'], [job_id, job_id]
+    elif project_id:
+        where, params = _QUEUE_SCOPES['project'], [project_id]
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        release_expired_claims(db)
+        rows = db.execute(f"""UPDATE prompts SET status='collected', claimed_by=?,
+                claim_expires_at=datetime('now', ?)
+            WHERE id IN (SELECT id FROM prompts WHERE status='pending' AND ({where})
+                         ORDER BY created_at, id LIMIT ?)
+            RETURNING *""", [claimant, f'+{int(lease_seconds)} seconds'] + params + [n]).fetchall()
+        db.commit()
+    except sqlite3.Error:
+        db.rollback()
+        raise
+    return sorted(rows, key=lambda r: (r['created_at'], r['id']))
+
+
+def renew_claims(db, claimant, ids, lease_seconds=PROMPT_LEASE_SECONDS):
+    """Extend the lease on prompts still held by claimant; returns the ids renewed."""
+    if not ids:
+        return []
+    rows = db.execute(f"""UPDATE prompts SET claim_expires_at=datetime('now', ?)
+        WHERE claimed_by=? AND status='collected' AND id IN ({','.join('?' * len(ids))})
+        RETURNING id""", [f'+{int(lease_seconds)} seconds', claimant] + list(ids)).fetchall()
+    db.commit()
+    return [r['id'] for r in rows]
+
+
+def release_claims(db, claimant, ids):
+    """Hand prompts held by claimant back to the queue; returns the ids released."""
+    if not ids:
+        return []
+    rows = db.execute(f"""UPDATE prompts SET status='pending', claimed_by=NULL, claim_expires_at=NULL
+        WHERE claimed_by=? AND status='collected' AND id IN ({','.join('?' * len(ids))})
+        RETURNING id""", [claimant] + list(ids)).fetchall()
+    db.commit()
+    return [r['id'] for r in rows]
+
+
+# ─── Coverage planner ─────────────────────────────────────────────────────────
+# coverage_counts holds how often each thing has been planned, kept current by
+# triggers so the planner never scans render_job_ingredients:
+#   ('ing', ingredient_id, 0)   ('char', character_id, 0)
+#   ('char_ing', character_id, ingredient_id)   ('ing_pair', low id, high id)
+# Archive moves run with origin '-' and are skipped, so archived jobs still
+# count as covered. rebuild_coverage() recounts from scratch if drift is ever
+# suspected (e.g. rows changed with the triggers missing).
+
+PLANNER_CANDIDATES = 8      # lowest-use ingredients scored per category per job
+
+
+def _upsert_count(kind, a, b, source):
+    return (f"INSERT INTO coverage_counts (kind, a, b, count) SELECT '{kind}', {a}, {b}, 1 {source}"
+            f" ON CONFLICT DO UPDATE SET count=count+1;")
+
+
+def install_coverage_triggers(conn):
+    """(Re)create the coverage counter triggers. Safe to call after any table rebuild."""
+    live = f"{_ORIGIN} IS NOT '-'"
+    conn.executescript(f'''
+        DROP TRIGGER IF EXISTS coverage_rji_ins;
+        DROP TRIGGER IF EXISTS coverage_rji_del;
+        DROP TRIGGER IF EXISTS coverage_job_ins;
+        DROP TRIGGER IF EXISTS coverage_job_del;
+        DROP TRIGGER IF EXISTS coverage_job_char;
+
+        CREATE TRIGGER coverage_rji_ins AFTER INSERT ON render_job_ingredients
+        WHEN {live} AND NEW.ingredient_id IS NOT NULL BEGIN
+            {_upsert_count('ing', 'NEW.ingredient_id', 0, 'WHERE 1')}
+            {_upsert_count('char_ing', 'character_id', 'NEW.ingredient_id',
+                           'FROM render_jobs WHERE id=NEW.job_id AND character_id IS NOT NULL')}
+            {_upsert_count('ing_pair', 'MIN(ingredient_id, NEW.ingredient_id)', 'MAX(ingredient_id, NEW.ingredient_id)',
+                           'FROM render_job_ingredients WHERE job_id=NEW.job_id AND id!=NEW.id'
+                           ' AND ingredient_id IS NOT NULL AND ingredient_id!=NEW.ingredient_id')}
+        END;
+
+        CREATE TRIGGER coverage_rji_del AFTER DELETE ON render_job_ingredients
+        WHEN {live} AND OLD.ingredient_id IS NOT NULL BEGIN
+            UPDATE coverage_counts SET count=count-1 WHERE kind='ing' AND a=OLD.ingredient_id AND b=0;
+            UPDATE coverage_counts SET count=count-1 WHERE kind='char_ing' AND b=OLD.ingredient_id
+                AND a=(SELECT character_id FROM render_jobs WHERE id=OLD.job_id);
+            UPDATE coverage_counts SET count=count-1 WHERE kind='ing_pair' AND a=OLD.ingredient_id
+                AND b IN (SELECT ingredient_id FROM render_job_ingredients WHERE job_id=OLD.job_id AND ingredient_id>OLD.ingredient_id);
+            UPDATE coverage_counts SET count=count-1 WHERE kind='ing_pair' AND b=OLD.ingredient_id
+                AND a IN (SELECT ingredient_id FROM render_job_ingredients WHERE job_id=OLD.job_id AND ingredient_id<OLD.ingredient_id);
+        END;
+
+        CREATE TRIGGER coverage_job_ins AFTER INSERT ON render_jobs
+        WHEN {live} AND NEW.character_id IS NOT NULL BEGIN
+            {_upsert_count('char', 'NEW.character_id', 0, 'WHERE 1')}
+        END;
+
+        -- Ingredients removed before their job were already uncounted against
+        -- the character above; any still attached are uncounted here, before
+        -- ON DELETE CASCADE removes them and the job is gone from the lookup.
+        CREATE TRIGGER coverage_job_del BEFORE DELETE ON render_jobs
+        WHEN {live} AND OLD.character_id IS NOT NULL BEGIN
+            UPDATE coverage_counts SET count=count-1 WHERE kind='char' AND a=OLD.character_id AND b=0;
+            UPDATE coverage_counts SET count=count-1 WHERE kind='char_ing' AND a=OLD.character_id
+                AND b IN (SELECT ingredient_id FROM render_job_ingredients WHERE job_id=OLD.id);
+        END;
+
+        CREATE TRIGGER coverage_job_char AFTER UPDATE OF character_id ON render_jobs
+        WHEN {live} AND OLD.character_id IS NOT NEW.character_id BEGIN
+            UPDATE coverage_counts SET count=count-1 WHERE kind='char' AND a=OLD.character_id AND b=0;
+            UPDATE coverage_counts SET count=count-1 WHERE kind='char_ing' AND a=OLD.character_id
+                AND b IN (SELECT ingredient_id FROM render_job_ingredients WHERE job_id=NEW.id);
+            {_upsert_count('char', 'NEW.character_id', 0, 'WHERE NEW.character_id IS NOT NULL')}
+            {_upsert_count('char_ing', 'NEW.character_id', 'ingredient_id',
+                           'FROM render_job_ingredients WHERE job_id=NEW.id AND NEW.character_id IS NOT NULL'
+                           ' AND ingredient_id IS NOT NULL')}
+        END;
+    ''')
+
+
+def rebuild_coverage(db):
+    """Recount coverage_counts from live and archived jobs."""
+    attach_archive(db)
+    db.execute('DELETE FROM coverage_counts')
+    db.executescript('''
+        INSERT INTO coverage_counts (kind, a, b, count)
+            SELECT 'char', character_id, 0, COUNT(*) FROM all_render_jobs
+            WHERE character_id IS NOT NULL GROUP BY character_id;
+        INSERT INTO coverage_counts (kind, a, b, count)
+            SELECT 'ing', ingredient_id, 0, COUNT(*) FROM all_render_job_ingredients
+            WHERE ingredient_id IS NOT NULL GROUP BY ingredient_id;
+        INSERT INTO coverage_counts (kind, a, b, count)
+            SELECT 'char_ing', rj.character_id, rji.ingredient_id, COUNT(*)
+            FROM all_render_job_ingredients rji JOIN all_render_jobs rj ON rj.id=rji.job_id
+            WHERE rj.character_id IS NOT NULL AND rji.ingredient_id IS NOT NULL
+            GROUP BY rj.character_id, rji.ingredient_id;
+        INSERT INTO coverage_counts (kind, a, b, count)
+            SELECT 'ing_pair', x.ingredient_id, y.ingredient_id, COUNT(*)
+            FROM all_render_job_ingredients x JOIN all_render_job_ingredients y
+              ON x.job_id=y.job_id AND x.ingredient_id < y.ingredient_id
+            GROUP BY x.ingredient_id, y.ingredient_id;
+    ''')
+
+
+class _UsageHeap:
+    """Min-heap of ids by usage count with lazy invalidation on bump()."""
+
+    def __init__(self, ids, counts, rng):
+        self.counts, self.rng = counts, rng
+        self.heap = [(counts.get(i, 0), rng.random(), i) for i in ids]
+        heapq.heapify(self.heap)
+
+    def bump(self, i):
+        self.counts[i] = self.counts.get(i, 0) + 1
+        heapq.heappush(self.heap, (self.counts[i], self.rng.random(), i))
+
+    def lowest(self, n):
+        """The n least-used ids (fewer if the heap is smaller), without removing them."""
+        out, seen = [], set()
+        while self.heap and len(out) < n:
+            entry = heapq.heappop(self.heap)
+            if entry[2] in seen or entry[0] != self.counts.get(entry[2], 0):
+                continue    # stale or duplicate entry
+            seen.add(entry[2])
+            out.append(entry)
+        for entry in out:
+            heapq.heappush(self.heap, entry)
+        return [e[2] for e in out]
+
+
+def coverage_summary(db):
+    """Covered vs possible ingredients, characters and character x ingredient pairs."""
+    row = db.execute('''SELECT
+        (SELECT COUNT(*) FROM ingredients), (SELECT COUNT(*) FROM coverage_counts WHERE kind='ing' AND count>0),
+        (SELECT COUNT(*) FROM characters WHERE status!='retired'),
+        (SELECT COUNT(*) FROM coverage_counts WHERE kind='char' AND count>0),
+        (SELECT COUNT(*) FROM coverage_counts WHERE kind='char_ing' AND count>0),
+        (SELECT COUNT(*) FROM coverage_counts WHERE kind='ing_pair' AND count>0)''').fetchone()
+    return {'ingredients': row[0], 'ingredients_used': row[1], 'characters': row[2], 'characters_used': row[3],
+            'char_ingredient_pairs': row[2] * row[0], 'char_ingredient_pairs_used': row[4],
+            'ingredient_pairs_used': row[5]}
+
+
+def plan_jobs(db, k, output_type_ids=None, character_ids=None, seed=None):
+    """Greedily propose k jobs that add the most new coverage.
+
+    Each job takes the least-planned eligible output type and character, then,
+    per required category, whichever of its PLANNER_CANDIDATES least-used
+    ingredients scores best on 1/(1+n) over the ingredient, the character x
+    ingredient pair and its pairs with ingredients already in the job. Counts
+    are bumped in memory after every pick, so later jobs spread out.
+    Output types with a required category that has no ingredients are skipped.
+    Returns (jobs, stats) where stats counts the pairs first covered by the plan.
+    """
+    rng = random.Random(seed)
+    counts = {}
+    for kind, a, b, n in db.execute('SELECT kind, a, b, count FROM coverage_counts WHERE count>0'):
+        counts.setdefault(kind, {})[a if kind in ('ing', 'char') else (a, b)] = n
+    ing_c, char_c = counts.get('ing', {}), counts.get('char', {})
+    char_ing_c, pair_c = counts.get('char_ing', {}), counts.get('ing_pair', {})
+
+    chars = {r['id']: r for r in db.execute("SELECT id, name FROM characters WHERE status!='retired'")}
+    if character_ids:
+        chars = {i: c for i, c in chars.items() if i in set(character_ids)}
+    cats, ings = {}, {}
+    for r in db.execute('''SELECT i.id, i.name, i.code, i.category_id, ic.name AS category_name
+            FROM ingredients i JOIN ingredient_categories ic ON ic.id=i.category_id'''):
+        ings[r['id']] = r
+        cats.setdefault(r['category_id'], []).append(r['id'])
+    reqs = {}
+    for r in db.execute('''SELECT otr.output_type_id, otr.category_id, ic.name AS category_name
+            FROM output_type_requirements otr JOIN ingredient_categories ic ON ic.id=otr.category_id
+            ORDER BY ic.name'''):
+        reqs.setdefault(r['output_type_id'], []).append((r['category_id'], r['category_name']))
+    ots = {r['id']: r for r in db.execute('SELECT id, name FROM output_types')
+           if (not output_type_ids or r['id'] in set(output_type_ids))
+           and all(c in cats for c, _ in reqs.get(r['id'], []))}
+    if not chars or not ots:
+        return [], {'char_ingredient_pairs_new': 0, 'ingredient_pairs_new': 0, 'ingredients_new': 0}
+
+    ot_c = dict(db.execute('SELECT output_type_id, COUNT(*) FROM render_jobs GROUP BY output_type_id').fetchall())
+    ot_heap = _UsageHeap(ots, ot_c, rng)
+    char_heap = _UsageHeap(chars, char_c, rng)
+    cat_heaps = {c: _UsageHeap(ids, ing_c, rng) for c, ids in cats.items()}
+    gain = lambda n: 1.0 / (1 + n)
+    new = {'char_ingredient_pairs_new': 0, 'ingredient_pairs_new': 0, 'ingredients_new': 0}
+
+    jobs = []
+    for _ in range(k):
+        ot_id = ot_heap.lowest(1)[0]; ot_heap.bump(ot_id)
+        char_id = char_heap.lowest(1)[0]; char_heap.bump(char_id)
+        picked, picked_rows = [], []
+        for cat_id, cat_name in reqs.get(ot_id, []):
+            best = max(cat_heaps[cat_id].lowest(PLANNER_CANDIDATES),
+                       key=lambda i: gain(ing_c.get(i, 0)) + gain(char_ing_c.get((char_id, i), 0))
+                       + sum(gain(pair_c.get((min(i, j), max(i, j)), 0)) for j in picked))
+            new['ingredients_new'] += not ing_c.get(best)
+            new['char_ingredient_pairs_new'] += not char_ing_c.get((char_id, best))
+            cat_heaps[cat_id].bump(best)
+            char_ing_c[(char_id, best)] = char_ing_c.get((char_id, best), 0) + 1
+            for j in picked:
+                key = (min(best, j), max(best, j))
+                new['ingredient_pairs_new'] += not pair_c.get(key)
+                pair_c[key] = pair_c.get(key, 0) + 1
+            picked.append(best)
+            ing = ings[best]
+            picked_rows.append({'category': {'id': cat_id, 'name': cat_name},
+                                'ingredient': {'id': best, 'name': ing['name'], 'code': ing['code']}})
+        jobs.append({'character': dict(chars[char_id]), 'output_type': dict(ots[ot_id]),
+                     'ingredients': picked_rows})
+    return jobs, new
+
+
+# ─── Top-layer metadata ───────────────────────────────────────────────────────
+# top_layer_meta holds each clip's aggregated characters, tags, descriptions
+# and SEO text. Triggers only mark affected clips in top_layer_meta_dirty when
+# links, linked media or character names change; refresh_top_layer_meta()
+# recomputes just those clips before the page or API reads. Archive moves are
+# skipped: the aggregates read live and archived rows alike, so they don't change.
+
+def install_top_layer_meta_triggers(conn):
+    """(Re)create the dirty-marking triggers. Safe to call after any table rebuild."""
+    live = f"{_ORIGIN} IS NOT '-'"
+    # Upserts, since ON DELETE SET NULL overrides a trigger's OR IGNORE
+    mark_jobs = ("INSERT INTO top_layer_meta_dirty SELECT top_layer_id FROM top_layer_jobs"
+                 " WHERE job_id IN ({}) ON CONFLICT DO NOTHING")
+    conn.executescript(f'''
+        DROP TRIGGER IF EXISTS tlmeta_link_ins;
+        DROP TRIGGER IF EXISTS tlmeta_link_del;
+        DROP TRIGGER IF EXISTS tlmeta_link_upd;
+        DROP TRIGGER IF EXISTS tlmeta_media_ins;
+        DROP TRIGGER IF EXISTS tlmeta_media_del;
+        DROP TRIGGER IF EXISTS tlmeta_media_upd;
+        DROP TRIGGER IF EXISTS tlmeta_char_upd;
+        DROP TRIGGER IF EXISTS tlmeta_clip_del;
+
+        CREATE TRIGGER tlmeta_link_ins AFTER INSERT ON top_layer_jobs WHEN {live} BEGIN
+            INSERT INTO top_layer_meta_dirty VALUES (NEW.top_layer_id) ON CONFLICT DO NOTHING;
+        END;
+        CREATE TRIGGER tlmeta_link_del AFTER DELETE ON top_layer_jobs WHEN {live} BEGIN
+            INSERT INTO top_layer_meta_dirty VALUES (OLD.top_layer_id) ON CONFLICT DO NOTHING;
+        END;
+        CREATE TRIGGER tlmeta_link_upd AFTER UPDATE ON top_layer_jobs WHEN {live} BEGIN
+            INSERT INTO top_layer_meta_dirty VALUES (OLD.top_layer_id), (NEW.top_layer_id) ON CONFLICT DO NOTHING;
+        END;
+        CREATE TRIGGER tlmeta_media_ins AFTER INSERT ON media_assets WHEN {live} AND NEW.job_id IS NOT NULL BEGIN
+            {mark_jobs.format('NEW.job_id')};
+        END;
+        CREATE TRIGGER tlmeta_media_del AFTER DELETE ON media_assets WHEN {live} AND OLD.job_id IS NOT NULL BEGIN
+            {mark_jobs.format('OLD.job_id')};
+        END;
+        CREATE TRIGGER tlmeta_media_upd
+        AFTER UPDATE OF job_id, character_id, tags, description, seo_description ON media_assets WHEN {live} BEGIN
+            {mark_jobs.format('OLD.job_id, NEW.job_id')};
+        END;
+        CREATE TRIGGER tlmeta_char_upd AFTER UPDATE OF name ON characters WHEN {live} BEGIN
+            INSERT INTO top_layer_meta_dirty SELECT tlj.top_layer_id FROM top_layer_jobs tlj
+                JOIN media_assets ma ON ma.job_id=tlj.job_id WHERE ma.character_id=NEW.id ON CONFLICT DO NOTHING;
+        END;
+        CREATE TRIGGER tlmeta_clip_del AFTER DELETE ON top_layer_media BEGIN
+            DELETE FROM top_layer_meta WHERE top_layer_id=OLD.id;
+            DELETE FROM top_layer_meta_dirty WHERE top_layer_id=OLD.id;
+        END;
+    ''')
+
+
+def refresh_top_layer_meta(db):
+    """Recompute aggregates for clips marked dirty. Returns how many were refreshed."""
+    dirty = [r[0] for r in db.execute('SELECT top_layer_id FROM top_layer_meta_dirty')]
+    if not dirty:
+        return 0
+    attach_archive(db)
+    for top_id in dirty:
+        if not db.execute('SELECT 1 FROM top_layer_media WHERE id=?', [top_id]).fetchone():
+            db.execute('DELETE FROM top_layer_meta WHERE top_layer_id=?', [top_id])
+            continue
+        linked_media = db.execute('''SELECT ma.tags, ma.description, ma.seo_description, c.name as character_name
+            FROM all_top_layer_jobs tlj JOIN all_media_assets ma ON ma.job_id=tlj.job_id
+            LEFT JOIN characters c ON ma.character_id=c.id
+            WHERE tlj.top_layer_id=? ORDER BY tlj.id, ma.id''', [top_id]).fetchall()
+        tags, chars, descriptions, seo_parts = set(), set(), [], []
+        for m in linked_media:
+            tags.update(t.strip() for t in (m['tags'] or '').split(',') if t.strip())
+            if m['character_name']: chars.add(m['character_name'])
+            if m['description']: descriptions.append(m['description'])
+            if m['seo_description']: seo_parts.append(m['seo_description'])
+        db.execute('''INSERT INTO top_layer_meta (top_layer_id, characters, tags, description, seo_description,
+                media_count, updated_at) VALUES (?,?,?,?,?,?,CURRENT_TIMESTAMP)
+            ON CONFLICT(top_layer_id) DO UPDATE SET characters=excluded.characters, tags=excluded.tags,
+                description=excluded.description, seo_description=excluded.seo_description,
+                media_count=excluded.media_count, updated_at=excluded.updated_at''',
+            [top_id, ', '.join(sorted(chars)), ', '.join(sorted(tags)),
+             ' | '.join(dict.fromkeys(descriptions))[:1000], ' '.join(dict.fromkeys(seo_parts))[:500],
+             len(linked_media)])
+    db.execute(f"DELETE FROM top_layer_meta_dirty WHERE top_layer_id IN ({','.join('?' * len(dirty))})", dirty)
+    db.commit()
+    return len(dirty)
+
+
+# ─── Prompt similarity ────────────────────────────────────────────────────────
+# MinHash/LSH index over prompts.text and media_assets.prompt. Each text is
+# reduced to its word bigrams, and PROMPT_PERMS min-hashes of those form its
+# signature (prompt_sigs); the fraction of equal min-hashes between two
+# signatures estimates their Jaccard similarity. The signature is cut into
+# PROMPT_BANDS bands whose hashes go in prompt_bands, so a lookup only
+# compares against texts sharing at least one band instead of every prompt.
+# With 16 bands of 4 rows, pairs at 0.7 similarity share a band 98% of the
+# time and pairs at 0.3 only 12%. Triggers mark changed rows in
+# prompt_index_dirty; refresh_prompt_index() re-signs just those. Archived
+# rows drop out of the index and come back on restore. The index tables are
+# derived (and prompt_sigs is binary), so they stay out of the JSON export.
+
+PROMPT_INDEX_TABLES = ('prompt_sigs', 'prompt_bands', 'prompt_index_dirty')
+PROMPT_PERMS = 64
+PROMPT_BANDS = 16
+PROMPT_ROWS = PROMPT_PERMS // PROMPT_BANDS
+PROMPT_SIMILARITY = 0.6
+_MASK64 = (1 << 64) - 1
+_perm_rng = random.Random(20240601)   # fixed seed: stored signatures must stay comparable
+# multiply-add-shift hashing: ((a*x + b) mod 2^64) >> 32, with a odd
+_PERMS = [(_perm_rng.getrandbits(64) | 1, _perm_rng.getrandbits(64)) for _ in range(PROMPT_PERMS)]
+_PROMPT_SOURCES = {'prompt': ('prompts', 'text'), 'media': ('media_assets', 'prompt')}
+
+
+def install_prompt_index_triggers(conn):
+    """(Re)create the dirty-marking triggers. Safe to call after any table rebuild."""
+    conn.executescript('''
+        DROP TRIGGER IF EXISTS psim_prompt_ins;
+        DROP TRIGGER IF EXISTS psim_prompt_upd;
+        DROP TRIGGER IF EXISTS psim_prompt_del;
+        DROP TRIGGER IF EXISTS psim_media_ins;
+        DROP TRIGGER IF EXISTS psim_media_upd;
+        DROP TRIGGER IF EXISTS psim_media_del;
+
+        CREATE TRIGGER psim_prompt_ins AFTER INSERT ON prompts BEGIN
+            INSERT OR IGNORE INTO prompt_index_dirty VALUES ('prompt', NEW.id);
+        END;
+        CREATE TRIGGER psim_prompt_upd AFTER UPDATE OF text ON prompts BEGIN
+            INSERT OR IGNORE INTO prompt_index_dirty VALUES ('prompt', NEW.id);
+        END;
+        CREATE TRIGGER psim_prompt_del AFTER DELETE ON prompts BEGIN
+            INSERT OR IGNORE INTO prompt_index_dirty VALUES ('prompt', OLD.id);
+        END;
+        CREATE TRIGGER psim_media_ins AFTER INSERT ON media_assets WHEN NEW.prompt != '' BEGIN
+            INSERT OR IGNORE INTO prompt_index_dirty VALUES ('media', NEW.id);
+        END;
+        CREATE TRIGGER psim_media_upd AFTER UPDATE OF prompt ON media_assets BEGIN
+            INSERT OR IGNORE INTO prompt_index_dirty VALUES ('media', NEW.id);
+        END;
+        CREATE TRIGGER psim_media_del AFTER DELETE ON media_assets WHEN OLD.prompt != '' BEGIN
+            INSERT OR IGNORE INTO prompt_index_dirty VALUES ('media', OLD.id);
+        END;
+    ''')
+
+
+def prompt_signature(text):
+    """MinHash signature of a text's word bigrams (a single word counts as one shingle)."""
+    words = re.findall(r'[a-z0-9]+', (text or '').lower())
+    shingles = {' '.join(words[i:i + 2]) for i in range(max(len(words) - 1, 1))} if words else set()
+    if not shingles:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), 'little') for s in shingles]
+    return array('I', (min([(a * h + b) & _MASK64 for h in hashes]) >> 32 for a, b in _PERMS))
+
+
+def _band_buckets(sig):
+    return [int.from_bytes(hashlib.blake2b(sig[i * PROMPT_ROWS:(i + 1) * PROMPT_ROWS].tobytes(),
+                                           digest_size=8, person=bytes([i])).digest(), 'little', signed=True)
+            for i in range(PROMPT_BANDS)]
+
+
+def _load_sig(blob):
+    sig = array('I')
+    sig.frombytes(blob)
+    return sig
+
+
+def signature_similarity(a, b):
+    return sum(x == y for x, y in zip(a, b)) / PROMPT_PERMS
+
+
+def refresh_prompt_index(db, batch=2000):
+    """Re-sign prompts and media prompts marked dirty. Returns how many were processed."""
+    done = 0
+    while True:
+        dirty = [tuple(r) for r in db.execute('SELECT source, ref_id FROM prompt_index_dirty LIMIT ?', [batch])]
+        if not dirty:
+            break
+        old_bands, new_sigs, new_bands = [], [], []
+        for source in _PROMPT_SOURCES:
+            ids = [ref_id for s, ref_id in dirty if s == source]
+            if not ids:
+                continue
+            marks = ','.join('?' * len(ids))
+            for ref_id, blob in db.execute(f'SELECT ref_id, sig FROM prompt_sigs WHERE source=? AND ref_id IN ({marks})',
+                                           [source, *ids]):
+                old_bands += [(b, source, ref_id) for b in _band_buckets(_load_sig(blob))]
+            table, column = _PROMPT_SOURCES[source]
+            for ref_id, text in db.execute(f'SELECT id, {column} FROM {table} WHERE id IN ({marks})', ids):
+                sig = prompt_signature(text)
+                if sig is not None:
+                    new_sigs.append((source, ref_id, sig.tobytes()))
+                    new_bands += [(b, source, ref_id) for b in _band_buckets(sig)]
+        db.executemany('DELETE FROM prompt_bands WHERE bucket=? AND source=? AND ref_id=?', old_bands)
+        db.executemany('DELETE FROM prompt_sigs WHERE source=? AND ref_id=?', dirty)
+        db.executemany('INSERT INTO prompt_sigs (source, ref_id, sig) VALUES (?,?,?)', new_sigs)
+        db.executemany('INSERT OR IGNORE INTO prompt_bands (bucket, source, ref_id) VALUES (?,?,?)', new_bands)
+        db.executemany('DELETE FROM prompt_index_dirty WHERE source=? AND ref_id=?', dirty)
+        db.commit()
+        done += len(dirty)
+    return done
+
+
+def _describe_refs(db, refs):
+    """Display rows for (source, ref_id) pairs, keyed the same way."""
+    found = {}
+    ids = [r for s, r in refs if s == 'prompt']
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        for r in db.execute(f'''SELECT p.id, p.text, p.label, p.status, p.project_id, p.job_id, proj.name as project_name
+                FROM prompts p LEFT JOIN projects proj ON p.project_id=proj.id
+                WHERE p.id IN ({','.join('?' * len(chunk))})''', chunk):
+            found[('prompt', r['id'])] = {'source': 'prompt', **dict(r)}
+    ids = [r for s, r in refs if s == 'media']
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        for r in db.execute(f'''SELECT id, prompt as text, title as label, quality_status as status, job_id
+                FROM media_assets WHERE id IN ({','.join('?' * len(chunk))})''', chunk):
+            found[('media', r['id'])] = {'source': 'media', 'project_id': None, 'project_name': None, **dict(r)}
+    return found
+
+
+def similar_prompts(db, text=None, source='prompt', ref_id=None, threshold=PROMPT_SIMILARITY, limit=20):
+    """Prompts and media prompts whose estimated similarity to `text` (or to an
+    indexed row) is at least `threshold`, most similar first."""
+    refresh_prompt_index(db)
+    if ref_id is not None:
+        row = db.execute('SELECT sig FROM prompt_sigs WHERE source=? AND ref_id=?', [source, ref_id]).fetchone()
+        sig = _load_sig(row[0]) if row else None
+    else:
+        sig = prompt_signature(text)
+    if sig is None:
+        return []
+    buckets = _band_buckets(sig)
+    candidates = db.execute(f'''SELECT DISTINCT b.source, b.ref_id, s.sig FROM prompt_bands b
+        JOIN prompt_sigs s ON s.source=b.source AND s.ref_id=b.ref_id
+        WHERE b.bucket IN ({','.join('?' * len(buckets))})''', buckets).fetchall()
+    scored = []
+    for c in candidates:
+        if ref_id is not None and (c['source'], c['ref_id']) == (source, int(ref_id)):
+            continue
+        score = signature_similarity(sig, _load_sig(c['sig']))
+        if score >= threshold:
+            scored.append((score, c['source'], c['ref_id']))
+    scored.sort(key=lambda t: (-t[0], t[1], t[2]))
+    scored = scored[:limit]
+    rows = _describe_refs(db, [(s, r) for _, s, r in scored])
+    return [{**rows[(s, r)], 'similarity': round(score, 3)} for score, s, r in scored if (s, r) in rows]
+
+
+def prompt_duplicate_groups(db, threshold=0.8, limit=200):
+    """Clusters of near-identical prompts, largest first.
+
+    Candidates come from shared LSH buckets; each bucket member is checked
+    against the bucket's first member, so a bucket costs one pass no matter
+    how many copies it holds.
+    """
+    refresh_prompt_index(db)
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    sigs = {}
+
+    def sig_of(ref):
+        if ref not in sigs:
+            sigs[ref] = _load_sig(db.execute('SELECT sig FROM prompt_sigs WHERE source=? AND ref_id=?', ref).fetchone()[0])
+        return sigs[ref]
+
+    shared = db.execute('''SELECT b.bucket, b.source, b.ref_id FROM prompt_bands b
+        WHERE b.bucket IN (SELECT bucket FROM prompt_bands GROUP BY bucket HAVING COUNT(*) > 1)
+        ORDER BY b.bucket, b.source, b.ref_id''')
+    head, head_bucket = None, None
+    for bucket, source, ref_id in shared:
+        ref = (source, ref_id)
+        if bucket != head_bucket:
+            head, head_bucket = ref, bucket
+            continue
+        a, b = find(head), find(ref)
+        if a != b and signature_similarity(sig_of(head), sig_of(ref)) >= threshold:
+            parent[max(a, b)] = min(a, b)
+    groups = {}
+    for ref in list(parent):
+        groups.setdefault(find(ref), set()).add(ref)
+    for root, members in groups.items():
+        members.add(root)
+    ordered = sorted(groups.values(), key=lambda m: (-len(m), min(m)))[:limit]
+    rows = _describe_refs(db, [ref for m in ordered for ref in m])
+    report = []
+    for members in ordered:
+        first = min(members)
+        items = [{**rows[ref], 'similarity': round(signature_similarity(sig_of(first), sig_of(ref)), 3)}
+                 for ref in sorted(members) if ref in rows]
+        if len(items) > 1:
+            report.append(items)
+    return report
+
+
+# ─── Media integrity ──────────────────────────────────────────────────────────
+# media_assets.file_path and top_layer_media.file_path are checked against the
+# filesystem by a pool of threads (stat is mostly I/O wait, so threads scale
+# well on network shares). Results land in media_files, one row per reference:
+#   ok        file present and unchanged since it was last accepted
+#   missing   path does not exist or cannot be read
+#   changed   size or mtime differs from the accepted values; stays flagged
+#             until accepted from the Data page
+# Duplicates are references whose content hashes match. Hashing is optional and
+# incremental: a file is only re-read when its path, size or mtime changed.
+
+MEDIA_SCAN_WORKERS = int(os.environ.get('PIPELINE_SCAN_WORKERS', 32))
+MEDIA_SCAN_BATCH = 2000
+_MEDIA_SOURCES = {'media': 'media_assets', 'top_layer': 'top_layer_media'}
+
+
+def _hash_file(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _check_file(ref, prev, hash_files, full):
+    """Stat (and maybe hash) one reference. Runs on a pool thread; no database access."""
+    source, ref_id, path = ref
+    try:
+        st = os.stat(path)
+    except OSError:
+        return (source, ref_id, path, None, None, None, 'missing')
+    size, mtime = st.st_size, round(st.st_mtime, 3)
+    same = prev is not None and prev['file_path'] == path and prev['status'] != 'missing'
+    unchanged = same and prev['size'] == size and prev['mtime'] == mtime
+    digest = prev['hash'] if same else None
+    if hash_files and (full or not unchanged or digest is None):
+        try:
+            digest = _hash_file(path)
+        except OSError:
+            return (source, ref_id, path, None, None, None, 'missing')
+    if not same:
+        status = 'ok'
+    elif not unchanged:
+        status = 'changed'
+    else:
+        status = prev['status']
+    return (source, ref_id, path, size, mtime, digest, status)
+
+
+def scan_media(db, hash_files=False, full=False, workers=None, progress=None):
+    """Check every referenced media file and update media_files. Returns status counts.
+
+    References with an empty file_path are skipped; rows for deleted or
+    archived references are dropped. `progress(checked, total)` is called
+    after each batch.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    refs = []
+    for source, table in _MEDIA_SOURCES.items():
+        refs += [(source, r[0], r[1].strip()) for r in
+                 db.execute(f"SELECT id, file_path FROM {table} WHERE TRIM(COALESCE(file_path, '')) != ''")]
+    prev = {(r['source'], r['ref_id']): r for r in db.execute('SELECT * FROM media_files')}
+    total = len(refs)
+    with ThreadPoolExecutor(max_workers=workers or MEDIA_SCAN_WORKERS) as pool:
+        for start in range(0, total, MEDIA_SCAN_BATCH):
+            batch = refs[start:start + MEDIA_SCAN_BATCH]
+            results = list(pool.map(lambda ref: _check_file(ref, prev.get(ref[:2]), hash_files, full), batch))
+            db.executemany('''INSERT INTO media_files (source, ref_id, file_path, size, mtime, hash, status, checked_at)
+                VALUES (?,?,?,?,?,?,?,CURRENT_TIMESTAMP)
+                ON CONFLICT(source, ref_id) DO UPDATE SET file_path=excluded.file_path, size=excluded.size,
+                    mtime=excluded.mtime, hash=excluded.hash, status=excluded.status, checked_at=excluded.checked_at''',
+                results)
+            db.commit()
+            if progress:
+                progress(start + len(batch), total)
+    live = {ref[:2] for ref in refs}
+    stale = [key for key in prev if key not in live]
+    db.executemany('DELETE FROM media_files WHERE source=? AND ref_id=?', stale)
+    db.commit()
+    return media_integrity_counts(db)
+
+
+def media_integrity_counts(db):
+    counts = {r[0]: r[1] for r in db.execute('SELECT status, COUNT(*) FROM media_files GROUP BY status')}
+    counts['duplicate'] = db.execute('''SELECT COUNT(*) FROM media_files WHERE hash IN
+        (SELECT hash FROM media_files WHERE hash IS NOT NULL GROUP BY hash HAVING COUNT(*) > 1)''').fetchone()[0]
+    return counts
+
+
+def media_integrity_problems(db, limit=200):
+    """Missing, changed and duplicate references with their titles, worst first."""
+    return db.execute('''
+        SELECT mf.*, COALESCE(ma.title, tl.title, '') as title,
+               (SELECT COUNT(*) FROM media_files d WHERE d.hash = mf.hash) as copies
+        FROM media_files mf
+        LEFT JOIN media_assets ma ON mf.source='media' AND ma.id=mf.ref_id
+        LEFT JOIN top_layer_media tl ON mf.source='top_layer' AND tl.id=mf.ref_id
+        WHERE mf.status != 'ok' OR mf.hash IN
+            (SELECT hash FROM media_files WHERE hash IS NOT NULL GROUP BY hash HAVING COUNT(*) > 1)
+        ORDER BY CASE mf.status WHEN 'missing' THEN 0 WHEN 'changed' THEN 1 ELSE 2 END, mf.hash, mf.file_path
+        LIMIT ?''', [limit]).fetchall()
+
+
+def accept_media_changes(db):
+    """Take the current size/mtime of every 'changed' file as the new baseline."""
+    n = db.execute("UPDATE media_files SET status='ok' WHERE status='changed'").rowcount
+    db.commit()
+    return n
+
+
+def start_media_scan(hash_files=False, full=False):
+    """Run scan_media over the current workspace on a background thread. Returns False if one is already running."""
+    ws = current_workspace()
+    state = ws.media_scan_state
+    if not ws.scan_lock.acquire(blocking=False):
+        return False
+    state.update(running=True, checked=0, total=0, error=None, finished_at=None,
+                 started_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+    def progress(checked, total):
+        state.update(checked=checked, total=total)
+
+    def run():
+        db = get_db(ws)
+        try:
+            with use_workspace(ws):
+                state['counts'] = scan_media(db, hash_files=hash_files, full=full, progress=progress)
+        except (OSError, sqlite3.Error) as e:
+            state['error'] = str(e)
+        finally:
+            db.close()
+            state.update(running=False, finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            ws.scan_lock.release()
+
+    threading.Thread(target=run, name='media-scan', daemon=True).start()
+    return True
+
+
+# ─── Export ───────────────────────────────────────────────────────────────────
+# The JSON export behind /export and `pipeline.py export`. The prompt index is
+# rebuilt from prompts on import by its triggers, so it's left out, as is any
+# table with BLOB columns, which JSON can't carry.
+
+def export_tables(db):
+    names = [r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+    return [t for t in names if t not in PROMPT_INDEX_TABLES
+            and not any(c[2].upper() == 'BLOB' for c in db.execute(f'PRAGMA table_info({t})'))]
+
+
+def export_database(db):
+    return {
+        'exported_at': datetime.utcnow().isoformat(),
+        'version': '0.2',
+        'tables': {t: [dict(r) for r in db.execute(f'SELECT * FROM {t}')] for t in export_tables(db)},
+    }
+
+
+# ─── Backup ───────────────────────────────────────────────────────────────────
+# Online snapshots through SQLite's backup API. Pages are copied BACKUP_STEP
+# at a time with a short sleep between steps so the dock and browsers keep
+# writing. A write from another connection restarts an incremental backup, so
+# if that happens too often the copy finishes in one step instead; in WAL
+# mode that holds only a read snapshot and writers still proceed.
+
+BACKUP_STEP = 1024          # pages per step (4 MB at the default page size)
+BACKUP_MAX_RESTARTS = 5
+_backup_lock = threading.Lock()
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _copy_database(src, dst, step=BACKUP_STEP):
+    restarts, last = [0], [None]
+
+    def progress(status, remaining, total):
+        if last[0] is not None and remaining > last[0]:
+            restarts[0] += 1
+            if restarts[0] > BACKUP_MAX_RESTARTS:
+                raise _BackupRestarted()
+        last[0] = remaining
+
+    try:
+        src.backup(dst, pages=step, progress=progress, sleep=0.005)
+    except _BackupRestarted:
+        src.backup(dst)
+
+
+def verify_backup(path):
+    """Run PRAGMA integrity_check on a snapshot (.db or .db.gz). Returns 'ok' or the first problem."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = path
+        if path.endswith('.gz'):
+            db_path = os.path.join(tmp, 'verify.db')
+            with gzip.open(path, 'rb') as f_in, open(db_path, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            conn.close()
+
+
+def backup_database(label='manual', compress=True):
+    """Snapshot the current workspace's database (and archive, if any) into its backup directory.
+
+    Each snapshot is integrity-checked before it is kept. Returns the list of
+    files written; raises sqlite3.DatabaseError if verification fails.
+    """
+    ws = current_workspace()
+    os.makedirs(ws.backup_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    written = []
+    with _backup_lock:
+        for source in (ws.database, ws.archive):
+            if not os.path.exists(source):
+                continue
+            name = f"{os.path.splitext(os.path.basename(source))[0]}_{stamp}_{label}.db"
+            tmp_path = os.path.join(ws.backup_dir, name + '.partial')
+            src, dst = sqlite3.connect(source, timeout=DB_TIMEOUT), sqlite3.connect(tmp_path)
+            try:
+                _copy_database(src, dst)
+                dst.execute('PRAGMA journal_mode=DELETE')   # self-contained file, no -wal sidecar
+            finally:
+                src.close(); dst.close()
+            result = verify_backup(tmp_path)
+            if result != 'ok':
+                os.remove(tmp_path)
+                raise sqlite3.DatabaseError(f'{name} failed integrity check: {result}')
+            final = os.path.join(ws.backup_dir, name)
+            if compress:
+                final += '.gz'
+                with open(tmp_path, 'rb') as f_in, gzip.open(final, 'wb', compresslevel=6) as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+                os.remove(tmp_path)
+            else:
+                os.replace(tmp_path, final)
+            written.append(final)
+        _rotate_backups()
+    return written
+
+
+def list_backups():
+    backup_dir = current_workspace().backup_dir
+    if not os.path.isdir(backup_dir):
+        return []
+    items = []
+    for name in os.listdir(backup_dir):
+        if not (name.endswith('.db') or name.endswith('.db.gz')):
+            continue
+        path = os.path.join(backup_dir, name)
+        st = os.stat(path)
+        items.append({'name': name, 'size': st.st_size, 'archive': name.startswith('pipeline_archive_'),
+                      'created': datetime.fromtimestamp(st.st_mtime).strftime('%Y-%m-%d %H:%M:%S')})
+    return sorted(items, key=lambda b: b['created'], reverse=True)
+
+
+def _rotate_backups():
+    for archive in (False, True):
+        for old in [b for b in list_backups() if b['archive'] == archive][BACKUP_KEEP:]:
+            os.remove(os.path.join(current_workspace().backup_dir, old['name']))
+
+
+def restore_backup(name):
+    """Copy a snapshot back over the live database (or the archive) in place.
+
+    A 'pre-restore' snapshot of the current data is taken first. Open
+    connections see the restored data on their next transaction.
+    """
+    ws = current_workspace()
+    path = os.path.join(ws.backup_dir, os.path.basename(name))
+    if not os.path.exists(path):
+        raise FileNotFoundError(name)
+    result = verify_backup(path)
+    if result != 'ok':
+        raise sqlite3.DatabaseError(f'{name} failed integrity check: {result}')
+    backup_database(label='pre-restore')
+    target = ws.archive if os.path.basename(name).startswith('pipeline_archive_') else ws.database
+    with tempfile.TemporaryDirectory() as tmp, _backup_lock:
+        db_path = path
+        if path.endswith('.gz'):
+            db_path = os.path.join(tmp, 'restore.db')
+            with gzip.open(path, 'rb') as f_in, open(db_path, 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        src, dst = sqlite3.connect(db_path), sqlite3.connect(target, timeout=DB_TIMEOUT)
+        try:
+            src.backup(dst)
+            if target == ws.database:
+                dst.execute('PRAGMA journal_mode=WAL')
+        finally:
+            src.close(); dst.close()
+
+
+_scheduler_started = False
+
+
+def start_backup_scheduler(hours=None):
+    """Snapshot every workspace every `hours` (BACKUP_HOURS by default) on a daemon thread.
+
+    Call once from the serving process only; worker processes should not.
+    """
+    global _scheduler_started
+    hours = BACKUP_HOURS if hours is None else hours
+    if _scheduler_started or hours <= 0:
+        return
+    _scheduler_started = True
+
+    def due(ws):
+        """Seconds until ws is due a snapshot (<= 0: now)."""
+        with use_workspace(ws):
+            backups = list_backups()
+        last = datetime.strptime(backups[0]['created'], '%Y-%m-%d %H:%M:%S') if backups else None
+        return 0 if last is None else hours * 3600 - (datetime.now() - last).total_seconds()
+
+    def loop():
+        while True:
+            failed = False
+            for ws in list_workspaces():
+                if due(ws) > 0:
+                    continue
+                try:
+                    with use_workspace(ws):
+                        backup_database(label='auto')
+                except (OSError, sqlite3.Error) as e:
+                    print(f'  Scheduled backup of workspace {ws.name} failed: {e}')
+                    failed = True
+            # New workspaces are picked up within the hour
+            time.sleep(600 if failed else max(60, min([3600] + [due(ws) for ws in list_workspaces()])))
+
+    threading.Thread(target=loop, name='backup-scheduler', daemon=True).start()
+
+
+# ─── Analytics ────────────────────────────────────────────────────────────────
+# Reports never query the live file. A refresh copies a workspace's database
+# through the backup API into a scratch snapshot (stepped like backups, so
+# writers keep going), folds the archive in, computes the rollup tables there,
+# and then swaps them into the workspace's analytics file (ANALYTICS_DATABASE
+# in the default workspace) in one short transaction. Report pages read only
+# that file, which is in WAL mode, so they don't wait on a swap either.
+# Scheduled refreshes are skipped when none of the source tables changed.
+
+ANALYTICS_DATABASE = 'pipeline_analytics.db'
+ANALYTICS_MINUTES = float(os.environ.get('PIPELINE_ANALYTICS_MINUTES', 15))   # 0 disables scheduled refreshes
+ANALYTICS_SOURCES = ('render_jobs', 'render_job_ingredients', 'media_assets', 'prompts', 'projects',
+                     'project_jobs', 'characters', 'output_types', 'ingredients', 'ingredient_categories')
+ANALYTICS_SCHEMA_VERSION = 1   # bump when ANALYTICS_SCHEMA changes; older files are rebuilt
+ANALYTICS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS analytics_meta (key TEXT PRIMARY KEY, value TEXT);
+    CREATE TABLE IF NOT EXISTS analytics_ingredient_usage (
+        ingredient_id INTEGER PRIMARY KEY, name TEXT, code TEXT, category_id INTEGER, category_name TEXT,
+        jobs INTEGER, rendered INTEGER, complete INTEGER, last_used TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS analytics_approval (
+        dimension TEXT NOT NULL, key_id INTEGER NOT NULL, name TEXT,
+        media INTEGER, approved INTEGER, rejected INTEGER, unreviewed INTEGER,
+        PRIMARY KEY (dimension, key_id)
+    );
+    CREATE TABLE IF NOT EXISTS analytics_prompt_throughput (
+        day TEXT NOT NULL, project_id INTEGER NOT NULL, status TEXT NOT NULL, prompts INTEGER,
+        PRIMARY KEY (day, project_id, status)
+    );
+    CREATE TABLE IF NOT EXISTS analytics_project_completion (
+        project_id INTEGER PRIMARY KEY, name TEXT, status TEXT, jobs INTEGER, planned INTEGER,
+        in_progress INTEGER, rendered INTEGER, complete INTEGER, media INTEGER, approved INTEGER,
+        prompts INTEGER, prompts_done INTEGER
+    );
+'''
+
+
+def _quality_counts(media_id='ma.id'):
+    return ', '.join(f"COUNT(DISTINCT CASE WHEN ma.quality_status='{s}' THEN {media_id} END)"
+                     for s in ('approved', 'rejected', 'unreviewed'))
+
+
+# (rollup table, SELECT over the snapshot's copies of the live tables)
+ANALYTICS_ROLLUPS = [
+    ('analytics_ingredient_usage', '''SELECT i.id, i.name, i.code, ic.id, ic.name, COUNT(DISTINCT rji.job_id),
+        COUNT(DISTINCT CASE WHEN rj.status IN ('rendered', 'complete') THEN rj.id END),
+        COUNT(DISTINCT CASE WHEN rj.status='complete' THEN rj.id END), MAX(rj.created_at)
+        FROM ingredients i LEFT JOIN ingredient_categories ic ON i.category_id=ic.id
+        LEFT JOIN render_job_ingredients rji ON rji.ingredient_id=i.id LEFT JOIN render_jobs rj ON rji.job_id=rj.id
+        GROUP BY i.id'''),
+    # A media row's character and output type fall back to its job's
+    ('analytics_approval', f'''SELECT 'character', c.id, c.name, COUNT(DISTINCT ma.id), {_quality_counts()}
+        FROM media_assets ma LEFT JOIN render_jobs rj ON ma.job_id=rj.id
+        JOIN characters c ON c.id=COALESCE(ma.character_id, rj.character_id) GROUP BY c.id
+        UNION ALL SELECT 'output_type', ot.id, ot.name, COUNT(DISTINCT ma.id), {_quality_counts()}
+        FROM media_assets ma LEFT JOIN render_jobs rj ON ma.job_id=rj.id
+        JOIN output_types ot ON ot.id=COALESCE(ma.output_type_id, rj.output_type_id) GROUP BY ot.id
+        UNION ALL SELECT 'ingredient', i.id, i.name, COUNT(DISTINCT ma.id), {_quality_counts()}
+        FROM media_assets ma JOIN render_job_ingredients rji ON rji.job_id=ma.job_id
+        JOIN ingredients i ON rji.ingredient_id=i.id GROUP BY i.id'''),
+    # Prompts carry no status history, so a status is counted on the day of the
+    # prompt's last change; 'created' rows count new prompts. project_id 0 = none.
+    ('analytics_prompt_throughput', '''SELECT DATE(created_at), COALESCE(project_id, 0), 'created', COUNT(*)
+        FROM prompts GROUP BY 1, 2
+        UNION ALL SELECT DATE(COALESCE(updated_at, created_at)), COALESCE(project_id, 0), status, COUNT(*)
+        FROM prompts WHERE status != 'pending' GROUP BY 1, 2, 3'''),
+    ('analytics_project_completion', '''SELECT p.id, p.name, p.status, COUNT(DISTINCT rj.id),
+        COUNT(DISTINCT CASE WHEN rj.status='planned' THEN rj.id END),
+        COUNT(DISTINCT CASE WHEN rj.status='in_progress' THEN rj.id END),
+        COUNT(DISTINCT CASE WHEN rj.status='rendered' THEN rj.id END),
+        COUNT(DISTINCT CASE WHEN rj.status='complete' THEN rj.id END),
+        (SELECT COUNT(*) FROM media_assets WHERE job_id IN (SELECT job_id FROM project_jobs WHERE project_id=p.id)),
+        (SELECT COUNT(*) FROM media_assets WHERE quality_status='approved'
+            AND job_id IN (SELECT job_id FROM project_jobs WHERE project_id=p.id)),
+        (SELECT COUNT(*) FROM prompts WHERE project_id=p.id),
+        (SELECT COUNT(*) FROM prompts WHERE project_id=p.id AND status='done')
+        FROM projects p LEFT JOIN project_jobs pj ON pj.project_id=p.id LEFT JOIN render_jobs rj ON pj.job_id=rj.id
+        GROUP BY p.id'''),
+]
+
+_analytics_scheduler_started = False
+
+
+def analytics_db():
+    """Read-only connection to the current workspace's analytics file, or None before its first refresh has finished."""
+    path = current_workspace().analytics
+    if not os.path.exists(path):
+        return None
+    conn = sqlite3.connect(path, timeout=DB_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA query_only = ON')
+    try:
+        if conn.execute("SELECT 1 FROM analytics_meta WHERE key='refreshed_at'").fetchone():
+            return conn
+    except sqlite3.OperationalError:   # created, but the first swap hasn't committed
+        pass
+    conn.close()
+    return None
+
+
+def _analytics_version(db):
+    return json.dumps(table_versions(db, ANALYTICS_SOURCES))
+
+
+def _merge_archive(snap):
+    """Copy archived jobs and their rows into the snapshot so reports cover them too."""
+    path = current_workspace().archive
+    if not os.path.exists(path):
+        return
+    snap.execute('ATTACH DATABASE ? AS archive', [path])
+    archived = {r[0] for r in snap.execute("SELECT name FROM archive.sqlite_master WHERE type='table'")}
+    for t in ['render_jobs'] + ARCHIVE_JOB_TABLES:
+        if t in archived:
+            have = set(_columns(snap, t, 'archive'))
+            cols = ', '.join(c for c in _columns(snap, t) if c in have)
+            snap.execute(f'INSERT OR IGNORE INTO main.{t} ({cols}) SELECT {cols} FROM archive.{t}')
+    snap.commit()
+    snap.execute('DETACH DATABASE archive')
+
+
+def _analytics_done():
+    """source_version of the current analytics snapshot, or None."""
+    prev = analytics_db()
+    if prev is None:
+        return None
+    try:
+        return prev.execute("SELECT value FROM analytics_meta WHERE key='source_version'").fetchone()[0]
+    finally:
+        prev.close()
+
+
+def _build_rollups(snap, started):
+    # The snapshot is scratch: drop the triggers so merging the archive doesn't feed change logs
+    for (name,) in snap.execute("SELECT name FROM sqlite_master WHERE type='trigger'").fetchall():
+        snap.execute(f'DROP TRIGGER {name}')
+    snap.execute('PRAGMA journal_mode=OFF')
+    version = _analytics_version(snap)
+    _merge_archive(snap)
+    snap.executescript(ANALYTICS_SCHEMA)
+    for table, select in ANALYTICS_ROLLUPS:
+        snap.execute(f'INSERT INTO {table} {select}')
+    snap.executemany('INSERT INTO analytics_meta (key, value) VALUES (?,?)', [
+        ('refreshed_at', datetime.now().strftime('%Y-%m-%d %H:%M:%S')), ('source_version', version),
+        ('seconds', f'{time.perf_counter() - started:.2f}')])
+    snap.commit()
+
+
+def _swap_rollups(partial):
+    out = sqlite3.connect(current_workspace().analytics, timeout=DB_TIMEOUT, isolation_level=None)
+    try:
+        out.execute('PRAGMA journal_mode=WAL')
+        if out.execute('PRAGMA user_version').fetchone()[0] != ANALYTICS_SCHEMA_VERSION:
+            for (name,) in out.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall():
+                out.execute(f'DROP TABLE {name}')
+            out.execute(f'PRAGMA user_version = {ANALYTICS_SCHEMA_VERSION}')
+        out.executescript(ANALYTICS_SCHEMA)
+        out.execute('ATTACH DATABASE ? AS snap', [partial])
+        out.execute('BEGIN IMMEDIATE')
+        for table in ['analytics_meta'] + [t for t, _ in ANALYTICS_ROLLUPS]:
+            out.execute(f'DELETE FROM main.{table}')
+            out.execute(f'INSERT INTO main.{table} SELECT * FROM snap.{table}')
+        out.execute('COMMIT')
+        out.execute('DETACH DATABASE snap')
+    finally:
+        out.close()
+
+
+def refresh_analytics(force=False):
+    """Snapshot the current workspace's database and rebuild the rollups in its analytics file.
+
+    Returns False without copying anything if the source tables haven't
+    changed since the last refresh (unless force).
+    """
+    started = time.perf_counter()
+    ws = current_workspace()
+    partial = f'{ws.analytics}.{os.getpid()}.partial'
+    live = sqlite3.connect(ws.database, timeout=DB_TIMEOUT)
+    try:
+        if not force and _analytics_version(live) == _analytics_done():
+            return False
+        if os.path.exists(partial):
+            os.remove(partial)
+        snap = sqlite3.connect(partial)
+        try:
+            _copy_database(live, snap)
+            live.close()   # everything from here on reads the snapshot
+            _build_rollups(snap, started)
+        finally:
+            snap.close()
+        _swap_rollups(partial)
+    finally:
+        live.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+    return True
+
+
+def _run_analytics_refresh(ws, force):
+    state = ws.analytics_state
+    if not ws.analytics_lock.acquire(blocking=False):
+        return False
+    state.update(running=True, error=None, finished_at=None, started_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    try:
+        with use_workspace(ws):
+            refresh_analytics(force=force)
+    except (OSError, sqlite3.Error) as e:
+        state['error'] = str(e)
+    finally:
+        state.update(running=False, finished_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        ws.analytics_lock.release()
+    return True
+
+
+def start_analytics_refresh(force=True):
+    """Refresh the current workspace's analytics on a background thread. Returns False if one is already running."""
+    ws = current_workspace()
+    if ws.analytics_lock.locked():
+        return False
+    threading.Thread(target=_run_analytics_refresh, args=(ws, force), name='analytics-refresh', daemon=True).start()
+    return True
+
+
+def start_analytics_scheduler(minutes=None):
+    """Refresh every workspace's analytics every `minutes` (ANALYTICS_MINUTES by default) if anything changed.
+
+    Call once from the serving process only; worker processes should not.
+    """
+    global _analytics_scheduler_started
+    minutes = ANALYTICS_MINUTES if minutes is None else minutes
+    if _analytics_scheduler_started or minutes <= 0:
+        return
+    _analytics_scheduler_started = True
+
+    def loop():
+        while True:
+            for ws in list_workspaces():
+                _run_analytics_refresh(ws, force=False)
+                if ws.analytics_state['error']:
+                    print(f"  Analytics refresh of workspace {ws.name} failed: {ws.analytics_state['error']}")
+            time.sleep(minutes * 60)
+
+    threading.Thread(target=loop, name='analytics-scheduler', daemon=True).start()
@@ -2,6 +2,7 @@
 Pipeline Manager — Floating Dock
 Run with:  pythonw dock.pyw   (no console window)
 Or:        python dock.pyw    (with console for debugging)
+           pythonw dock.pyw acme   (work in workspace "acme"; or set PIPELINE_WORKSPACE)
 
 Requires the Flask app to be running at http://localhost:5000
 """
@@ -12,12 +13,22 @@ import threading
 import urllib.request
 import urllib.error
 import urllib.parse
+import bisect
 import json
+import sqlite3
 import subprocess
 import os
 import sys
+import time
+import uuid
 
-API = "http://localhost:5000"
+WORKSPACE = (sys.argv[1] if len(sys.argv) > 1 else os.environ.get("PIPELINE_WORKSPACE", "")).strip()
+API = "http://localhost:5000" + (f"/w/{WORKSPACE}" if WORKSPACE else "")
+# One offline queue per workspace, so queued writes replay into the right one
+QUEUE_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        f"dock_queue_{WORKSPACE}.db" if WORKSPACE else "dock_queue.db")
+REPLAY_BATCH = 25
+REPLAY_MAX_ATTEMPTS = 5   # server rejections before a queued entry is dropped
 
 # ── Colour palette ─────────────────────────────────────────────────────────────
 BG       = "#020617"
@@ -57,17 +68,215 @@ def api_post(path, data=None, json_data=None):
     except Exception as e:
         return {"error": str(e)}
 
+# ── Offline queue ──────────────────────────────────────────────────────────────
+# Submissions and prompt status changes are written here before they are sent,
+# so nothing is lost while the server is down. Each entry carries a UUID that
+# the server records, which makes replaying an entry twice harmless. An entry
+# leaves the queue once the server has applied it; one the server answers
+# with an error (e.g. its database was locked) stays queued and is dropped
+# only after REPLAY_MAX_ATTEMPTS such answers.
+
+class Outbox:
+    def __init__(self, path=QUEUE_DB):
+        self.path = path
+        self.flush_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                key TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                queued_at REAL NOT NULL,
+                attempts INTEGER DEFAULT 0)""")
+
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def add(self, kind, **payload):
+        key = str(uuid.uuid4())
+        with self._conn() as conn:
+            conn.execute("INSERT INTO queue (key, kind, payload, queued_at) VALUES (?,?,?,?)",
+                         (key, kind, json.dumps(payload), time.time()))
+        return key
+
+    def count(self):
+        with self._conn() as conn:
+            return conn.execute("SELECT COUNT(*) FROM queue").fetchone()[0]
+
+    def pending(self, kind):
+        with self._conn() as conn:
+            return [dict(json.loads(p), key=k) for k, p in
+                    conn.execute("SELECT key, payload FROM queue WHERE kind=? ORDER BY id", (kind,))]
+
+    def flush(self):
+        """Replay queued entries oldest first. Returns {key: server result} for
+        everything the server answered; failed results that are still queued for
+        another try carry queued=True. Entries stay queued if it can't be reached."""
+        if not self.flush_lock.acquire(blocking=False):
+            return {}
+        results = {}
+        try:
+            while True:
+                with self._conn() as conn:
+                    rows = conn.execute("SELECT key, kind, payload FROM queue ORDER BY id LIMIT ?",
+                                        (REPLAY_BATCH,)).fetchall()
+                if not rows:
+                    break
+                ops = [dict(json.loads(p), key=k, kind=kind) for k, kind, p in rows]
+                reply = api_post("/api/dock/replay", json_data={"ops": ops})
+                if not reply or "results" not in reply:
+                    break
+                answered = {r["key"]: r for r in reply["results"]}
+                done = [k for k, r in answered.items() if r.get("ok") or r.get("duplicate")]
+                failed = [(k,) for k in answered if k not in done]
+                with self._conn() as conn:
+                    conn.executemany("DELETE FROM queue WHERE key=?", [(k,) for k in done])
+                    conn.executemany("UPDATE queue SET attempts=attempts+1 WHERE key=?", failed)
+                    retry = {k for (k,) in conn.execute("SELECT key FROM queue WHERE attempts < ?",
+                                                        (REPLAY_MAX_ATTEMPTS,))}
+                    conn.execute("DELETE FROM queue WHERE attempts >= ?", (REPLAY_MAX_ATTEMPTS,))
+                results.update({k: dict(r, queued=k in retry) if k not in done else r for k, r in answered.items()})
+                # Failures wait for the next flush rather than being resent straight away
+                if failed or len(answered) < len(rows):
+                    break
+        finally:
+            self.flush_lock.release()
+        return results
+
 def copy_to_clipboard(root, text):
     root.clipboard_clear()
     root.clipboard_append(text)
     root.update()
 
+# ── Virtual list ───────────────────────────────────────────────────────────────
+# Scrollable list that only builds cards for rows near the visible area and
+# keeps them keyed by id. A refresh compares each row's fingerprint with the
+# cached card and rebuilds just the cards whose data changed; unchanged cards
+# are only moved. Card heights are measured once and cached, so rows that have
+# never been on screen cost nothing.
+
+class VirtualList(tk.Frame):
+    GAP = 4            # vertical space between cards
+    OVERSCAN = 200     # px rendered above/below the viewport
+    CACHE = 80         # off-screen cards kept alive for quick scroll-back
+
+    def __init__(self, parent, make_card, fingerprint=None, empty_text="", estimate=48, **pack):
+        super().__init__(parent, bg=BG)
+        self.make_card = make_card
+        self.fingerprint = fingerprint or (lambda item: json.dumps(item, sort_keys=True, default=str))
+        self.estimate = estimate
+        self.items, self.keys, self.offsets = [], [], [0]
+        self.heights = {}      # key -> measured card height
+        self.cards = {}        # key -> [frame, fingerprint, canvas window id or None]
+        self._pending = None
+
+        self.canvas = tk.Canvas(self, bg=BG, highlightthickness=0)
+        sb = tk.Scrollbar(self, orient="vertical", command=self._yview)
+        self.canvas.configure(yscrollcommand=sb.set)
+        sb.pack(side="right", fill="y")
+        self.canvas.pack(fill="both", expand=True, **pack)
+        self.empty = tk.Label(self.canvas, text=empty_text, bg=BG, fg=TEXT_MUT,
+                              font=("Segoe UI", 8), wraplength=300, justify="left")
+        self.canvas.bind("<Configure>", self._on_resize)
+        self._width = 0
+
+    def set_items(self, items, key=lambda item: item["id"]):
+        self.items = list(items)
+        self.keys = [key(i) for i in self.items]
+        live = set(self.keys)
+        for k in [k for k in self.cards if k not in live]:
+            self.cards.pop(k)[0].destroy()
+            self.heights.pop(k, None)
+        if self.items:
+            self.empty.place_forget()
+        else:
+            self.empty.place(x=4, y=8)
+        self._layout()
+
+    def scroll(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self._schedule()
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self._schedule()
+
+    def _on_resize(self, e):
+        if e.width != self._width:
+            # Wrapping changes with width, so every measured height is stale
+            self._width = e.width
+            for frame, _, _ in self.cards.values():
+                frame.destroy()
+            self.cards.clear()
+            self.heights.clear()
+        self._schedule()
+
+    def _schedule(self):
+        if self._pending is None:
+            self._pending = self.after_idle(self._layout)
+
+    def _layout(self):
+        self._pending = None
+        for _ in range(3):          # re-run while newly measured heights shift rows
+            if not self._place_visible():
+                break
+
+    def _place_visible(self):
+        offsets = [0]
+        for k in self.keys:
+            offsets.append(offsets[-1] + self.heights.get(k, self.estimate) + self.GAP)
+        self.offsets = offsets
+        total = offsets[-1]
+        self.canvas.configure(scrollregion=(0, 0, self._width, total))
+
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(bisect.bisect_right(offsets, top - self.OVERSCAN) - 1, 0)
+        last = min(bisect.bisect_left(offsets, bottom + self.OVERSCAN), len(self.keys))
+        visible = set(self.keys[first:last])
+
+        for k, card in self.cards.items():
+            if card[2] is not None and k not in visible:
+                self.canvas.delete(card[2])
+                card[2] = None
+
+        remeasured = False
+        for i in range(first, last):
+            k, item = self.keys[i], self.items[i]
+            fp = self.fingerprint(item)
+            card = self.cards.get(k)
+            if card and card[1] != fp:
+                if card[2] is not None:
+                    self.canvas.delete(card[2])
+                card[0].destroy()
+                self.heights.pop(k, None)
+                card = None
+            if card is None:
+                card = self.cards[k] = [self.make_card(self.canvas, item), fp, None]
+            if card[2] is None:
+                card[2] = self.canvas.create_window(0, offsets[i], window=card[0], anchor="nw",
+                                                    width=self._width)
+            else:
+                self.canvas.coords(card[2], 0, offsets[i])
+            if k not in self.heights:
+                card[0].update_idletasks()
+                self.heights[k] = card[0].winfo_reqheight()
+                remeasured |= self.heights[k] != offsets[i + 1] - offsets[i] - self.GAP
+
+        hidden = [k for k, c in self.cards.items() if c[2] is None]
+        for k in hidden[:max(len(hidden) - self.CACHE, 0)]:
+            self.cards.pop(k)[0].destroy()
+        return remeasured
+
+
 # ── Main Dock Window ───────────────────────────────────────────────────────────
 
 class PipelineDock(tk.Tk):
     def __init__(self):
         super().__init__()
-        self.title("Pipeline Dock")
+        self.title(f"Pipeline Dock — {WORKSPACE}" if WORKSPACE else "Pipeline Dock")
         self.geometry("360x620+20+40")
         self.configure(bg=BG)
         self.resizable(True, True)
@@ -84,8 +293,11 @@ class PipelineDock(tk.Tk):
         self.selected_job = None   # dict
         self.jobs_cache   = []
         self.prompts_cache = []
+        self.prompts_job   = None
+        self.outbox = Outbox()
 
         self._build_ui()
+        self._update_queue_label()
         self._poll_connection()
 
     # ── Drag support (since we removed the titlebar) ───────────────────────────
@@ -107,12 +319,15 @@ class PipelineDock(tk.Tk):
         bar.bind("<ButtonPress-1>",   self._start_drag)
         bar.bind("<B1-Motion>",       self._do_drag)
 
-        tk.Label(bar, text="🚀  Pipeline Dock", bg=BG2,
+        tk.Label(bar, text="🚀  Pipeline Dock" + (f" · {WORKSPACE}" if WORKSPACE else ""), bg=BG2,
                  fg=ACCENT, font=("Segoe UI", 9, "bold")).pack(side="left", padx=10)
 
         self.conn_dot = tk.Label(bar, text="●", bg=BG2, fg=RED, font=("Segoe UI", 9))
         self.conn_dot.pack(side="right", padx=4)
 
+        self.queue_label = tk.Label(bar, text="", bg=BG2, fg=AMBER, font=("Segoe UI", 8))
+        self.queue_label.pack(side="right", padx=4)
+
         tk.Button(bar, text="×", bg=BG2, fg=TEXT_DIM, bd=0, padx=8,
                   activebackground=BG3, activeforeground=RED,
                   font=("Segoe UI", 11), command=self.destroy).pack(side="right")
@@ -179,22 +394,15 @@ class PipelineDock(tk.Tk):
                   command=self._load_jobs).pack(side="right")
 
         # Job list
-        canvas = tk.Canvas(f, bg=BG, highlightthickness=0)
-        sb = tk.Scrollbar(f, orient="vertical", command=canvas.yview)
-        canvas.configure(yscrollcommand=sb.set)
-        sb.pack(side="right", fill="y")
-        canvas.pack(fill="both", expand=True, padx=(8,0), pady=(0,8))
-
-        self.jobs_frame = tk.Frame(canvas, bg=BG)
-        self.jobs_win = canvas.create_window((0,0), window=self.jobs_frame, anchor="nw")
-        self.jobs_frame.bind("<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.bind("<Configure>",
-            lambda e: canvas.itemconfig(self.jobs_win, width=e.width))
-        canvas.bind_all("<MouseWheel>",
-            lambda e: canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
-
-        self.jobs_canvas = canvas
+        self.jobs_list = VirtualList(
+            f, self._job_card, empty_text="No outstanding jobs.", estimate=44,
+            fingerprint=lambda j: (json.dumps(j, sort_keys=True, default=str),
+                                   bool(self.selected_job and self.selected_job["id"] == j["id"])),
+            padx=(8,0), pady=(0,8))
+        self.jobs_list.pack(fill="both", expand=True)
+        self.jobs_list.canvas.bind_all("<MouseWheel>",
+            lambda e: self.jobs_list.scroll(int(-1*(e.delta/120))))
+
         self.jobs_status = tk.Label(f, text="Not connected", bg=BG, fg=TEXT_MUT,
                                     font=("Segoe UI", 8))
         self.jobs_status.pack(pady=2)
@@ -211,7 +419,9 @@ class PipelineDock(tk.Tk):
                     break
             url = "/api/dock/jobs" + (f"?project_id={pid}" if pid else "")
             jobs = api_get(url) or []
-            self.jobs_cache = jobs if isinstance(jobs, list) else []
+            # Jobs with a queued submission are already complete as far as the artist is concerned
+            submitted = {q["job_id"] for q in self.outbox.pending("submit")}
+            self.jobs_cache = [j for j in jobs if str(j["id"]) not in submitted] if isinstance(jobs, list) else []
 
             self.after(0, lambda: self._render_jobs(self.jobs_cache))
             if isinstance(projects, list):
@@ -221,18 +431,7 @@ class PipelineDock(tk.Tk):
         threading.Thread(target=fetch, daemon=True).start()
 
     def _render_jobs(self, jobs):
-        for w in self.jobs_frame.winfo_children():
-            w.destroy()
-
-        if not jobs:
-            tk.Label(self.jobs_frame, text="No outstanding jobs.",
-                     bg=BG, fg=TEXT_MUT, font=("Segoe UI", 8)).pack(pady=8)
-            self.jobs_status.config(text=f"{len(jobs)} jobs")
-            return
-
-        for job in jobs:
-            self._job_card(self.jobs_frame, job)
-
+        self.jobs_list.set_items(jobs)
         self.jobs_status.config(text=f"{len(jobs)} jobs")
 
     def _job_card(self, parent, job):
@@ -240,7 +439,6 @@ class PipelineDock(tk.Tk):
         border_col = ACCENT if is_sel else BORDER
 
         outer = tk.Frame(parent, bg=border_col, padx=1, pady=1)
-        outer.pack(fill="x", pady=2)
 
         inner = tk.Frame(outer, bg=BG2, cursor="hand2")
         inner.pack(fill="x")
@@ -273,6 +471,7 @@ class PipelineDock(tk.Tk):
             w.bind("<Button-1>", lambda e, fn=select: fn())
         for child in info.winfo_children():
             child.bind("<Button-1>", lambda e, fn=select: fn())
+        return outer
 
     # ── Prompts Tab ────────────────────────────────────────────────────────────
 
@@ -284,44 +483,30 @@ class PipelineDock(tk.Tk):
                                       bg=BG, fg=TEXT_DIM, font=("Segoe UI", 8))
         self.prompts_label.pack(pady=(6,4), padx=8, anchor="w")
 
-        canvas = tk.Canvas(f, bg=BG, highlightthickness=0)
-        sb = tk.Scrollbar(f, orient="vertical", command=canvas.yview)
-        canvas.configure(yscrollcommand=sb.set)
-        sb.pack(side="right", fill="y")
-        canvas.pack(fill="both", expand=True, padx=(8,0))
-
-        self.prompts_frame = tk.Frame(canvas, bg=BG)
-        win = canvas.create_window((0,0), window=self.prompts_frame, anchor="nw")
-        self.prompts_frame.bind("<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
-        canvas.bind("<Configure>",
-            lambda e: canvas.itemconfig(win, width=e.width))
+        self.prompts_list = VirtualList(f, self._prompt_card, empty_text="No prompts linked to this job.",
+                                        estimate=70, padx=(8,0))
+        self.prompts_list.pack(fill="both", expand=True)
 
     def _load_prompts(self, job_id):
         def fetch():
-            prompts = api_get(f"/api/dock/job-prompts/{job_id}") or []
+            prompts = api_get(f"/api/dock/job-prompts/{job_id}")
+            if prompts is None and self.prompts_job == job_id:
+                return   # offline: keep showing what we have
+            self.prompts_job = job_id
             self.prompts_cache = prompts if isinstance(prompts, list) else []
+            queued = {q["prompt_id"]: q["status"] for q in self.outbox.pending("prompt_status")}
+            for p in self.prompts_cache:
+                p["status"] = queued.get(p["id"], p["status"])
             self.after(0, self._render_prompts)
 
         threading.Thread(target=fetch, daemon=True).start()
 
     def _render_prompts(self):
-        for w in self.prompts_frame.winfo_children():
-            w.destroy()
-
         job_name = ""
         if self.selected_job:
             job_name = (self.selected_job.get("character_name") or "") + " #" + str(self.selected_job["id"])
         self.prompts_label.config(text=f"Prompts: {job_name}" if job_name else "Select a job")
-
-        if not self.prompts_cache:
-            tk.Label(self.prompts_frame, text="No prompts linked to this job.",
-                     bg=BG, fg=TEXT_MUT, font=("Segoe UI", 8),
-                     wraplength=300, justify="left").pack(pady=8, padx=4)
-            return
-
-        for p in self.prompts_cache:
-            self._prompt_card(self.prompts_frame, p)
+        self.prompts_list.set_items(self.prompts_cache)
 
     def _prompt_card(self, parent, prompt):
         status = prompt.get("status", "pending")
@@ -331,7 +516,6 @@ class PipelineDock(tk.Tk):
                         "done": TEXT_MUT, "flagged": "#fca5a5"}
 
         outer = tk.Frame(parent, bg=bar_colours.get(status, BG3), padx=2, pady=0)
-        outer.pack(fill="x", pady=2)
 
         inner = tk.Frame(outer, bg=BG2)
         inner.pack(fill="x")
@@ -389,11 +573,20 @@ class PipelineDock(tk.Tk):
         make_btn(btn_row, "✓",      "Mark done",          GREEN,  do_done)
         make_btn(btn_row, "↺",      "Reset",              TEXT_DIM, do_reset)
         make_btn(btn_row, "!",      "Flag for revision",  RED,    do_flag)
+        return outer
 
     def _set_prompt_status(self, pid, status):
+        self.outbox.add("prompt_status", prompt_id=pid, status=status)
+        for p in self.prompts_cache:
+            if p["id"] == pid:
+                p["status"] = status
+        self._render_prompts()
+        self._update_queue_label()
+
         def do():
-            api_post(f"/api/prompts/status/{pid}", json_data={"status": status})
-            if self.selected_job:
+            sent = self.outbox.flush()
+            self.after(0, self._update_queue_label)
+            if sent and self.selected_job:
                 self.after(100, lambda: self._load_prompts(self.selected_job["id"]))
         threading.Thread(target=do, daemon=True).start()
 
@@ -487,20 +680,22 @@ class PipelineDock(tk.Tk):
         if not self.selected_job or not self.selected_file:
             return
         self.submit_btn.config(text="Submitting…", state="disabled", bg=BG3)
+        key = self.outbox.add("submit", job_id=str(self.selected_job["id"]), file_path=self.selected_file)
 
         def do():
-            result = api_post("/api/dock/submit-media", {
-                "job_id": str(self.selected_job["id"]),
-                "file_path": self.selected_file
-            })
+            result = self.outbox.flush().get(key, {"queued": True})
             self.after(0, lambda: self._on_submit_done(result))
 
         threading.Thread(target=do, daemon=True).start()
 
     def _on_submit_done(self, result):
-        if result and result.get("ok"):
-            title = result.get("title", "")
-            self._toast(f"Submitted: {title or 'done'}")
+        self._update_queue_label()
+        if result.get("ok") or result.get("queued"):
+            if result.get("queued"):
+                self._toast(f"Server busy ({result['error']}) — queued, will retry" if result.get("error")
+                            else "Server offline — queued, will send on reconnect")
+            else:
+                self._toast(f"Submitted: {result.get('title') or 'done'}")
             self.selected_job = None
             self.selected_file = ""
             self.drop_label.config(text="Click to browse for a file\n(video or image)",
@@ -511,7 +706,7 @@ class PipelineDock(tk.Tk):
             self._update_submit_label()
             self._load_jobs()
         else:
-            self._toast("Error — is the server running?")
+            self._toast(f"Error — {result.get('error', 'submit failed')}")
             self.submit_btn.config(text="Submit & Mark Job Complete",
                                    state="normal", bg=ACCENT, fg=TEXT)
 
@@ -587,11 +782,28 @@ class PipelineDock(tk.Tk):
             colour = GREEN if connected else RED
             status  = "●  Connected" if connected else "●  Server offline"
             self.after(0, lambda: self.conn_dot.config(fg=colour, text=status))
-            if connected and not self.jobs_cache:
+            if connected and self.outbox.count():
+                results = self.outbox.flush()
+                failed = [r for r in results.values() if not r.get("ok") and not r.get("queued")]
+                retrying = [r for r in results.values() if not r.get("ok") and r.get("queued")]
+                self.after(0, self._update_queue_label)
+                if results:
+                    msg = f"Sent {len(results) - len(failed) - len(retrying)} queued change(s)"
+                    if retrying:
+                        msg += f", {len(retrying)} to retry"
+                    if failed:
+                        msg += f", {len(failed)} rejected"
+                    self.after(0, lambda: self._toast(msg))
+                    self.after(0, self._load_jobs)
+            elif connected and not self.jobs_cache:
                 self.after(0, self._load_jobs)
         threading.Thread(target=check, daemon=True).start()
         self.after(8000, self._poll_connection)
 
+    def _update_queue_label(self):
+        n = self.outbox.count()
+        self.queue_label.config(text=f"⟳ {n} queued" if n else "")
+
     # ── Toast notification ─────────────────────────────────────────────────────
 
     def _toast(self, message):
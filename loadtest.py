@@ -0,0 +1,126 @@
+"""
+Pipeline Manager — Load Test
+Run with:  python loadtest.py                       (starts serve.py with 1, 2, 4 workers)
+Or:        python loadtest.py --workers 1,4 --threads 8 --clients 32 --seconds 10
+Or:        python loadtest.py --url http://localhost:5000   (hit an already-running server)
+
+Hammers a mix of read pages/APIs and dock-style writes from concurrent clients
+and prints requests/sec for each server configuration. Uses a throwaway copy
+of the database so your real pipeline.db is never written to.
+"""
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+READ_PATHS = ['/', '/jobs', '/media', '/api/dock/jobs', '/api/dock/config', '/prompt-library']
+
+
+def copy_database(src, dst):
+    """Snapshot src through SQLite's backup API, so writes still in a running server's WAL are included."""
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+def hit(base, path, data=None):
+    body = urllib.parse.urlencode(data).encode() if data is not None else None
+    with urllib.request.urlopen(urllib.request.Request(base + path, data=body), timeout=30) as r:
+        r.read()
+        return r.status
+
+
+def run_load(base, clients, seconds, write_ratio):
+    counts, errors = [0] * clients, [0] * clients
+    deadline = time.perf_counter() + seconds
+
+    def client(n):
+        i = n
+        while time.perf_counter() < deadline:
+            i += 1
+            try:
+                if write_ratio and i % int(1 / write_ratio) == 0:
+                    hit(base, '/api/dock/submit-media', {'file_path': f'loadtest/{n}_{i}.mp4'})
+                else:
+                    hit(base, READ_PATHS[i % len(READ_PATHS)])
+                counts[n] += 1
+            except (urllib.error.URLError, OSError):
+                errors[n] += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, sum(counts), sum(errors)
+
+
+def wait_for(base, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            hit(base, '/api/dock/config')
+            return True
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.3)
+    return False
+
+
+def main():
+    p = argparse.ArgumentParser(description='Measure Pipeline Manager requests/sec.')
+    p.add_argument('--url', help='test an already-running server instead of starting serve.py')
+    p.add_argument('--workers', default='1,2,4', help='comma-separated worker counts to compare')
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('--clients', type=int, default=32)
+    p.add_argument('--seconds', type=float, default=10)
+    p.add_argument('--write-ratio', type=float, default=0.05,
+                   help='fraction of requests that submit media (0 for read-only)')
+    p.add_argument('--port', type=int, default=5055)
+    args = p.parse_args()
+
+    print(f"\n  {args.clients} clients, {args.seconds:g}s per run, {args.write_ratio:.0%} writes\n")
+    if args.url:
+        rps, ok, err = run_load(args.url.rstrip('/'), args.clients, args.seconds, args.write_ratio)
+        print(f"  {args.url}: {rps:8.1f} req/s  ({ok} ok, {err} errors)")
+        return
+
+    print(f"  {'workers':>7}  {'threads':>7}  {'req/s':>8}  {'ok':>7}  {'errors':>6}")
+    for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(HERE, 'pipeline.db')
+            if os.path.exists(src):
+                copy_database(src, os.path.join(tmp, 'pipeline.db'))
+            env = dict(os.environ, PYTHONPATH=HERE)
+            proc = subprocess.Popen([sys.executable, os.path.join(HERE, 'serve.py'),
+                                     '--port', str(args.port), '--workers', str(workers),
+                                     '--threads', str(args.threads)],
+                                    cwd=tmp, env=env, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+            base = f'http://127.0.0.1:{args.port}'
+            try:
+                if not wait_for(base):
+                    print(f"  {workers:>7}  server did not start")
+                    continue
+                rps, ok, err = run_load(base, args.clients, args.seconds, args.write_ratio)
+                print(f"  {workers:>7}  {args.threads:>7}  {rps:8.1f}  {ok:>7}  {err:>6}")
+            finally:
+                proc.terminate()
+                proc.wait(timeout=15)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,446 @@
+"""
+Pipeline Manager — Command Line
+Run with:  python -m pipeline stats
+Or:        python -m pipeline jobs create < jobs.csv
+           python -m pipeline jobs list --status rendered --format ndjson
+           python -m pipeline jobs status 12 13 14 --to rendered
+           python -m pipeline media ingest < renders.ndjson
+           python -m pipeline export render_jobs --format csv > jobs.csv
+           python -m pipeline backup
+           python -m pipeline analytics
+           python -m pipeline stats --workspace acme
+           python -m pipeline workspaces
+
+Works on pipeline.db directly through database.py, without the server or
+app.py. Nothing heavier than argparse is imported until a command runs and
+migrations only run when the file is behind SCHEMA_VERSION, so a call from a
+render-farm hook starts in a few tens of milliseconds.
+
+Rows are read from stdin as CSV with a header row, or as NDJSON when the
+first line is a JSON object, and written to stdout as CSV or NDJSON
+(--format). Writes commit every --batch rows, so a long import holds SQLite's
+write lock in short bursts and a running server keeps serving; what has been
+printed is committed. Rows that can't be applied are reported on stderr with
+their line number and skipped, and the exit status is then 1.
+"""
+
+import argparse
+import os
+import sys
+
+JOB_STATUSES = ('planned', 'in_progress', 'rendered', 'complete')
+MEDIA_STATUSES = ('unreviewed', 'approved', 'rejected')
+MEDIA_FIELDS = ('job_id', 'character_id', 'output_type_id', 'file_path', 'title', 'description', 'tags',
+                'seo_title', 'seo_description', 'quality_status', 'notes', 'prompt')
+
+_errors = 0
+
+
+def warn(line, message):
+    global _errors
+    _errors += 1
+    print(f'line {line}: {message}' if line else message, file=sys.stderr)
+
+
+def use_paths(args):
+    """Point database.py at --db and --workspace; returns the module."""
+    import database
+    if args.db:
+        here = os.path.dirname(os.path.abspath(args.db))
+        database.DATABASE = args.db
+        database.ARCHIVE_DATABASE = os.path.join(here, 'pipeline_archive.db')
+        database.BACKUP_DIR = os.path.join(here, 'backups')
+        database.ANALYTICS_DATABASE = os.path.join(here, 'pipeline_analytics.db')
+        database.WORKSPACE_DIR = os.path.join(here, 'workspaces')
+    if args.workspace:
+        ws = database.get_workspace(args.workspace)
+        if ws is None:
+            sys.exit(f'no workspace {args.workspace!r}; run `python -m pipeline migrate --workspace {args.workspace}` '
+                     'to create it')
+        database.set_workspace(ws)
+    return database
+
+
+def open_db(args):
+    """Point database.py at --db and --workspace, bring the schema up to date if needed, and connect."""
+    database = use_paths(args)
+    version = database.schema_version()
+    if version is None:
+        sys.exit(f'{database.current_workspace().database} not found; run `python -m pipeline migrate` to create it')
+    if version < database.SCHEMA_VERSION:
+        database.run_migrations()
+    return database, database.get_db()
+
+
+# ─── Row streams ──────────────────────────────────────────────────────────────
+
+def read_rows(stream):
+    """Yield (line, row dict) from CSV with a header row, or NDJSON if the first line is an object."""
+    first, skipped = stream.readline(), 0
+    while first and not first.strip():
+        first, skipped = stream.readline(), skipped + 1
+    if not first:
+        return
+    if first.lstrip().startswith('{'):
+        import json
+        for n, line in enumerate(_chain(first, stream), skipped + 1):
+            if not line.strip():
+                continue
+            try:
+                yield n, json.loads(line)
+            except ValueError as e:
+                warn(n, f'bad JSON ({e})')
+    else:
+        import csv
+        reader = csv.DictReader(_chain(first, stream))
+        for row in reader:
+            yield reader.line_num + skipped, {k: v for k, v in row.items() if k is not None}
+
+
+def _chain(first, stream):
+    yield first
+    yield from stream
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RowWriter:
+    """Writes dicts to stdout as CSV (header from the first row) or NDJSON."""
+
+    def __init__(self, fmt, fields=None):
+        self.fmt, self.fields, self._csv = fmt, fields, None
+        if fmt == 'ndjson':
+            import json
+            self._dumps = lambda row: json.dumps(row, ensure_ascii=False, default=str)
+
+    def write(self, row):
+        if self.fmt == 'ndjson':
+            sys.stdout.write(self._dumps(row) + '\n')
+            return
+        if self._csv is None:
+            import csv
+            self._csv = csv.DictWriter(sys.stdout, self.fields or list(row), extrasaction='ignore', lineterminator='\n')
+            self._csv.writeheader()
+        self._csv.writerow(row)
+
+    def flush(self):
+        sys.stdout.flush()
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ─── Jobs ─────────────────────────────────────────────────────────────────────
+
+class _Lookup:
+    """Resolves a row value to an id by id, then code, then case-insensitive name."""
+
+    def __init__(self, db, table, code=False):
+        self.ids, self.keys = set(), {}
+        for r in db.execute(f"SELECT id, name{', code' if code else ''} FROM {table} ORDER BY id DESC"):
+            self.ids.add(r['id'])
+            self.keys[(r['name'] or '').strip().lower()] = r['id']
+            if code and r['code']:
+                self.keys[r['code'].strip().lower()] = r['id']
+
+    def __call__(self, value):
+        if isinstance(value, int) or str(value).strip().isdigit():
+            return int(value) if int(value) in self.ids else None
+        return self.keys.get(str(value).strip().lower())
+
+
+def _split_list(value):
+    """Ingredients come as a JSON list or a ';'-separated string."""
+    if isinstance(value, list):
+        return value
+    return [v for v in str(value or '').split(';') if v.strip()]
+
+
+def jobs_create(args):
+    database, db = open_db(args)
+    characters, output_types = _Lookup(db, 'characters'), _Lookup(db, 'output_types')
+    ingredients = _Lookup(db, 'ingredients', code=True)
+    out = RowWriter(args.format, ['id', 'character_id', 'output_type_id', 'status', 'ingredient_ids'])
+    for batch in batched(read_rows(sys.stdin), args.batch):
+        created = []
+        for line, row in batch:
+            char, ot = row.get('character_id', row.get('character')), row.get('output_type_id', row.get('output_type'))
+            char_id = None if _blank(char) else characters(char)
+            ot_id = None if _blank(ot) else output_types(ot)
+            if not _blank(char) and char_id is None:
+                warn(line, f'unknown character {char!r}'); continue
+            if not _blank(ot) and ot_id is None:
+                warn(line, f'unknown output type {ot!r}'); continue
+            ing_values = _split_list(row.get('ingredient_ids', row.get('ingredients')))
+            ing_ids = [ingredients(v) for v in ing_values]
+            if None in ing_ids:
+                warn(line, f'unknown ingredient {ing_values[ing_ids.index(None)]!r}'); continue
+            status = row.get('status') or args.status
+            if status not in JOB_STATUSES:
+                warn(line, f'unknown status {status!r}'); continue
+            job_id = db.execute('INSERT INTO render_jobs (character_id, output_type_id, status, notes) VALUES (?,?,?,?)',
+                                [char_id, ot_id, status, row.get('notes') or '']).lastrowid
+            database.record_job_status(db, job_id, status, 'cli', created=True)
+            db.executemany('INSERT INTO render_job_ingredients (job_id, ingredient_id) VALUES (?,?)',
+                           [(job_id, i) for i in ing_ids])
+            created.append({'id': job_id, 'character_id': char_id, 'output_type_id': ot_id, 'status': status,
+                            'ingredient_ids': ';'.join(map(str, ing_ids))})
+        db.commit()
+        for row in created:
+            out.write(row)
+        out.flush()
+    db.close()
+
+
+def jobs_list(args):
+    database, db = open_db(args)
+    query = '''SELECT rj.id, rj.status, rj.character_id, c.name AS character_name, rj.output_type_id,
+        ot.name AS output_type_name, (SELECT GROUP_CONCAT(ingredient_id, ';') FROM render_job_ingredients
+            WHERE job_id=rj.id) AS ingredient_ids, rj.notes, rj.created_at
+        FROM render_jobs rj LEFT JOIN characters c ON rj.character_id=c.id
+        LEFT JOIN output_types ot ON rj.output_type_id=ot.id WHERE rj.id > ?'''
+    params = [args.since_id]
+    if args.status:
+        query += f" AND rj.status IN ({','.join('?' * len(args.status))})"; params += args.status
+    query += ' ORDER BY rj.id'
+    if args.limit:
+        query += ' LIMIT ?'; params.append(args.limit)
+    out = RowWriter(args.format)
+    for r in db.execute(query, params):
+        out.write(dict(r))
+    out.flush()
+    db.close()
+
+
+def jobs_status(args):
+    if args.ids and not args.to:
+        sys.exit('--to is required when job ids are given as arguments')
+    database, db = open_db(args)
+    rows = ((None, {'id': i}) for i in args.ids) if args.ids else read_rows(sys.stdin)
+    out = RowWriter(args.format, ['id', 'from_status', 'to_status'])
+    for batch in batched(rows, args.batch):
+        changed = []
+        for line, row in batch:
+            job_id, status = _int(row.get('id', row.get('job_id'))), args.to or row.get('status')
+            if status not in JOB_STATUSES:
+                warn(line, f'unknown status {status!r}'); continue
+            current = db.execute('SELECT status FROM render_jobs WHERE id=?', [job_id]).fetchone()
+            if current is None:
+                warn(line, f'no job {row.get("id", row.get("job_id"))!r}'); continue
+            database.record_job_status(db, job_id, status, 'cli')
+            db.execute('UPDATE render_jobs SET status=? WHERE id=?', [status, job_id])
+            changed.append({'id': job_id, 'from_status': current['status'], 'to_status': status})
+        db.commit()
+        for row in changed:
+            out.write(row)
+        out.flush()
+    db.close()
+
+
+# ─── Media ────────────────────────────────────────────────────────────────────
+
+def media_ingest(args):
+    """Import media rows; blank title, tags, character and output type are filled from the job."""
+    import sqlite3
+    database, db = open_db(args)
+    out = RowWriter(args.format, ['id', 'job_id', 'file_path', 'title'])
+    for batch in batched(read_rows(sys.stdin), args.batch):
+        job_ids = list({_int(row.get('job_id')) for _, row in batch} - {None})
+        jobs = database.batch_jobs(db, job_ids) if job_ids else {}
+        added = []
+        for line, row in batch:
+            values = {f: row.get(f) for f in MEDIA_FIELDS}
+            if _blank(values['file_path']):
+                warn(line, 'no file_path'); continue
+            if not _blank(values['job_id']):
+                job = jobs.get(_int(values['job_id']))
+                if job is None:
+                    warn(line, f'no job {values["job_id"]!r}'); continue
+                values['job_id'] = job['id']
+                for field, source in (('title', 'auto_title'), ('tags', 'auto_tags'),
+                                      ('character_id', 'character_id'), ('output_type_id', 'output_type_id')):
+                    if _blank(values[field]) and job[source]:
+                        values[field] = job[source]
+            values['quality_status'] = values['quality_status'] or args.quality_status
+            if values['quality_status'] not in MEDIA_STATUSES:
+                warn(line, f'unknown quality_status {values["quality_status"]!r}'); continue
+            values = {k: (None if k.endswith('_id') and _blank(v) else '' if v is None else v)
+                      for k, v in values.items()}
+            try:
+                media_id = db.execute(f"INSERT INTO media_assets ({', '.join(values)}) VALUES ({', '.join('?' * len(values))})",
+                                      list(values.values())).lastrowid
+            except sqlite3.IntegrityError as e:
+                warn(line, str(e)); continue
+            added.append({'id': media_id, **values})
+        db.commit()
+        for row in added:
+            out.write(row)
+        out.flush()
+    db.close()
+
+
+# ─── Export, backup, stats ────────────────────────────────────────────────────
+
+def export(args):
+    database, db = open_db(args)
+    if not args.table:
+        import json
+        json.dump(database.export_database(db), sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write('\n')
+    elif args.table not in database.export_tables(db):
+        sys.exit(f'no exportable table {args.table!r}')
+    else:
+        out = RowWriter(args.format)
+        for r in db.execute(f'SELECT * FROM {args.table}'):
+            out.write(dict(r))
+        out.flush()
+    db.close()
+
+
+def backup(args):
+    database, db = open_db(args)
+    db.close()
+    for path in database.backup_database(label=args.label, compress=not args.no_compress):
+        print(path)
+
+
+def stats(args):
+    database, db = open_db(args)
+    out = RowWriter(args.format, ['group', 'key', 'count'])
+    for group, table, col in (('jobs', 'render_jobs', 'status'), ('media', 'media_assets', 'quality_status'),
+                              ('prompts', 'prompts', 'status')):
+        for key, count in db.execute(f'SELECT {col}, COUNT(*) FROM {table} GROUP BY {col} ORDER BY {col}'):
+            out.write({'group': group, 'key': key, 'count': count})
+    for table in database.export_tables(db):
+        out.write({'group': 'tables', 'key': table, 'count': db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]})
+    out.flush()
+    db.close()
+
+
+def analytics(args):
+    database, db = open_db(args)
+    db.close()
+    if not database.refresh_analytics(force=args.force):
+        print('analytics snapshot is up to date')
+        return
+    adb = database.analytics_db()
+    refreshed = adb.execute("SELECT value FROM analytics_meta WHERE key='refreshed_at'").fetchone()[0]
+    adb.close()
+    print(f'analytics snapshot refreshed at {refreshed}')
+
+
+def migrate(args):
+    """Create or upgrade the database; --workspace creates that workspace if it doesn't exist yet."""
+    workspace, args.workspace = args.workspace, None
+    database = use_paths(args)
+    if workspace:
+        ws = database.get_workspace(workspace)
+        if ws is None:
+            try:
+                ws = database.create_workspace(workspace)
+            except ValueError as e:
+                sys.exit(str(e))
+        database.set_workspace(ws)
+    database.run_migrations()
+    print(f'{database.current_workspace().database}: schema version {database.schema_version()}')
+
+
+def workspaces(args):
+    """One row per workspace, read from all of them in parallel."""
+    database = use_paths(args)
+    out = RowWriter(args.format, ['name', 'jobs', *JOB_STATUSES, 'media', 'projects', 'pending_prompts', 'bytes',
+                                  'last_activity', 'error'])
+    for w in database.workspace_summaries():
+        jobs = w.pop('jobs', {})
+        out.write(dict(w, jobs=sum(jobs.values()), **{s: jobs.get(s, 0) for s in JOB_STATUSES}))
+    out.flush()
+
+
+# ─── Arguments ────────────────────────────────────────────────────────────────
+
+def parse_args(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--db', help='database file (default: pipeline.db in the current directory)')
+    common.add_argument('--workspace', help="workspace to work in (default: the default workspace, --db's file)")
+    rows_out = argparse.ArgumentParser(add_help=False)
+    rows_out.add_argument('--format', choices=('csv', 'ndjson'), default='csv', help='output format')
+    batch = argparse.ArgumentParser(add_help=False)
+    batch.add_argument('--batch', type=int, default=500, help='rows per transaction')
+
+    p = argparse.ArgumentParser(prog='python -m pipeline', description='Pipeline Manager command line.')
+    sub = p.add_subparsers(dest='command', required=True)
+
+    jobs = sub.add_parser('jobs', help='create, list and move render jobs').add_subparsers(dest='action', required=True)
+    s = jobs.add_parser('create', parents=[common, rows_out, batch],
+                        help='create jobs from stdin rows: character, output_type, ingredients, status, notes')
+    s.add_argument('--status', default='planned', choices=JOB_STATUSES, help='status for rows without one')
+    s.set_defaults(func=jobs_create)
+    s = jobs.add_parser('list', parents=[common, rows_out], help='write jobs to stdout')
+    s.add_argument('--status', action='append', choices=JOB_STATUSES, help='only this status (repeatable)')
+    s.add_argument('--since-id', type=int, default=0, help='only jobs with a higher id')
+    s.add_argument('--limit', type=int)
+    s.set_defaults(func=jobs_list)
+    s = jobs.add_parser('status', parents=[common, rows_out, batch],
+                        help='set job status, for the ids given or stdin rows of id, status')
+    s.add_argument('ids', nargs='*', type=int)
+    s.add_argument('--to', choices=JOB_STATUSES, help='new status (overrides the status column)')
+    s.set_defaults(func=jobs_status)
+
+    media = sub.add_parser('media', help='import media').add_subparsers(dest='action', required=True)
+    s = media.add_parser('ingest', parents=[common, rows_out, batch],
+                         help=f'import media from stdin rows: {", ".join(MEDIA_FIELDS)}')
+    s.add_argument('--quality-status', default='unreviewed', choices=MEDIA_STATUSES,
+                   help='quality status for rows without one')
+    s.set_defaults(func=media_ingest)
+
+    s = sub.add_parser('export', parents=[common, rows_out],
+                       help='full JSON export (as /export), or one table as CSV/NDJSON')
+    s.add_argument('table', nargs='?')
+    s.set_defaults(func=export)
+    s = sub.add_parser('backup', parents=[common], help='integrity-checked snapshot into backups/')
+    s.add_argument('--label', default='cli')
+    s.add_argument('--no-compress', action='store_true')
+    s.set_defaults(func=backup)
+    s = sub.add_parser('stats', parents=[common, rows_out], help='counts by status and rows per table')
+    s.set_defaults(func=stats)
+    s = sub.add_parser('analytics', parents=[common], help='refresh the analytics snapshot if anything changed')
+    s.add_argument('--force', action='store_true', help='refresh even if nothing changed')
+    s.set_defaults(func=analytics)
+    s = sub.add_parser('migrate', parents=[common], help='create or upgrade the database')
+    s.set_defaults(func=migrate)
+    s = sub.add_parser('workspaces', parents=[common, rows_out], help='headline counts for every workspace')
+    s.set_defaults(func=workspaces)
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.stdin.reconfigure(encoding='utf-8-sig', newline='')
+    sys.stdout.reconfigure(encoding='utf-8')
+    try:
+        args.func(args)
+    except BrokenPipeError:
+        # Reader went away (e.g. `| head`); point stdout at devnull so the exit flush doesn't raise again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    return 1 if _errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
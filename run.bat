@@ -26,7 +26,7 @@ echo  Close it or press Ctrl+C to stop.
 echo  ============================================
 echo.
 
-python app.py
+python serve.py
 
 echo.
 echo  Server stopped.
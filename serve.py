@@ -0,0 +1,129 @@
+"""
+Pipeline Manager — Production Server
+Run with:  python serve.py                  (8 threads, port 5000)
+Or:        python serve.py --threads 16 --workers 4
+
+Serves app.py through waitress instead of Flask's development server.
+Each worker process runs its own thread pool on a shared listening socket.
+SQLite is opened in WAL mode, so readers in every thread and process run
+concurrently while writes queue on the database lock (see DB_TIMEOUT in
+database.py).
+"""
+
+import _thread
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='Serve Pipeline Manager with waitress.')
+    p.add_argument('--host', default=os.environ.get('PIPELINE_HOST', '127.0.0.1'))
+    p.add_argument('--port', type=int, default=int(os.environ.get('PIPELINE_PORT', 5000)))
+    p.add_argument('--threads', type=int, default=int(os.environ.get('PIPELINE_THREADS', 8)),
+                   help='request threads per worker process')
+    p.add_argument('--workers', type=int, default=int(os.environ.get('PIPELINE_WORKERS', 1)),
+                   help='worker processes sharing the listening socket')
+    p.add_argument('--connection-limit', type=int, default=100,
+                   help='open connections per worker before new ones wait in the backlog')
+    p.add_argument('--backlog', type=int, default=64,
+                   help='listen backlog; connections beyond this are refused by the OS')
+    return p.parse_args(argv)
+
+
+def _serve(sock, args):
+    """Run one waitress server on an already-bound socket until interrupted."""
+    from waitress import create_server
+    from app import app
+
+    # waitress stops its loop and drains in-flight requests on SystemExit/KeyboardInterrupt
+    def stop(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, stop)
+
+    server = create_server(app, sockets=[sock], threads=args.threads,
+                           connection_limit=args.connection_limit, backlog=args.backlog,
+                           channel_timeout=30, ident='PipelineManager')
+    server.run()
+
+
+def _worker(sock, args, stop_event):
+    # The parent sets stop_event on shutdown; interrupting the main thread makes
+    # waitress drain in-flight requests the same way Ctrl+C does, on every OS.
+    def watch():
+        stop_event.wait()
+        _thread.interrupt_main()
+    threading.Thread(target=watch, daemon=True).start()
+    try:
+        _serve(sock, args)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        import waitress  # noqa: F401
+    except ImportError:
+        sys.exit('waitress is not installed. Run setup.bat (or: python -m pip install waitress).')
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(args.backlog)
+    sock.setblocking(False)
+
+    print("\n  Pipeline Manager is running (production server).")
+    print(f"  {args.workers} worker(s) x {args.threads} threads")
+    print(f"  Open your browser and go to:  http://localhost:{args.port}\n")
+
+    if args.workers <= 1:
+        from database import start_backup_scheduler, start_analytics_scheduler
+        start_backup_scheduler()
+        start_analytics_scheduler()
+        try:
+            _serve(sock, args)
+        finally:
+            sock.close()
+        return
+
+    # Migrate once in the parent before any worker starts. Forked workers
+    # inherit the imported app; spawned ones (Windows) import it again, but
+    # find the schema current, so their migrations change nothing instead of
+    # racing each other on ALTER TABLE.
+    import app  # noqa: F401
+    from database import start_backup_scheduler, start_analytics_scheduler
+
+    stop_event = multiprocessing.Event()
+    procs = [multiprocessing.Process(target=_worker, args=(sock, args, stop_event), daemon=True)
+             for _ in range(args.workers)]
+    for p in procs:
+        p.start()
+    # Parent only, so workers don't each take a snapshot; started after the
+    # workers exist so none is forked holding a scheduler's lock or connection.
+    start_backup_scheduler()
+    start_analytics_scheduler()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        print("\n  Shutting down workers...")
+        stop_event.set()
+        for p in procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+    finally:
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
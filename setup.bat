@@ -16,7 +16,7 @@ if errorlevel 1 (
 
 echo Python found. Installing dependencies...
 python -m pip install --upgrade pip
-python -m pip install flask
+python -m pip install -r requirements.txt
 
 echo.
 echo ============================================
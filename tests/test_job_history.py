@@ -0,0 +1,48 @@
+"""Job status history stays under the output type a job has after an edit."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)   # the databases are relative to the working directory
+    import app
+    import database
+    database.run_migrations()
+    db = database.get_db()
+    db.executemany('INSERT INTO output_types (id, name) VALUES (?,?)', [(1, 'Short'), (2, 'Long')])
+    db.commit()
+    db.close()
+    return app.app.test_client()
+
+
+def counts_by_type(db, table):
+    return dict(db.execute(f'SELECT output_type_id, SUM(count) FROM {table} WHERE project_id=0 GROUP BY output_type_id'))
+
+
+def test_edit_changing_status_and_output_type(client):
+    import database
+    client.post('/jobs/add', data={'output_type_id': '1', 'status': 'planned'})
+    client.post('/jobs/edit/1', data={'output_type_id': '2', 'status': 'rendered'})
+    db = database.get_db()
+    assert [r[0] for r in db.execute('SELECT output_type_id FROM job_status_events WHERE job_id=1')] == [2, 2]
+    # Each transition is counted once per granularity under "all" and under its type
+    assert counts_by_type(db, 'job_timeline_buckets') == {0: 4, 1: 0, 2: 4}
+    assert counts_by_type(db, 'job_stage_histogram') == {0: 1, 2: 1}
+    db.close()
+
+
+def test_edit_changing_only_output_type_moves_history(client):
+    import database
+    client.post('/jobs/add', data={'output_type_id': '1', 'status': 'planned'})
+    client.post('/jobs/edit/1', data={'output_type_id': '1', 'status': 'rendered'})
+    client.post('/jobs/edit/1', data={'output_type_id': '2', 'status': 'rendered'})
+    db = database.get_db()
+    assert counts_by_type(db, 'job_timeline_buckets') == {0: 4, 1: 0, 2: 4}
+    assert counts_by_type(db, 'job_stage_histogram') == {0: 1, 1: 0, 2: 1}
+    assert db.execute('SELECT output_type_id FROM job_stage_durations WHERE job_id=1').fetchone()[0] == 2
+    db.close()
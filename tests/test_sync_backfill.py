@@ -0,0 +1,39 @@
+"""Rows that existed before change tracking get a real updated_at and sync_uid."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)   # the databases are relative to the working directory
+    import database
+    database.run_migrations()
+    conn = database.get_db()
+    yield conn
+    conn.close()
+
+
+def test_tables_without_created_at_are_stamped(db):
+    rows = db.execute('SELECT slot, updated_at, sync_uid FROM dock_config ORDER BY slot').fetchall()
+    assert rows
+    for slot, updated_at, sync_uid in rows:
+        assert updated_at
+        assert sync_uid.endswith(f':{slot}')
+
+
+def test_rows_left_empty_by_an_earlier_upgrade_are_repaired(db):
+    import database
+    db.execute("INSERT INTO sync_state (key, value) VALUES ('origin', '-')")
+    db.execute("UPDATE dock_config SET updated_at='', sync_uid='dock_config:' || id || ':'")
+    db.execute("DELETE FROM sync_state WHERE key='origin'")
+    db.commit()
+    seq = db.execute('SELECT MAX(seq) FROM sync_changes').fetchone()[0]
+    database.migrate_db_v16()
+    assert not db.execute("SELECT 1 FROM dock_config WHERE updated_at='' OR sync_uid LIKE '%:'").fetchone()
+    # Logged again, so peers pull the repaired rows
+    assert db.execute("SELECT COUNT(*) FROM sync_changes WHERE table_name='dock_config' AND seq > ?",
+                      [seq]).fetchone()[0] == db.execute('SELECT COUNT(*) FROM dock_config').fetchone()[0]